@@ -0,0 +1 @@
+"""Offline benchmark suites for the Chatwoot bot (run with ``python -m benchmarks.<name>``)."""
@@ -0,0 +1,117 @@
+"""Shared helpers for the benchmark suites: percentiles, result storage and comparison."""
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already collected sample"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(seconds: Iterable[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max in milliseconds"""
+    values = [s * 1000 for s in seconds]
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(max(values), 3),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def save_result(suite: str, data: dict, results_dir: str = RESULTS_DIR) -> str:
+    """Write a run to results/<suite>-<timestamp>.json and return the path"""
+    os.makedirs(results_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(results_dir, f"{suite}-{stamp}.json")
+    record = {
+        "suite": suite,
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "results": data,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def latest_result(suite: str, results_dir: str = RESULTS_DIR, exclude: Optional[str] = None) -> Optional[str]:
+    """Path of the most recent stored run of a suite, if any"""
+    if not os.path.isdir(results_dir):
+        return None
+    names = sorted(
+        name for name in os.listdir(results_dir)
+        if name.startswith(f"{suite}-") and name.endswith(".json")
+    )
+    paths = [os.path.join(results_dir, name) for name in names]
+    if exclude:
+        paths = [p for p in paths if os.path.abspath(p) != os.path.abspath(exclude)]
+    return paths[-1] if paths else None
+
+
+def _flatten(data, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(_flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(data, list):
+        for i, value in enumerate(data):
+            flat.update(_flatten(value, f"{prefix}[{i}]"))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix] = float(data)
+    return flat
+
+
+def compare_results(current: dict, baseline_path: str) -> str:
+    """Render a metric-by-metric diff of two runs of the same suite"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    old, new = _flatten(baseline), _flatten(current)
+    lines = [f"Compared with {os.path.basename(baseline_path)}:"]
+    for key in sorted(new):
+        if key not in old:
+            continue
+        before, after = old[key], new[key]
+        change = ((after - before) / before * 100) if before else 0.0
+        lines.append(f"  {key:<60} {before:>12.3f} -> {after:>12.3f} ({change:+.1f}%)")
+    return "\n".join(lines)
+
+
+class Stopwatch:
+    """Wall and CPU time of a block"""
+
+    def __enter__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall_start
+        self.cpu = time.process_time() - self.cpu_start
+        return False
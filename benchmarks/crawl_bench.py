@@ -0,0 +1,182 @@
+"""Crawler and search micro-benchmarks over the local synthetic docs site.
+
+Examples::
+
+    python -m benchmarks.crawl_bench --pages 2000 --max-crawl-pages 1000
+    python -m benchmarks.crawl_bench --pages 5000 --max-crawl-pages 3000 --save --compare
+
+Reports crawl pages/sec, CPU and bytes transferred per page for ``crawl_and_scrape``, parse vs extraction cost and
+peak allocation for ``extract_content``, ``scrape_single`` latency, and ``search_in_crawled_data``
+latency as the corpus grows.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import Stopwatch, compare_results, latency_summary, latest_result, save_result
+from benchmarks.fixture_site import FixtureSite
+
+QUERIES = [
+    "сервер",
+    "kubernetes cluster",
+    "ssh түлхүүр нэмэх",
+    "backup",
+    "load balancer тохиргоо",
+    "firewall дүрэм",
+    "төлбөр үнэ",
+    "api token",
+    "байхгүй үг xyzzy",
+]
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_crawl(main, site: FixtureSite) -> tuple:
+    rss_before = _max_rss_mb()
+    job = main.CrawlJob("export", site.root_url, trigger="bench")
+    with Stopwatch() as sw:
+        pages = main.crawl_and_scrape(site.root_url, job)
+    count = len(pages)
+    return pages, {
+        "pages": count,
+        "wall_s": round(sw.wall, 3),
+        "pages_per_sec": round(count / sw.wall, 2) if sw.wall else 0.0,
+        "cpu_ms_per_page": round(sw.cpu / count * 1000, 3) if count else 0.0,
+        "max_rss_mb": round(_max_rss_mb(), 1),
+        "max_rss_growth_mb": round(_max_rss_mb() - rss_before, 1),
+        "kb_transferred_per_page": round(job.bytes_transferred / count / 1024, 2) if count else 0.0,
+        "kb_decoded_per_page": round(job.bytes_decoded / count / 1024, 2) if count else 0.0,
+    }
+
+
+def bench_extract(main, site: FixtureSite, sample: int) -> dict:
+    import requests
+    from bs4 import BeautifulSoup
+
+    urls = [site.page_url(i) for i in range(min(sample, site.pages))]
+    documents = [(url, requests.get(url, timeout=10).text) for url in urls]
+
+    parse_times, extract_times = [], []
+    for url, html in documents:
+        started = time.perf_counter()
+        soup = BeautifulSoup(html, "html.parser")
+        parsed = time.perf_counter()
+        main.extract_content(soup, url)
+        parse_times.append(parsed - started)
+        extract_times.append(time.perf_counter() - parsed)
+
+    tracemalloc.start()
+    for url, html in documents[:50]:
+        main.extract_content(BeautifulSoup(html, "html.parser"), url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    html_bytes = sum(len(html.encode("utf-8")) for _, html in documents)
+    return {
+        "documents": len(documents),
+        "avg_html_kb": round(html_bytes / len(documents) / 1024, 2) if documents else 0.0,
+        "parse": latency_summary(parse_times),
+        "extract_content": latency_summary(extract_times),
+        # Pages are processed one at a time, so the peak reflects a single parsed document
+        "peak_alloc_kb_single_page": round(peak / 1024, 1),
+    }
+
+
+def bench_scrape_single(main, site: FixtureSite, sample: int) -> dict:
+    times, cpu = [], 0.0
+    for i in range(min(sample, site.pages)):
+        with Stopwatch() as sw:
+            main.scrape_single(site.page_url(i))
+        times.append(sw.wall)
+        cpu += sw.cpu
+    return {
+        "latency": latency_summary(times),
+        "cpu_ms_per_page": round(cpu / len(times) * 1000, 3) if times else 0.0,
+    }
+
+
+def bench_search(main, pages: list, sizes: list, repeats: int) -> list:
+    results = []
+    for size in sizes:
+        # Cycle the crawled pages to reach corpus sizes beyond what was fetched
+        corpus = [dict(pages[i % len(pages)], url=f"{pages[i % len(pages)]['url']}?copy={i}") for i in range(size)]
+        main.swap_corpus(main.CorpusStore(corpus))
+        times, hits = [], 0
+        for _ in range(repeats):
+            for query in QUERIES:
+                started = time.perf_counter()
+                found = main.search_in_crawled_data(query, max_results=3)
+                times.append(time.perf_counter() - started)
+                hits += len(found)
+        results.append({
+            "corpus_pages": size,
+            "query": latency_summary(times),
+            "results_returned": hits,
+            "corpus_memory": main.get_corpus().memory_report(),
+        })
+    return results
+
+
+def run(args) -> dict:
+    with FixtureSite(args.pages, links_per_page=args.links_per_page, paragraphs=args.paragraphs) as site:
+        os.environ.update({
+            "ROOT_URL": site.root_url,
+            "MAX_CRAWL_PAGES": str(args.max_crawl_pages),
+            "DELAY_SEC": "0",
+            "AUTO_CRAWL_ON_START": "false",
+            "CORPUS_SNAPSHOT_PATH": "",
+            "CRAWL_JOB_DB": "",
+        })
+        import main
+
+        pages, crawl = bench_crawl(main, site)
+        result = {
+            "config": {
+                "site_pages": args.pages,
+                "max_crawl_pages": args.max_crawl_pages,
+                "links_per_page": args.links_per_page,
+                "paragraphs": args.paragraphs,
+            },
+            "crawl_and_scrape": crawl,
+            "extract_content": bench_extract(main, site, args.sample),
+            "scrape_single": bench_scrape_single(main, site, args.sample),
+        }
+    if pages:
+        sizes = sorted({int(s) for s in args.search_sizes.split(",")} | {len(pages)})
+        result["search_in_crawled_data"] = bench_search(main, pages, sizes, args.repeats)
+    return result
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000, help="pages in the synthetic site")
+    parser.add_argument("--max-crawl-pages", type=int, default=500, help="MAX_CRAWL_PAGES for the crawl")
+    parser.add_argument("--links-per-page", type=int, default=8)
+    parser.add_argument("--paragraphs", type=int, default=12, help="paragraphs per page (controls page size)")
+    parser.add_argument("--sample", type=int, default=200, help="pages used for extract/scrape timings")
+    parser.add_argument("--search-sizes", default="100,500,1000,2000,5000", help="corpus sizes for search timings")
+    parser.add_argument("--repeats", type=int, default=5, help="passes over the query set per corpus size")
+    parser.add_argument("--save", action="store_true", help="store the run under benchmarks/results/")
+    parser.add_argument("--compare", action="store_true", help="diff against the latest stored run")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    saved = save_result("crawl_bench", result) if args.save else None
+    if args.compare:
+        baseline = latest_result("crawl_bench", exclude=saved)
+        print(compare_results(result, baseline) if baseline else "No stored run to compare with.")
+    if saved:
+        print(f"Saved to {saved}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,176 @@
+"""Deterministic synthetic docs site served from localhost for crawl benchmarks.
+
+Pages look like docs.cloud.mn: a ``<main>`` with headings, paragraphs, lists, code blocks and
+images, plus navigation links to a parent, children, a few random cross-links and print/tracking
+variants of the page itself (all declaring one ``rel=canonical``). The site also serves
+``robots.txt`` and a ``sitemap.xml`` whose priority falls with tree depth, and gzips pages when the
+client accepts it. The server runs in a separate process so crawler CPU measurements are not
+polluted by serving work.
+"""
+import gzip
+import multiprocessing
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "сервер виртуал машин storage kubernetes cluster dns домэйн ssh түлхүүр backup нөөц "
+    "load balancer firewall дүрэм төлбөр үнэ тохиргоо заавар сүлжээ ip хаяг image snapshot "
+    "volume диск cpu ram monitoring api token бүртгэл нэвтрэх хэрэглэгч эрх"
+).split()
+
+
+def render_page(page: int, total: int, links_per_page: int = 8, paragraphs: int = 12, seed: int = 1) -> str:
+    rng = random.Random(seed * 1_000_003 + page)
+
+    def sentence(n: int) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+    children = [c for c in (page * 3 + 1, page * 3 + 2, page * 3 + 3) if c < total]
+    cross = [rng.randrange(total) for _ in range(max(0, links_per_page - len(children) - 1))]
+    links = ([(page - 1) // 3] if page else []) + children + cross
+    nav = "".join(f'<li><a href="/docs/page-{n}/">Page {n}</a></li>' for n in links)
+    # Variants real docs sites link to: a print view and a tracking-tagged self link
+    nav += f'<li><a href="/docs/page-{page}/?print=1">Print</a></li>'
+    nav += f'<li><a href="/docs/page-{page}/index.html?utm_source=nav">Share</a></li>'
+
+    parts = [f"<h1>{sentence(4)}</h1>"]
+    for i in range(paragraphs):
+        if i % 4 == 0:
+            parts.append(f"<h2>{sentence(3)}</h2>")
+        parts.append(f"<p>{sentence(rng.randint(15, 40))}</p>")
+        if i % 5 == 2:
+            parts.append("<ul>" + "".join(f"<li>{sentence(6)}</li>" for _ in range(4)) + "</ul>")
+        if i % 6 == 3:
+            parts.append(f"<pre><code>curl -X GET https://api.cloud.mn/v1/{rng.choice(WORDS)}</code></pre>")
+        if i % 7 == 1:
+            parts.append(f'<img src="/img/{page}-{i}.png" alt="{sentence(3)}">')
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+        f"<title>Docs page {page} | Cloud.mn</title>"
+        f"<link rel='canonical' href='/docs/page-{page}/'></head><body>"
+        f"<header><nav><ul>{nav}</ul></nav></header>"
+        f"<main>{''.join(parts)}</main>"
+        "<footer><p>© Cloud.mn</p></footer></body></html>"
+    )
+
+
+def page_depth(page: int) -> int:
+    depth = 0
+    while page:
+        page = (page - 1) // 3
+        depth += 1
+    return depth
+
+
+def render_sitemap(pages: int, base: str) -> str:
+    entries = []
+    for page in range(pages):
+        depth = page_depth(page)
+        entries.append(
+            f"<url><loc>{base}/docs/page-{page}/</loc>"
+            f"<lastmod>2024-{(page % 12) + 1:02d}-01</lastmod>"
+            f"<priority>{max(0.1, 1.0 - depth * 0.2):.1f}</priority></url>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">' + "".join(entries) + "</urlset>"
+    )
+
+
+def _serve(port_queue, pages: int, links_per_page: int, paragraphs: int, seed: int, sitemap: bool):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without this a keep-alive client stalls on
+        # delayed ACKs for every page
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):  # noqa: A002
+            pass
+
+        def _send(self, status: int, content_type: str, text: str):
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split("?")[0].split("#")[0]
+            base = f"http://{self.headers.get('Host')}"
+            if path.endswith("/index.html"):
+                path = path[:-len("index.html")]
+            if path == "/robots.txt":
+                return self._send(200, "text/plain", f"User-agent: *\nAllow: /\nSitemap: {base}/sitemap.xml\n")
+            if path == "/sitemap.xml":
+                if not sitemap:
+                    return self._send(404, "text/plain", "not found")
+                return self._send(200, "application/xml", render_sitemap(pages, base))
+            if path in ("/", "/docs/", "/docs"):
+                page = 0
+            elif path.startswith("/docs/page-"):
+                try:
+                    page = int(path[len("/docs/page-"):].strip("/"))
+                except ValueError:
+                    page = -1
+            else:
+                page = -1
+            if not 0 <= page < pages:
+                body = b"not found"
+                self.send_response(404)
+                self.send_header("Content-Type", "text/plain")
+            else:
+                body = render_page(page, pages, links_per_page, paragraphs, seed).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                # Compress like a real docs host when the crawler asks for it
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, 6)
+                    self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class FixtureSite:
+    """Context manager that serves the synthetic site from a child process"""
+
+    def __init__(self, pages: int, links_per_page: int = 8, paragraphs: int = 12, seed: int = 1,
+                 sitemap: bool = True):
+        self.pages = pages
+        self.sitemap = sitemap
+        self.links_per_page = links_per_page
+        self.paragraphs = paragraphs
+        self.seed = seed
+        self.process = None
+        self.port = None
+
+    @property
+    def root_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/docs/"
+
+    def page_url(self, page: int) -> str:
+        return f"http://127.0.0.1:{self.port}/docs/page-{page}/"
+
+    def __enter__(self):
+        ctx = multiprocessing.get_context("spawn")
+        port_queue = ctx.Queue()
+        self.process = ctx.Process(
+            target=_serve,
+            args=(port_queue, self.pages, self.links_per_page, self.paragraphs, self.seed, self.sitemap),
+            daemon=True,
+        )
+        self.process.start()
+        self.port = port_queue.get(timeout=30)
+        return self
+
+    def __exit__(self, *exc):
+        if self.process:
+            self.process.terminate()
+            self.process.join(timeout=5)
+        return False
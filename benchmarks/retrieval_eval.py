@@ -0,0 +1,156 @@
+"""Offline retrieval quality and latency evaluation against a golden question set.
+
+Examples::
+
+    python -m benchmarks.retrieval_eval
+    python -m benchmarks.retrieval_eval --golden benchmarks/golden/v1 --save --compare
+    python -m benchmarks.retrieval_eval --corpus /tmp/chatwoot-bot-corpus.bin --show-misses
+
+A golden set is a directory with ``questions.jsonl`` (``id``, ``question``, ``lang`` of ``mn`` or
+``translit``, and the ``expected`` page URLs) and a frozen ``corpus.jsonl`` of crawled pages. A
+published corpus snapshot file can stand in for the frozen corpus with ``--corpus``. For every
+question the suite runs ``search_in_crawled_data`` and reports recall@k, MRR, query latency and
+the size of the context ``get_ai_response`` would put into the prompt, overall and per language.
+Golden sets are versioned by directory: edits to the questions or corpus go into a new ``vN`` so
+stored results of the old set stay comparable.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from benchmarks.common import compare_results, latency_summary, latest_result, save_result
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "v1")
+CONTEXT_RESULTS = 3  # get_ai_response puts the top 3 results into the prompt
+
+
+def load_jsonl(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def token_counter():
+    """Counts tokens with tiktoken when installed, otherwise estimates ~4 UTF-8 bytes per token"""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return "tiktoken:cl100k_base", lambda text: len(encoding.encode(text))
+    except ImportError:
+        return "estimate:utf8_bytes/4", lambda text: (len(text.encode("utf-8")) + 3) // 4
+
+
+def load_corpus(main, path: str):
+    with open(path, "rb") as f:
+        magic = f.read(len(main.SNAPSHOT_MAGIC))
+    if magic == main.SNAPSHOT_MAGIC:
+        return main.MappedCorpus(path)
+    return main.CorpusStore(load_jsonl(path))
+
+
+def evaluate(main, questions: list, ks: list, repeats: int, count_tokens) -> list:
+    depth = max(ks + [CONTEXT_RESULTS])
+    rows = []
+    for question in questions:
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            results = main.search_in_crawled_data(question["question"], max_results=depth)
+            times.append(time.perf_counter() - started)
+        urls = [main.url_key(r["url"]) for r in results]
+        expected = {main.url_key(url) for url in question["expected"]}
+        rank = next((i + 1 for i, url in enumerate(urls) if url in expected), None)
+        context = main.build_context(results[:CONTEXT_RESULTS])
+        rows.append({
+            "id": question["id"],
+            "lang": question.get("lang", "mn"),
+            "question": question["question"],
+            "rank": rank,
+            "recall": {k: len(expected & set(urls[:k])) / len(expected) for k in ks},
+            "context_tokens": count_tokens(context) if context else 0,
+            "times": times,
+            "top": urls[:3],
+        })
+    return rows
+
+
+def summarize(rows: list, ks: list) -> dict:
+    count = len(rows)
+    if not count:
+        return {"questions": 0}
+    return {
+        "questions": count,
+        **{f"recall@{k}": round(sum(r["recall"][k] for r in rows) / count, 4) for k in ks},
+        "mrr": round(sum(1 / r["rank"] for r in rows if r["rank"]) / count, 4),
+        "no_hit": sum(1 for r in rows if not r["rank"]),
+        "latency": latency_summary(t for r in rows for t in r["times"]),
+        "context_tokens": {
+            "mean": round(sum(r["context_tokens"] for r in rows) / count, 1),
+            "max": max(r["context_tokens"] for r in rows),
+        },
+    }
+
+
+def run(args) -> dict:
+    golden = args.golden
+    corpus_path = args.corpus or os.path.join(golden, "corpus.jsonl")
+    os.environ.update({
+        "AUTO_CRAWL_ON_START": "false",
+        "CORPUS_SNAPSHOT_PATH": "",
+        "FAQ_ENABLED": "false",
+    })
+    import main
+
+    corpus = load_corpus(main, corpus_path)
+    main.swap_corpus(corpus)
+    questions = load_jsonl(os.path.join(golden, "questions.jsonl"))
+    ks = sorted({int(k) for k in args.k.split(",")})
+    tokenizer, count_tokens = token_counter()
+
+    rows = evaluate(main, questions, ks, args.repeats, count_tokens)
+    result = {
+        "config": {
+            "golden": os.path.relpath(golden),
+            "corpus": os.path.relpath(corpus_path),
+            "corpus_pages": len(corpus),
+            "k": ks,
+            "repeats": args.repeats,
+            "tokenizer": tokenizer,
+        },
+        "overall": summarize(rows, ks),
+        "by_lang": {lang: summarize([r for r in rows if r["lang"] == lang], ks)
+                    for lang in sorted({r["lang"] for r in rows})},
+    }
+    if args.show_misses:
+        result["misses"] = [
+            {"id": r["id"], "question": r["question"], "rank": r["rank"], "top": r["top"]}
+            for r in rows if r["rank"] != 1
+        ]
+    return result
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--golden", default=GOLDEN_DIR, help="golden set directory (questions.jsonl, corpus.jsonl)")
+    parser.add_argument("--corpus", help="corpus JSONL or published snapshot file instead of the frozen corpus")
+    parser.add_argument("--k", default="1,3,5,10", help="cut-offs for recall@k")
+    parser.add_argument("--repeats", type=int, default=20, help="timed runs per question")
+    parser.add_argument("--show-misses", action="store_true", help="list questions whose first hit is not rank 1")
+    parser.add_argument("--save", action="store_true", help="store the run under benchmarks/results/")
+    parser.add_argument("--compare", action="store_true", help="diff against the latest stored run")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    saved = save_result("retrieval_eval", result) if args.save else None
+    if args.compare:
+        baseline = latest_result("retrieval_eval", exclude=saved)
+        print(compare_results(result, baseline) if baseline else "No stored run to compare with.")
+    if saved:
+        print(f"Saved to {saved}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
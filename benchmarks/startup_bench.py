@@ -0,0 +1,159 @@
+"""Cold-start benchmark: import cost of ``main`` and time until a fresh process serves a request.
+
+Examples::
+
+    python -m benchmarks.startup_bench --runs 5
+    python -m benchmarks.startup_bench --runs 10 --save --compare
+
+Each run starts a new interpreter that imports ``main``, runs ``main.startup()`` and serves the app
+on an ephemeral port. Reported per run: interpreter-to-import-done time, import wall time and RSS
+growth, which heavy packages were already loaded by the import, and the time from spawning the
+process to the first successful ``/livez`` and ``/api/search`` responses.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+from benchmarks.common import compare_results, latency_summary, latest_result, save_result
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("openai", "bs4", "smtplib", "email.mime", "lxml")
+
+CHILD = r"""
+import json, os, sys, time
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+rss_before = rss_kb()
+started = time.perf_counter()
+import main
+import_s = time.perf_counter() - started
+rss_after = rss_kb()
+loaded = {name: name in sys.modules for name in HEAVY}
+main.startup()
+main.swap_corpus(main.CorpusStore([{"url": "https://docs.cloud.mn/", "title": "Cloud.mn", "body": "server guide"}]))
+
+from werkzeug.serving import make_server
+server = make_server("127.0.0.1", 0, main.app, threaded=True)
+print(json.dumps({
+    "port": server.server_port,
+    "import_s": import_s,
+    "import_rss_kb": rss_after - rss_before,
+    "rss_after_import_kb": rss_after,
+    "loaded": loaded,
+}), flush=True)
+server.serve_forever()
+"""
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "stub"),
+        "AUTO_CRAWL_ON_START": "false",
+        "DEPENDENCY_CHECK_INTERVAL_SEC": "0",
+        "CORPUS_SNAPSHOT_PATH": "",
+    })
+    return env
+
+
+def wait_for(url: str, deadline: float, payload: dict = None) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            if payload is None:
+                response = requests.get(url, timeout=1)
+            else:
+                response = requests.post(url, json=payload, timeout=1)
+            if response.status_code == 200:
+                return time.perf_counter()
+        except requests.RequestException:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(url)
+
+
+def one_run(timeout: float) -> dict:
+    code = f"HEAVY = {HEAVY_MODULES!r}\n" + CHILD
+    spawned = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=REPO_ROOT, env=child_env(),
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        info = json.loads(process.stdout.readline())
+        ready = time.perf_counter()
+        base = f"http://127.0.0.1:{info['port']}"
+        first_livez = wait_for(f"{base}/livez", spawned + timeout)
+        first_search = wait_for(f"{base}/api/search", spawned + timeout, {"query": "server"})
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {
+        "spawn_to_ready_s": ready - spawned,
+        "import_s": info["import_s"],
+        "import_rss_kb": info["import_rss_kb"],
+        "rss_after_import_kb": info["rss_after_import_kb"],
+        "loaded": info["loaded"],
+        "time_to_first_request_s": first_livez - spawned,
+        "time_to_first_search_s": first_search - spawned,
+    }
+
+
+def baseline_interpreter(runs: int) -> list:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def run(args) -> dict:
+    runs = [one_run(args.timeout) for _ in range(args.runs)]
+    rss = sorted(r["import_rss_kb"] for r in runs)
+    return {
+        "config": {"runs": args.runs, "python": sys.version.split()[0]},
+        "bare_interpreter": latency_summary(baseline_interpreter(args.runs)),
+        "import_main": latency_summary(r["import_s"] for r in runs),
+        "time_to_first_request": latency_summary(r["time_to_first_request_s"] for r in runs),
+        "time_to_first_search": latency_summary(r["time_to_first_search_s"] for r in runs),
+        "import_rss_mb": round(rss[len(rss) // 2] / 1024, 1),
+        "rss_after_import_mb": round(runs[-1]["rss_after_import_kb"] / 1024, 1),
+        "heavy_modules_loaded_at_import": [name for name, loaded in runs[-1]["loaded"].items() if loaded],
+    }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to start")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for a process to serve")
+    parser.add_argument("--save", action="store_true", help="store the run under benchmarks/results/")
+    parser.add_argument("--compare", action="store_true", help="diff against the latest stored run")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    saved = save_result("startup_bench", result) if args.save else None
+    if args.compare:
+        baseline = latest_result("startup_bench", exclude=saved)
+        print(compare_results(result, baseline) if baseline else "No stored run to compare with.")
+    if saved:
+        print(f"Saved to {saved}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,266 @@
+"""Local stand-ins for OpenAI, Chatwoot, Microsoft Graph, Teams and SMTP with configurable latency.
+
+Point the bot at them through its normal environment variables (see ``StubServices.environ``)
+so benchmarks exercise the real request code without touching the network.
+"""
+import json
+import os
+import random
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+
+class Latency:
+    """Mean latency plus uniform jitter, in milliseconds"""
+
+    def __init__(self, mean_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+
+    def sleep(self):
+        delay = self.mean_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+
+def _faq_reply(messages: list) -> str:
+    # FAQ builds get two questions built from the page title so lookups against them can hit
+    page = messages[-1]["content"] if messages else ""
+    title = page.split("\n", 1)[0].replace("Хуудас:", "").strip()
+    return json.dumps({"faqs": [{
+        "questions": [f"{title} гэж юу вэ?", f"{title} yu ve"],
+        "answer": f"{title}: stub FAQ хариулт.",
+    }]}, ensure_ascii=False)
+
+
+def _chat_completion(body: dict) -> dict:
+    messages = body.get("messages") or []
+    # The escalation check asks for a YES/NO verdict with a tiny token budget
+    verdict = body.get("max_tokens", 0) <= 10
+    if messages and '"faqs"' in messages[0].get("content", ""):
+        content = _faq_reply(messages)
+    else:
+        content = "NO" if verdict else "Сайн байна уу! Энэ бол stub хариулт. https://docs.cloud.mn/"
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 800, "completion_tokens": 40, "total_tokens": 840,
+                  "prompt_tokens_details": {"cached_tokens": 0}},
+    }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    services: "StubServices"
+
+    def log_message(self, format, *args):  # noqa: A002 - keep the benchmark output clean
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _reply(self, payload: dict, status: int = 200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method: str):
+        services = self.services
+        path = self.path.split("?")[0]
+        body = self._read_json() if method == "POST" else {}
+
+        if path.endswith("/chat/completions"):
+            services.hit("openai")
+            return self._reply(_chat_completion(body))
+        if path.endswith("/oauth2/v2.0/token"):
+            services.hit("graph")
+            return self._reply({"access_token": "stub-token", "expires_in": 3600, "token_type": "Bearer"})
+        if "/planner/tasks" in path:
+            services.hit("graph")
+            return self._reply({"id": f"task-{random.randint(1, 10**9)}"}, 201)
+        if path.startswith("/teams"):
+            services.hit("teams")
+            return self._reply({})
+        if path.startswith("/api/v1/accounts/"):
+            services.hit("chatwoot")
+            parts = path.strip("/").split("/")
+            if method == "GET" and len(parts) == 4:
+                return self._reply({"id": parts[3], "name": "Stub account"})
+            if method == "GET" and len(parts) == 6 and parts[4] == "conversations":
+                return self._reply({"id": int(parts[5]), "meta": {}, "assignee_id": None})
+            if method == "POST" and len(parts) == 7 and parts[6] == "messages":
+                services.record_reply(int(parts[5]))
+            return self._reply({"id": random.randint(1, 10**9)})
+        services.hit("unknown")
+        return self._reply({"error": "not stubbed"}, 404)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib's send_message without STARTTLS"""
+
+    services: "StubServices"
+
+    def _send(self, line: str):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+        self.wfile.flush()
+
+    def handle(self):
+        self._send("220 stub ESMTP")
+        in_data = False
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    in_data = False
+                    self.services.hit("smtp")
+                    self.services.latency_for("smtp").sleep()
+                    self._send("250 OK queued")
+                continue
+            verb = line.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self._send("250-stub")
+                self._send("250 AUTH PLAIN LOGIN")
+            elif verb == "HELO":
+                self._send("250 stub")
+            elif verb == "AUTH":
+                self._send("235 Authentication successful")
+            elif verb == "DATA":
+                in_data = True
+                self._send("354 End data with <CR><LF>.<CR><LF>")
+            elif verb == "QUIT":
+                self._send("221 Bye")
+                return
+            else:
+                self._send("250 OK")
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StubServices:
+    """Runs the HTTP and SMTP stubs on ephemeral localhost ports"""
+
+    def __init__(self, latencies: Dict[str, Latency]):
+        self.latencies = latencies
+        self.calls: Counter = Counter()
+        # perf_counter() of every outgoing Chatwoot message, per conversation
+        self.replies: Dict[int, list] = {}
+        self._lock = threading.Lock()
+
+        handler = type("Handler", (_StubHandler,), {"services": self})
+        self.http = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.http.daemon_threads = True
+        smtp_handler = type("SMTPHandler", (_SMTPHandler,), {"services": self})
+        self.smtp = _ThreadingTCPServer(("127.0.0.1", 0), smtp_handler)
+        self._threads = []
+        # Index, job and lock files go here so a run never reads or overwrites a local bot's state
+        self.state_dir = tempfile.mkdtemp(prefix="chatwoot-bench-")
+
+    def latency_for(self, service: str) -> Latency:
+        return self.latencies.get(service) or Latency()
+
+    def hit(self, service: str):
+        with self._lock:
+            self.calls[service] += 1
+        if service != "smtp":
+            self.latency_for(service).sleep()
+
+    def record_reply(self, conv_id: int):
+        with self._lock:
+            self.replies.setdefault(conv_id, []).append(time.perf_counter())
+
+    def first_reply_after(self, conv_id: int, since: float):
+        """perf_counter() of the first message sent to the conversation at or after since, if any"""
+        with self._lock:
+            return min((t for t in self.replies.get(conv_id, ()) if t >= since), default=None)
+
+    @property
+    def http_address(self) -> Tuple[str, int]:
+        return self.http.server_address[:2]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.http_address
+        return f"http://{host}:{port}"
+
+    def environ(self) -> Dict[str, str]:
+        """Environment that points main.py at the stubs"""
+        smtp_host, smtp_port = self.smtp.server_address[:2]
+        return {
+            "CHATWOOT_BASE_URL": self.base_url,
+            "CHATWOOT_API_KEY": "stub",
+            "ACCOUNT_ID": "1",
+            "OPENAI_API_KEY": "stub",
+            "OPENAI_BASE_URL": f"{self.base_url}/v1",
+            "TEAMS_WEBHOOK_URL": f"{self.base_url}/teams",
+            "PLANNER_LOGIN_URL": self.base_url,
+            "GRAPH_BASE_URL": f"{self.base_url}/v1.0",
+            "PLANNER_TENANT_ID": "stub-tenant",
+            "PLANNER_CLIENT_ID": "stub-client",
+            "PLANNER_CLIENT_SECRET": "stub-secret",
+            "PLANNER_PLAN_ID": "stub-plan",
+            "PLANNER_BUCKET_ID": "stub-bucket",
+            "SMTP_SERVER": str(smtp_host),
+            "SMTP_PORT": str(smtp_port),
+            "SMTP_STARTTLS": "false",
+            "SENDER_EMAIL": "bot@example.com",
+            "SENDER_PASSWORD": "stub",
+            "AUTO_CRAWL_ON_START": "false",
+            "DEPENDENCY_CHECK_INTERVAL_SEC": "0",
+            "CORPUS_SNAPSHOT_PATH": "",
+            "FAQ_INDEX_PATH": os.path.join(self.state_dir, "faq.json"),
+            "CRAWL_JOB_DB": os.path.join(self.state_dir, "crawl-jobs.db"),
+            "CRAWL_LOCK_PATH": os.path.join(self.state_dir, "crawl.lock"),
+        }
+
+    def start(self):
+        for server in (self.http, self.smtp):
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in (self.http, self.smtp):
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
@@ -0,0 +1,233 @@
+"""Replay Chatwoot webhook traffic against ``chatwoot_webhook`` with stubbed dependencies.
+
+Examples::
+
+    python -m benchmarks.webhook_load --messages 300 --rate 20
+    python -m benchmarks.webhook_load --payloads recorded.jsonl --rate 50 --latency openai=1200:300
+    python -m benchmarks.webhook_load --save --compare
+
+Recorded payloads come from running the bot with ``WEBHOOK_RECORD_PATH`` set; each line is either a
+raw webhook payload or ``{"payload": {...}}``. Without ``--payloads`` a synthetic mix of questions,
+greetings, questions split over two messages and email-verification turns is generated.
+
+Messages the coalescer parks are acknowledged at once and answered later, so their latency runs to
+the first Chatwoot reply sent to the conversation after them; the run waits for those answers.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import compare_results, latency_summary, latest_result, save_result
+from benchmarks.stubs import Latency, StubServices
+
+DEFAULT_LATENCIES = {
+    "openai": "800:200",
+    "chatwoot": "40:10",
+    "graph": "120:30",
+    "teams": "60:20",
+    "smtp": "150:50",
+}
+
+QUESTIONS = [
+    "Cloud.mn дээр виртуал сервер яаж үүсгэх вэ?",
+    "Object storage-ийн үнэ хэд вэ?",
+    "kubernetes cluster uusgeh zaavar bga yu",
+    "DNS тохиргоог хаанаас өөрчлөх вэ?",
+    "SSH түлхүүр нэмэх заавар",
+    "backup hiih bolomjtoi yu",
+    "Load balancer тохируулах",
+    "Миний сервер ачаалахгүй байна, тусламж хэрэгтэй",
+    "Төлбөрөө яаж төлөх вэ?",
+    "firewall rule nemeh",
+]
+GREETINGS = ["сайн байна уу", "snu", "hello", "баярлалаа"]
+# One question typed as quick fragments; the coalescer parks all but the last
+SPLIT_QUESTIONS = [
+    ("Сайн байна уу,", "виртуал сервер яаж үүсгэх вэ?"),
+    ("DNS тохиргоо болон", "SSH түлхүүр нэмэх заавар"),
+    ("backup hiih...", "bolomjtoi yu"),
+]
+
+
+def synthetic_payloads(count: int, conversations: int, email_ratio: float, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    payloads = []
+    message_id = 1
+    while len(payloads) < count:
+        conv_id = rng.randint(1, conversations)
+        roll = rng.random()
+        if roll < email_ratio:
+            texts = [f"user{conv_id}@example.com", "y"]
+        elif roll < email_ratio + 0.1:
+            texts = [rng.choice(GREETINGS)]
+        elif roll < email_ratio + 0.2:
+            texts = list(rng.choice(SPLIT_QUESTIONS))
+        else:
+            texts = [rng.choice(QUESTIONS)]
+        for text in texts:
+            payloads.append({
+                "id": message_id,
+                "message_type": "incoming",
+                "content": text,
+                "conversation": {"id": conv_id, "contact": {"name": f"Bench {conv_id}"}},
+            })
+            message_id += 1
+    return payloads[:count]
+
+
+def load_payloads(path: str) -> list:
+    payloads = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            payloads.append(record.get("payload", record))
+    return payloads
+
+
+def synthetic_corpus(pages: int, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    vocabulary = [
+        "сервер", "виртуал", "storage", "kubernetes", "cluster", "dns", "ssh", "түлхүүр",
+        "backup", "load", "balancer", "firewall", "төлбөр", "үнэ", "тохиргоо", "заавар",
+    ]
+    corpus = []
+    for i in range(pages):
+        words = [rng.choice(vocabulary) for _ in range(400)]
+        corpus.append({
+            "url": f"https://docs.cloud.mn/page-{i}",
+            "title": f"Docs page {i} {rng.choice(vocabulary)}",
+            "body": " ".join(words),
+            "images": [],
+        })
+    return corpus
+
+
+def parse_latencies(overrides: list) -> dict:
+    specs = dict(DEFAULT_LATENCIES)
+    for item in overrides or []:
+        service, _, spec = item.partition("=")
+        specs[service] = spec
+    latencies = {}
+    for service, spec in specs.items():
+        mean, _, jitter = spec.partition(":")
+        latencies[service] = Latency(float(mean), float(jitter or 0))
+    return latencies
+
+
+def run(args) -> dict:
+    stubs = StubServices(parse_latencies(args.latency)).start()
+    os.environ.update(stubs.environ())
+    # main reads its configuration at import time, so import only after the stubs are wired in
+    import main
+
+    main.swap_corpus(main.CorpusStore(synthetic_corpus(args.corpus_pages)))
+    payloads = load_payloads(args.payloads) if args.payloads else synthetic_payloads(
+        args.messages, args.conversations, args.email_ratio)
+
+    latencies, service_times, outcomes, errors = [], [], Counter(), Counter()
+    parked = []  # (conversation, scheduled) of messages acknowledged before they were answered
+    lock = threading.Lock()
+
+    def send(payload: dict, scheduled: float):
+        started = time.perf_counter()
+        try:
+            with main.app.test_client() as client:
+                response = client.post("/webhook/chatwoot", json=payload)
+            body = response.get_json(silent=True) or {}
+            outcome = body.get("status", "ignored") if response.status_code < 400 else f"http_{response.status_code}"
+            failed = response.status_code >= 400
+        except Exception as e:
+            outcome, failed = f"exception:{type(e).__name__}", True
+        finished = time.perf_counter()
+        with lock:
+            service_times.append(finished - started)
+            if outcome == "coalesced":
+                # Answered later from the coalescer's flush pool; timed to its Chatwoot reply below
+                parked.append((payload["conversation"]["id"], scheduled))
+            else:
+                # Measured from the scheduled send time so queueing behind a saturated pool is not hidden
+                latencies.append(finished - scheduled)
+            outcomes[outcome] += 1
+            if failed:
+                errors[outcome] += 1
+
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i, payload in enumerate(payloads):
+            scheduled = began + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, payload, scheduled)
+    # Answer every parked turn before the stubs go away
+    main.message_coalescer.stop()
+    elapsed = time.perf_counter() - began
+    unanswered = 0
+    for conv_id, scheduled in parked:
+        replied = stubs.first_reply_after(conv_id, scheduled)
+        if replied is None:
+            unanswered += 1
+        else:
+            latencies.append(replied - scheduled)
+    stubs.stop()
+
+    total = len(service_times)
+    return {
+        "config": {
+            "messages": total,
+            "target_rate": args.rate,
+            "concurrency": args.concurrency,
+            "corpus_pages": args.corpus_pages,
+            "source": args.payloads or "synthetic",
+            "latencies_ms": {k: {"mean": v.mean_ms, "jitter": v.jitter_ms} for k, v in stubs.latencies.items()},
+        },
+        "throughput_rps": round(total / elapsed, 3) if elapsed else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "latency": latency_summary(latencies),
+        "parked": {"messages": len(parked), "unanswered": unanswered},
+        "service_time": latency_summary(service_times),
+        "error_rate": round(sum(errors.values()) / total, 4) if total else 0.0,
+        "outcomes": dict(outcomes),
+        "errors": dict(errors),
+        "dependency_calls": dict(stubs.calls),
+    }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", help="JSONL file of recorded webhook payloads")
+    parser.add_argument("--messages", type=int, default=200, help="synthetic messages to send")
+    parser.add_argument("--conversations", type=int, default=50, help="synthetic conversation IDs")
+    parser.add_argument("--email-ratio", type=float, default=0.1, help="share of synthetic email-verification turns")
+    parser.add_argument("--rate", type=float, default=20.0, help="target requests per second (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=16, help="worker threads sending requests")
+    parser.add_argument("--corpus-pages", type=int, default=200, help="synthetic crawled pages to search")
+    parser.add_argument("--latency", action="append", metavar="SERVICE=MEAN_MS[:JITTER_MS]",
+                        help=f"stub latency override; services: {', '.join(DEFAULT_LATENCIES)}")
+    parser.add_argument("--save", action="store_true", help="store the run under benchmarks/results/")
+    parser.add_argument("--compare", action="store_true", help="diff against the latest stored run")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    saved = save_result("webhook_load", result) if args.save else None
+    if args.compare:
+        baseline = latest_result("webhook_load", exclude=saved)
+        print(compare_results(result, baseline) if baseline else "No stored run to compare with.")
+    if saved:
+        print(f"Saved to {saved}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
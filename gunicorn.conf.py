@@ -0,0 +1,24 @@
+"""Gunicorn settings for the Chatwoot bot.
+
+Importing main has no side effects, so the app can be preloaded once in the master and shared by
+forked workers; each worker then starts its own background threads in post_fork.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Flask is a WSGI app: threaded sync workers, not an ASGI (uvicorn) worker
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def post_fork(server, worker):
+    import main
+    main.startup()
+
+
+def worker_exit(server, worker):
+    import main
+    main.shutdown()
@@ -2,18 +2,43 @@ import os
 import time
 import logging
 import requests
-from openai import OpenAI
 import json
-from urllib.parse import urljoin, urlparse
-from flask import Flask, request, jsonify
-from bs4 import BeautifulSoup, Tag
+import atexit
+import gzip
+import hashlib
+import hmac
+import heapq
+import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+from urllib.robotparser import RobotFileParser
+from flask import Flask, Response, request, jsonify, stream_with_context
+from urllib3.util.request import ACCEPT_ENCODING
 from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import re
 import random
-from typing import Dict, Optional
+import mmap
+import sqlite3
+import struct
+import sys
+import zlib
+import tempfile
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: crawl single-flight falls back to a per-process lock
+    fcntl = None
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -28,7 +53,26 @@ ACCOUNT_ID           = os.getenv("ACCOUNT_ID")
 # CHATWOOT_BASE_URL    = os.getenv("CHATWOOT_BASE_URL", "https://app.chatwoot.com")
 CHATWOOT_BASE_URL    = os.getenv("CHATWOOT_BASE_URL", "https://chat.cloud.mn")
 OPENAI_API_KEY       = os.getenv("OPENAI_API_KEY")
+OPENAI_MODEL         = os.getenv("OPENAI_MODEL", "gpt-4")
 AUTO_CRAWL_ON_START  = os.getenv("AUTO_CRAWL_ON_START", "true").lower() == "true"
+MAX_CRAWL_DEPTH      = int(os.getenv("MAX_CRAWL_DEPTH", "0"))  # 0 = хязгааргүй
+CRAWL_USE_SITEMAP    = os.getenv("CRAWL_USE_SITEMAP", "true").lower() == "true"
+CRAWL_RESPECT_ROBOTS = os.getenv("CRAWL_RESPECT_ROBOTS", "true").lower() == "true"
+CRAWL_USER_AGENT     = os.getenv("CRAWL_USER_AGENT", "CloudMnDocsBot")
+# Хуудасны агуулгыг өөрчлөхгүй query параметрүүд; canonical URL-аас хасагдана
+CRAWL_IGNORED_QUERY_PARAMS = {
+    p.strip().lower() for p in os.getenv(
+        "CRAWL_IGNORED_QUERY_PARAMS",
+        "utm_source,utm_medium,utm_campaign,utm_term,utm_content,fbclid,gclid,ref,print,sessionid"
+    ).split(",") if p.strip()
+}
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "3"))  # SimHash битийн зөрүү, -1 = унтраах
+CRAWL_LOCK_PATH      = os.getenv("CRAWL_LOCK_PATH", os.path.join(tempfile.gettempdir(), "chatwoot-bot-crawl.lock"))
+CRAWL_JOB_HISTORY    = int(os.getenv("CRAWL_JOB_HISTORY", "10"))
+# Crawl job-ийн явц, үр дүн, цуцлах хүсэлтийг бүх worker хуваалцах SQLite; хоосон бол worker бүр өөрийн санах ойд
+CRAWL_JOB_DB         = os.getenv("CRAWL_JOB_DB", os.path.join(tempfile.gettempdir(), "chatwoot-bot-crawl-jobs.db"))
+CRAWL_JOB_SYNC_SEC   = float(os.getenv("CRAWL_JOB_SYNC_SEC", "1"))  # Ажиллаж буй job явцаа бичиж, цуцлалт шалгах давтамж
+CRAWL_MAX_PAGE_BYTES = int(os.getenv("CRAWL_MAX_PAGE_BYTES", str(5 * 1024 * 1024)))  # Задалсан HTML-ийн дээд хэмжээ, 0 = хязгааргүй
 
 # SMTP тохиргоо
 SMTP_SERVER          = os.getenv("SMTP_SERVER")
@@ -36,6 +80,7 @@ SMTP_PORT            = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USERNAME        = os.getenv("SENDER_EMAIL")
 SMTP_PASSWORD        = os.getenv("SENDER_PASSWORD")
 SMTP_FROM_EMAIL      = os.getenv("SENDER_EMAIL")
+SMTP_STARTTLS        = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
 
 # Microsoft Teams webhook
 TEAMS_WEBHOOK_URL    = os.getenv("TEAMS_WEBHOOK_URL")
@@ -46,58 +91,1194 @@ PLANNER_CLIENT_ID    = os.getenv("PLANNER_CLIENT_ID")
 PLANNER_CLIENT_SECRET = os.getenv("PLANNER_CLIENT_SECRET")
 PLANNER_PLAN_ID      = os.getenv("PLANNER_PLAN_ID")
 PLANNER_BUCKET_ID    = os.getenv("PLANNER_BUCKET_ID")
+PLANNER_LOGIN_URL    = os.getenv("PLANNER_LOGIN_URL", "https://login.microsoftonline.com")
+GRAPH_BASE_URL       = os.getenv("GRAPH_BASE_URL", "https://graph.microsoft.com/v1.0")
+PLANNER_TOKEN_REFRESH_MARGIN_SEC = float(os.getenv("PLANNER_TOKEN_REFRESH_MARGIN_SEC", "300"))  # Дуусахаас өмнө шинэчлэх
+
+# Tracing тохиргоо
+TRACE_BUFFER_SIZE    = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+TRACE_EXPORT_PATH    = os.getenv("TRACE_EXPORT_PATH")  # JSONL файл, хоосон бол зөвхөн санах ойд
+WEBHOOK_RECORD_PATH  = os.getenv("WEBHOOK_RECORD_PATH")  # Ирсэн webhook-уудыг benchmark-д зориулж JSONL-д бичих
+
+# Webhook давхардал шалгах тохиргоо
+WEBHOOK_DEDUP_WINDOW_SEC = float(os.getenv("WEBHOOK_DEDUP_WINDOW_SEC", "3600"))  # Нэг message ID-г хэр удаан санах
+WEBHOOK_DEDUP_MAX_IDS = int(os.getenv("WEBHOOK_DEDUP_MAX_IDS", "10000"))
+WEBHOOK_DEDUP_DB     = os.getenv("WEBHOOK_DEDUP_DB")  # SQLite файл; өгвөл бүх worker нэг seen-set хуваалцана
+
+# Дараалсан богино мессежүүдийг нэг асуулт болгон нэгтгэх
+MESSAGE_COALESCE_WINDOW_SEC = float(os.getenv("MESSAGE_COALESCE_WINDOW_SEC", "1.0"))  # 0 = унтраах
+MESSAGE_COALESCE_MAX_WAIT_SEC = float(os.getenv("MESSAGE_COALESCE_MAX_WAIT_SEC", "4.0"))
+MESSAGE_COALESCE_FLUSH_WORKERS = int(os.getenv("MESSAGE_COALESCE_FLUSH_WORKERS", "4"))  # Хүлээлгэсэн turn-үүдэд хариулах thread
+WEBHOOK_FANOUT_WORKERS = int(os.getenv("WEBHOOK_FANOUT_WORKERS", "8"))  # Webhook доторх зэрэгцээ үе шатуудын thread
+
+# Health/readiness тохиргоо
+DEPENDENCY_CHECK_INTERVAL_SEC = float(os.getenv("DEPENDENCY_CHECK_INTERVAL_SEC", "60"))
+READY_REQUIRES_INDEX = os.getenv("READY_REQUIRES_INDEX", "true").lower() == "true"
+READY_MAX_IN_FLIGHT  = int(os.getenv("READY_MAX_IN_FLIGHT", "50"))
+
+# Admin диагностик (profiler, санах ойн snapshot); token өгөөгүй бол endpoint-ууд идэвхгүй
+ADMIN_API_TOKEN      = os.getenv("ADMIN_API_TOKEN")
+PROFILE_MAX_SECONDS  = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+TRACEMALLOC_FRAMES   = int(os.getenv("TRACEMALLOC_FRAMES", "1"))  # Их байх тусам overhead өснө
+
+# Corpus санах ойн тохиргоо
+CORPUS_HOT_PAGES     = int(os.getenv("CORPUS_HOT_PAGES", "64"))  # Задалсан body-г cache-лэх хуудасны тоо
+# Бүх worker read-only mmap хийх корпусын файл; хоосон бол worker бүр өөрийн санах ойд хадгална
+CORPUS_SNAPSHOT_PATH = os.getenv("CORPUS_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "chatwoot-bot-corpus.bin"))
+CORPUS_REMAP_CHECK_SEC = float(os.getenv("CORPUS_REMAP_CHECK_SEC", "2"))
+CORPUS_SNAPSHOT_MAX_AGE_SEC = float(os.getenv("CORPUS_SNAPSHOT_MAX_AGE_SEC", "3600"))  # Startup үед дахин ашиглах хугацаа
+CORPUS_KEEP_GENERATIONS = int(os.getenv("CORPUS_KEEP_GENERATIONS", "2"))  # Rollback хийхэд хадгалах өмнөх хувилбарууд
+CORPUS_MIN_PAGE_RATIO = float(os.getenv("CORPUS_MIN_PAGE_RATIO", "0.5"))  # Шинэ корпус одоогийнхоос энэ хувиас цөөн бол солихгүй
+
+# LLM circuit breaker
+# gpt-4 гаргалт ойролцоогоор 20-30 token/s тул 500 token-ий хариулт ~17-25 секунд (+ эхний token ~1 секунд)
+LLM_TIMEOUT_SEC      = float(os.getenv("LLM_TIMEOUT_SEC", "45"))  # OpenAI дуудлагын дээд хугацаа (retry-гүй)
+LLM_LATENCY_SLO_SEC  = float(os.getenv("LLM_LATENCY_SLO_SEC", "25"))  # Үүнээс удаан амжилттай дуудлагыг "slow" гэж тоолно
+LLM_WEBHOOK_BUDGET_SEC = float(os.getenv("LLM_WEBHOOK_BUDGET_SEC", "60"))  # Нэг webhook-ийн бүх LLM дуудлагын нийт хугацаа
+LLM_MIN_CALL_SEC     = float(os.getenv("LLM_MIN_CALL_SEC", "1"))  # Үлдсэн хугацаа үүнээс бага бол LLM дуудахгүй
+LLM_BREAKER_WINDOW   = int(os.getenv("LLM_BREAKER_WINDOW", "20"))  # Сүүлийн хэдэн дуудлагаар үнэлэх
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_FAILURE_RATIO = float(os.getenv("LLM_BREAKER_FAILURE_RATIO", "0.5"))
+LLM_BREAKER_OPEN_SEC = float(os.getenv("LLM_BREAKER_OPEN_SEC", "30"))  # Нээлттэй байх хугацаа, дараа нь нэг туршилтын дуудлага
+LLM_FALLBACK_RESULTS = int(os.getenv("LLM_FALLBACK_RESULTS", "3"))
+
+# FAQ answer index
+FAQ_ENABLED          = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+FAQ_INDEX_PATH       = os.getenv("FAQ_INDEX_PATH", os.path.join(tempfile.gettempdir(), "chatwoot-bot-faq.json"))
+FAQ_MATCH_THRESHOLD  = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.8"))  # Trigram Dice төстэй байдал, 1.0 = яг ижил
+FAQ_MIN_QUERY_GRAMS  = int(os.getenv("FAQ_MIN_QUERY_GRAMS", "8"))  # Мэндчилгээ мэт богино мессежийг тааруулахгүй
+FAQ_QUESTIONS_PER_PAGE = int(os.getenv("FAQ_QUESTIONS_PER_PAGE", "3"))
+FAQ_PAGE_CHARS       = int(os.getenv("FAQ_PAGE_CHARS", "4000"))  # LLM-д өгөх хуудасны текстийн урт
+FAQ_BUILD_WORKERS    = int(os.getenv("FAQ_BUILD_WORKERS", "4"))
+FAQ_LLM_TIMEOUT_SEC  = float(os.getenv("FAQ_LLM_TIMEOUT_SEC", "90"))  # Background үүсгэлт тул хэрэглэгчийн SLO-гоос урт
+
+# Олон эх сурвалж (docs, status, pricing, API reference); эх сурвалж бүр өөрийн index shard-тай.
+# JSON жагсаалт, жишээ: [{"name": "status", "root_url": "https://status.cloud.mn/", "interval_sec": 300}]
+# Хоосон бол ROOT_URL/MAX_CRAWL_PAGES-аас "docs" гэсэн ганц эх сурвалж үүснэ
+CRAWL_SOURCES_JSON   = os.getenv("CRAWL_SOURCES", "")
+CRAWL_INTERVAL_SEC   = float(os.getenv("CRAWL_INTERVAL_SEC", "0"))  # "docs" эх сурвалжийн давтамж, 0 = зөвхөн startup/API
+CRAWL_SCHEDULE_CHECK_SEC = float(os.getenv("CRAWL_SCHEDULE_CHECK_SEC", "60"))
+SEARCH_FANOUT_WORKERS = int(os.getenv("SEARCH_FANOUT_WORKERS", "4"))  # Shard-уудыг зэрэг хайх thread
+
+# OpenAI client is built on first use: the openai package dominates import time
+_openai_client = None
+_openai_client_lock = threading.Lock()
+
+def get_openai_client():
+    """Shared OpenAI client, or None when no API key is configured"""
+    global _openai_client
+    if _openai_client is None and OPENAI_API_KEY:
+        with _openai_client_lock:
+            if _openai_client is None:
+                from openai import OpenAI
+                _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
+
+# —— Crawl Sources —— #
+class CrawlSource:
+    """A site the bot answers from, crawled on its own schedule into its own index shard"""
+
+    def __init__(self, name: str, root_url: str, max_pages: int = MAX_CRAWL_PAGES,
+                 max_depth: int = MAX_CRAWL_DEPTH, interval_sec: float = 0.0, max_results: int = 0):
+        if not re.fullmatch(r"[a-z0-9_-]+", name or ""):
+            raise ValueError(f"Invalid crawl source name {name!r} (use a-z, 0-9, _ and -)")
+        netloc = urlparse(root_url or "").netloc
+        if not netloc:
+            raise ValueError(f"Crawl source {name!r} needs an absolute root_url")
+        self.name = name
+        self.root_url = root_url
+        self.netloc = netloc
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.interval_sec = interval_sec  # 0 = зөвхөн startup болон API-аар
+        self.max_results = max_results  # Нэг хайлтад энэ shard-аас авах дээд тоо, 0 = хязгааргүй
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "root_url": self.root_url,
+            "max_pages": self.max_pages,
+            "max_depth": self.max_depth,
+            "interval_sec": self.interval_sec,
+            "max_results": self.max_results
+        }
+
+def load_crawl_sources(raw: str) -> Dict[str, CrawlSource]:
+    """Sources from the CRAWL_SOURCES JSON list, or the single ROOT_URL site when it is empty"""
+    if not raw.strip():
+        return {"docs": CrawlSource("docs", ROOT_URL, interval_sec=CRAWL_INTERVAL_SEC)}
+    sources: Dict[str, CrawlSource] = {}
+    for item in json.loads(raw):
+        if not isinstance(item, dict):
+            raise ValueError(f"CRAWL_SOURCES entries must be objects, got {item!r}")
+        source = CrawlSource(
+            str(item.get("name", "")),
+            str(item.get("root_url", "")),
+            max_pages=int(item.get("max_pages", MAX_CRAWL_PAGES)),
+            max_depth=int(item.get("max_depth", MAX_CRAWL_DEPTH)),
+            interval_sec=float(item.get("interval_sec", 0)),
+            max_results=int(item.get("max_results", 0))
+        )
+        if source.name in sources:
+            raise ValueError(f"Duplicate crawl source {source.name!r}")
+        sources[source.name] = source
+    if not sources:
+        raise ValueError("CRAWL_SOURCES must list at least one source")
+    return sources
+
+crawl_sources = load_crawl_sources(CRAWL_SOURCES_JSON)
+# Эхний эх сурвалж хуучин snapshot/lock файлуудаа ашиглана; source заагаагүй API дуудлага үүн рүү очно
+PRIMARY_SOURCE = next(iter(crawl_sources.values()))
+
+def source_path(path: str, source: CrawlSource) -> str:
+    """Per-source variant of a shared file path; the primary source keeps the path itself"""
+    if not path or source is PRIMARY_SOURCE:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{source.name}{ext}"
+
+# —— Corpus Store —— #
+SNIPPET_BEFORE = 100
+SNIPPET_AFTER = 200
+SNIPPET_DEFAULT = 300
+
+# Scripts the docs are written in: Basic Latin to Latin Extended-B, Greek, Cyrillic (+ Supplement)
+# and Latin Extended Additional. Capitals from other scripts fall back to storing the body whole.
+CASED_SCRIPT_RANGES = ((0x0041, 0x0250), (0x0370, 0x0400), (0x0400, 0x0530), (0x1E00, 0x1F00))
+_CASED_RUN_RE = re.compile("[" + re.escape("".join(
+    chr(c) for lo, hi in CASED_SCRIPT_RANGES for c in range(lo, hi) if chr(c).lower() != chr(c))) + "]+")
+
+def case_delta(body: str, norm: str) -> bytes:
+    """What lowercasing changed in body, so body can be rebuilt from norm (= body.lower()).
+
+    Runs of changed characters are stored as "<gap>:<original run>" lines (gap counted from the end
+    of the previous run), zlib-compressed. Text the runs cannot rebuild exactly (characters such as
+    "İ" whose lowercase is longer, or capitals outside CASED_SCRIPT_RANGES) is kept whole behind a
+    NUL marker.
+    """
+    runs, last = [], 0
+    if len(norm) == len(body):
+        for match in _CASED_RUN_RE.finditer(body):
+            runs.append(f"{match.start() - last}:{match.group()}")
+            last = match.end()
+        delta = zlib.compress("\n".join(runs).encode("utf-8"), 6) if runs else b""
+        if apply_case_delta(norm, delta) == body:
+            return delta
+    return b"\0" + zlib.compress(body.encode("utf-8"), 6)
+
+def apply_case_delta(norm: str, delta: bytes) -> str:
+    """Inverse of case_delta"""
+    if not delta:
+        return norm
+    if delta[:1] == b"\0":
+        return zlib.decompress(delta[1:]).decode("utf-8")
+    parts, position = [], 0
+    for run in zlib.decompress(delta).decode("utf-8").split("\n"):
+        gap, _, original = run.partition(":")
+        start = position + int(gap)
+        parts.append(norm[position:start])
+        parts.append(original)
+        position = start + len(original)
+    parts.append(norm[position:])
+    return "".join(parts)
+
+def apply_case_delta_window(window: str, char_start: int, delta: bytes) -> str:
+    """case_delta applied to a slice of norm starting at character char_start.
+
+    Bodies kept whole (the NUL fallback) may differ in length from norm, so their windows stay
+    lowercased.
+    """
+    if not delta or delta[:1] == b"\0":
+        return window
+    chars, end, position = None, char_start + len(window), 0
+    for run in zlib.decompress(delta).decode("utf-8").split("\n"):
+        gap, _, original = run.partition(":")
+        start = position + int(gap)
+        position = start + len(original)
+        if position <= char_start:
+            continue
+        if start >= end:
+            break
+        if chars is None:
+            chars = list(window)
+        lo, hi = max(start, char_start), min(position, end)
+        chars[lo - char_start:hi - char_start] = original[lo - start:hi - start]
+    return "".join(chars) if chars is not None else window
+
+def _char_boundary(data, index: int) -> int:
+    """First UTF-8 character start at or after index"""
+    while index < len(data) and data[index] & 0xC0 == 0x80:
+        index += 1
+    return index
+
+class CorpusPage:
+    """One crawled page kept compactly.
+
+    URL and title are interned and the image list is zlib-compressed. The body is stored once: as
+    the lowercased UTF-8 text that search scans directly, plus a small delta of the characters
+    lowercasing changed, from which the original body is rebuilt on demand.
+    """
+    __slots__ = ("url", "title", "norm_title", "norm_text", "_case_z", "_images_z")
+
+    def __init__(self, url: str, title: str, body: str, images: Optional[list] = None):
+        self.url = sys.intern(str(url))
+        self.title = sys.intern(str(title))
+        self.norm_title = title.lower().encode("utf-8")
+        norm = body.lower()
+        self.norm_text = norm.encode("utf-8")
+        self._case_z = case_delta(body, norm)
+        self._images_z = zlib.compress(json.dumps(images, ensure_ascii=False).encode("utf-8"), 6) if images else b""
+
+    def decompress_body(self) -> str:
+        return apply_case_delta(self.norm_text.decode("utf-8"), self._case_z)
+
+    def images(self) -> list:
+        return json.loads(zlib.decompress(self._images_z)) if self._images_z else []
+
+    def matches(self, needle: bytes) -> bool:
+        return needle in self.norm_title or needle in self.norm_text
+
+    def find(self, needle: bytes) -> int:
+        return self.norm_text.find(needle)
+
+    def text_window(self, start: int, end: int) -> str:
+        return self.norm_text[max(0, start):end].decode("utf-8", "ignore")
+
+    def cased_window(self, start: int, end: int) -> str:
+        """text_window with the original letter case restored"""
+        start = _char_boundary(self.norm_text, max(0, start))
+        return apply_case_delta_window(
+            self.text_window(start, end), len(self.norm_text[:start].decode("utf-8")), self._case_z)
+
+    @property
+    def text_size(self) -> int:
+        return len(self.norm_text)
+
+    def resident_bytes(self) -> int:
+        return (sys.getsizeof(self) + sys.getsizeof(self.url) + sys.getsizeof(self.title)
+                + sys.getsizeof(self.norm_title) + sys.getsizeof(self.norm_text)
+                + sys.getsizeof(self._case_z) + sys.getsizeof(self._images_z))
+
+def _dict_page_bytes(page: dict) -> int:
+    """Footprint of the plain-dict page representation, for comparison"""
+    size = sys.getsizeof(page) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in page.items())
+    for image in page.get("images") or []:
+        size += sys.getsizeof(image) + sum(sys.getsizeof(v) for v in image.values())
+    return size
+
+class _CorpusBase(ABC):
+    """Hot-page body cache and dict export shared by the in-memory and mmap-backed corpora"""
+
+    generation = 0
+
+    def __init__(self, hot_pages: int = CORPUS_HOT_PAGES):
+        self._hot: OrderedDict = OrderedDict()
+        self._hot_capacity = hot_pages
+        self._hot_lock = threading.Lock()
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of pages"""
+
+    @abstractmethod
+    def __iter__(self):
+        """Pages in crawl order"""
+
+    @abstractmethod
+    def page_at(self, index: int):
+        """Page object at index"""
+
+    def body(self, page) -> str:
+        with self._hot_lock:
+            body = self._hot.get(page.url)
+            if body is not None:
+                self._hot.move_to_end(page.url)
+                CACHE_REQUESTS.inc(cache="corpus_body", result="hit")
+                return body
+        CACHE_REQUESTS.inc(cache="corpus_body", result="miss")
+        body = page.decompress_body()
+        with self._hot_lock:
+            self._hot[page.url] = body
+            while len(self._hot) > self._hot_capacity:
+                self._hot.popitem(last=False)
+        return body
+
+    def page_dict(self, page) -> dict:
+        return {"url": page.url, "title": page.title, "body": self.body(page), "images": page.images()}
+
+    def page_dicts(self, start: int = 0, stop: Optional[int] = None) -> list:
+        return [self.page_dict(self.page_at(i)) for i in range(*slice(start, stop).indices(len(self)))]
+
+    def export_records(self, fields: tuple, start: int = 0, stop: Optional[int] = None):
+        """Lazily yield pages with only the requested fields, bypassing the hot-body cache"""
+        for i in range(*slice(start, stop).indices(len(self))):
+            page = self.page_at(i)
+            record = {}
+            for field in fields:
+                if field == "body":
+                    record["body"] = page.decompress_body()
+                elif field == "images":
+                    record["images"] = page.images()
+                else:
+                    record[field] = getattr(page, field)
+            yield record
+
+class CorpusStore(_CorpusBase):
+    """Searchable set of crawled pages with an LRU of decompressed bodies for hot pages"""
+
+    def __init__(self, pages: Optional[list] = None, hot_pages: int = CORPUS_HOT_PAGES):
+        super().__init__(hot_pages)
+        self.pages: list = []
+        self._dict_bytes = 0
+        for page in pages or []:
+            self.add(page)
+
+    def add(self, page: dict):
+        self._dict_bytes += _dict_page_bytes(page)
+        self.pages.append(CorpusPage(page["url"], page["title"], page.get("body", ""), page.get("images")))
 
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __iter__(self):
+        return iter(self.pages)
+
+    def page_at(self, index: int) -> CorpusPage:
+        return self.pages[index]
+
+    def resident_bytes(self) -> int:
+        return sys.getsizeof(self.pages) + sum(page.resident_bytes() for page in self.pages)
+
+    def memory_report(self) -> dict:
+        count = len(self.pages)
+        resident = self.resident_bytes()
+        return {
+            "pages": count,
+            "resident_bytes": resident,
+            "bytes_per_page": round(resident / count) if count else 0,
+            "dict_bytes_per_page": round(self._dict_bytes / count) if count else 0,
+            "savings_ratio": round(1 - resident / self._dict_bytes, 3) if self._dict_bytes else 0.0,
+            "generation": self.generation,
+            "hot_pages_cached": len(self._hot)
+        }
+
+# —— Shared Corpus Snapshot —— #
+# Layout: header | page fields back to back | offsets table (FIELD_COUNT + 1 uint64 per page)
+SNAPSHOT_MAGIC = b"CWCORP02"
+SNAPSHOT_HEADER = struct.Struct("<8sQQQ")  # magic, generation, page count, offsets table position
+SNAPSHOT_FIELDS = ("url", "title", "norm_title", "norm_text", "_case_z", "_images_z")
+
+class MappedCorpusPage:
+    """Read-only view of one page inside a mapped snapshot; nothing is copied until asked for"""
+    __slots__ = ("_corpus", "_offsets")
+
+    def __init__(self, corpus: "MappedCorpus", index: int):
+        self._corpus = corpus
+        base = index * (len(SNAPSHOT_FIELDS) + 1)
+        self._offsets = corpus.offsets[base:base + len(SNAPSHOT_FIELDS) + 1]
+
+    def _field(self, i: int) -> bytes:
+        return self._corpus.mm[self._offsets[i]:self._offsets[i + 1]]
+
+    @property
+    def url(self) -> str:
+        return self._field(0).decode("utf-8")
+
+    @property
+    def title(self) -> str:
+        return self._field(1).decode("utf-8")
+
+    def decompress_body(self) -> str:
+        return apply_case_delta(self._field(3).decode("utf-8"), self._field(4))
+
+    def images(self) -> list:
+        raw = self._field(5)
+        return json.loads(zlib.decompress(raw)) if raw else []
+
+    def matches(self, needle: bytes) -> bool:
+        mm, o = self._corpus.mm, self._offsets
+        return mm.find(needle, o[2], o[3]) != -1 or mm.find(needle, o[3], o[4]) != -1
+
+    def find(self, needle: bytes) -> int:
+        pos = self._corpus.mm.find(needle, self._offsets[3], self._offsets[4])
+        return pos - self._offsets[3] if pos != -1 else -1
+
+    def text_window(self, start: int, end: int) -> str:
+        text_start, text_end = self._offsets[3], self._offsets[4]
+        raw = self._corpus.mm[text_start + max(0, start):min(text_end, text_start + max(0, end))]
+        return raw.decode("utf-8", "ignore")
+
+    def cased_window(self, start: int, end: int) -> str:
+        """text_window with the original letter case restored"""
+        text_start, mm = self._offsets[3], self._corpus.mm
+        start = min(_char_boundary(mm, text_start + max(0, start)), self._offsets[4]) - text_start
+        prefix = mm[text_start:text_start + start].decode("utf-8")
+        return apply_case_delta_window(self.text_window(start, end), len(prefix), self._field(4))
+
+    @property
+    def text_size(self) -> int:
+        return self._offsets[4] - self._offsets[3]
+
+class MappedCorpus(_CorpusBase):
+    """Corpus backed by a read-only mmap of a snapshot file, shared by every worker process"""
+
+    def __init__(self, path: str, hot_pages: int = CORPUS_HOT_PAGES):
+        super().__init__(hot_pages)
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.generation, self.count, table = SNAPSHOT_HEADER.unpack_from(self.mm, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a corpus snapshot")
+        table_end = table + self.count * (len(SNAPSHOT_FIELDS) + 1) * 8
+        self.offsets = memoryview(self.mm)[table:table_end].cast("Q")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self):
+        return (MappedCorpusPage(self, i) for i in range(self.count))
+
+    def page_at(self, index: int) -> MappedCorpusPage:
+        return MappedCorpusPage(self, index)
+
+    def resident_bytes(self) -> int:
+        # Only the hot-body cache is private to this worker; the mapping itself is shared page cache
+        with self._hot_lock:
+            return sys.getsizeof(self._hot) + sum(sys.getsizeof(body) for body in self._hot.values())
+
+    def memory_report(self) -> dict:
+        return {
+            "pages": self.count,
+            "shared_mapped_bytes": self.signature[2],
+            "resident_bytes": self.resident_bytes(),
+            "bytes_per_page": round(self.resident_bytes() / self.count) if self.count else 0,
+            "generation": self.generation,
+            "snapshot_path": self.path,
+            "hot_pages_cached": len(self._hot)
+        }
+
+def write_corpus_snapshot(store: CorpusStore, path: str, generation: int) -> None:
+    """Write the store to path atomically (temp file + rename) so mapped readers never see a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    offsets = []
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(store), 0))
+        position = SNAPSHOT_HEADER.size
+        for page in store:
+            for name in SNAPSHOT_FIELDS:
+                value = getattr(page, name)
+                data = value.encode("utf-8") if isinstance(value, str) else value
+                offsets.append(position)
+                f.write(data)
+                position += len(data)
+            offsets.append(position)
+        table = position + (-position % 8)
+        f.write(b"\0" * (table - position))
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        f.seek(0)
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(store), table))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _snapshot_signature(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def publish_corpus(store, path: str = CORPUS_SNAPSHOT_PATH):
+    """Share a corpus with all workers; returns the corpus this worker should serve"""
+    if not path or not len(store):
+        return store
+    try:
+        if isinstance(store, MappedCorpus):
+            # Re-publishing an older generation (rollback): its mapping still holds the complete file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(store.mm)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        else:
+            write_corpus_snapshot(store, path, store.generation)
+        mapped = MappedCorpus(path)
+        logging.info(f"Published corpus snapshot generation {mapped.generation} ({mapped.signature[2]} bytes) to {path}")
+        return mapped
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to publish corpus snapshot, keeping private copy: {e}")
+        return store
+
+def load_recent_snapshot(max_age: float, path: str = CORPUS_SNAPSHOT_PATH):
+    """Map an existing snapshot if it is younger than max_age seconds"""
+    if not path:
+        return None
+    try:
+        if time.time() - os.path.getmtime(path) > max_age:
+            return None
+        return MappedCorpus(path)
+    except (OSError, ValueError):
+        return None
 
 # —— Memory Storage —— #
 conversation_memory = {}
-crawled_data = []
+# Үндсэн эх сурвалжийн төлөв; бусад эх сурвалжийнх CorpusShard.status-д
 crawl_status = {"status": "not_started", "message": "Crawling has not started yet"}
 
-# —— Microsoft Planner Integration —— #
-_cached_token = None
-_token_expiry = 0  # UNIX timestamp
+# —— Corpus Generations —— #
+# Every crawl source has its own shard. Corpora are built off to the side and swapped into a shard
+# with one reference assignment. Readers take a local reference through get_corpus(), so a search
+# that started on the old generation finishes on it.
 
-def get_planner_access_token() -> Optional[str]:
-    """Microsoft Planner-ийн access token авах"""
-    global _cached_token, _token_expiry
-
-    # Хэрвээ token хүчинтэй байвал cache-аас буцаана
-    if _cached_token and time.time() < _token_expiry - 10:
-        return _cached_token
-
-    url = f"https://login.microsoftonline.com/{PLANNER_TENANT_ID}/oauth2/v2.0/token"
-    headers = { "Content-Type": "application/x-www-form-urlencoded" }
-    data = {
-        "client_id": PLANNER_CLIENT_ID,
-        "client_secret": PLANNER_CLIENT_SECRET,
-        "scope": "https://graph.microsoft.com/.default",
-        "grant_type": "client_credentials"
+class CorpusRejected(Exception):
+    """A freshly built corpus failed validation; the serving generation was kept"""
+
+def corpus_info(corpus) -> dict:
+    return {
+        "generation": corpus.generation,
+        "built_at": datetime.fromtimestamp(corpus.generation / 1000).isoformat() if corpus.generation else None,
+        "pages": len(corpus),
+        "shared": isinstance(corpus, MappedCorpus),
     }
 
+def validate_corpus(candidate, current) -> None:
+    if not len(candidate):
+        raise CorpusRejected("No pages were crawled")
+    if CORPUS_MIN_PAGE_RATIO > 0 and len(candidate) < len(current) * CORPUS_MIN_PAGE_RATIO:
+        raise CorpusRejected(
+            f"New corpus has {len(candidate)} pages, fewer than {CORPUS_MIN_PAGE_RATIO:.0%} "
+            f"of the {len(current)} pages being served"
+        )
+
+class CorpusShard:
+    """Serving generation, rollback history and shared snapshot of one crawl source"""
+
+    def __init__(self, source: CrawlSource):
+        self.source = source
+        self.name = source.name
+        self.snapshot_path = source_path(CORPUS_SNAPSHOT_PATH, source)
+        self.corpus = CorpusStore()
+        self.history: deque = deque(maxlen=max(0, CORPUS_KEEP_GENERATIONS))
+        self.status = {"status": "not_started", "message": "Crawling has not started yet"}
+        self.last_attempt = 0.0
+        self._swap_lock = threading.Lock()
+        self._remap_lock = threading.Lock()
+        self._next_remap_check = 0.0
+
+    def get(self):
+        """Serving corpus; remaps when another worker has published a newer snapshot"""
+        path = self.snapshot_path
+        if path and time.monotonic() >= self._next_remap_check and self._remap_lock.acquire(blocking=False):
+            try:
+                self._next_remap_check = time.monotonic() + CORPUS_REMAP_CHECK_SEC
+                signature = _snapshot_signature(path)
+                current = getattr(self.corpus, "signature", None)
+                if signature and signature != current and (current is not None or not len(self.corpus)):
+                    try:
+                        mapped = MappedCorpus(path)
+                        self.swap(mapped)
+                        logging.info(f"Remapped {self.name} snapshot generation {mapped.generation} ({len(mapped)} pages)")
+                    except (OSError, ValueError) as e:
+                        logging.warning(f"Failed to map {self.name} snapshot: {e}")
+            finally:
+                self._remap_lock.release()
+        return self.corpus
+
+    def swap(self, new_corpus):
+        """Make new_corpus the serving generation and keep the previous one for rollback"""
+        with self._swap_lock:
+            previous = self.corpus
+            if previous is new_corpus:
+                return previous
+            if len(previous) and self.history.maxlen:
+                self.history.append(previous)
+            self.corpus = new_corpus
+        CORPUS_GENERATION.set(new_corpus.generation, source=self.name)
+        return previous
+
+    def install(self, store: CorpusStore):
+        """Validate, publish and swap in a freshly built corpus; raises CorpusRejected"""
+        validate_corpus(store, self.get())
+        store.generation = int(time.time() * 1000)
+        corpus = publish_corpus(store, self.snapshot_path)
+        self.swap(corpus)
+        return corpus
+
+    def rollback(self, generation: Optional[int] = None):
+        """Serve a kept generation again (the newest one if not given); raises KeyError if it is gone"""
+        with self._swap_lock:
+            candidates = [c for c in self.history if generation is None or c.generation == generation]
+            if not candidates:
+                raise KeyError(generation)
+            target = candidates[-1]
+            self.history.remove(target)
+        corpus = publish_corpus(target, self.snapshot_path)
+        self.swap(corpus)
+        logging.info(f"Rolled {self.name} corpus back to generation {corpus.generation} ({len(corpus)} pages)")
+        return corpus
+
+    def load_recent_snapshot(self, max_age: float):
+        return load_recent_snapshot(max_age, self.snapshot_path)
+
+    def set_status(self, status: dict):
+        global crawl_status
+        self.status = status
+        # crawl_status keeps describing the primary source for existing API clients
+        if self.source is PRIMARY_SOURCE:
+            crawl_status = status
+
+    def info(self) -> dict:
+        corpus = self.get()
+        return {
+            **self.source.to_dict(),
+            "pages": len(corpus),
+            "generation": corpus.generation,
+            "generations_kept": len(self.history),
+            "crawl_status": self.status
+        }
+
+class ShardedCorpus:
+    """Read-only union of the shards' serving corpora, in source order"""
+
+    def __init__(self, parts: list):
+        self.parts = parts  # [(source name, corpus)]
+        self._starts = []
+        total = 0
+        for _, corpus in parts:
+            self._starts.append(total)
+            total += len(corpus)
+        self._count = total
+        # Changes whenever any shard swaps generations, so export cursors and FAQ builds notice it
+        digest = hashlib.blake2b(repr([c.generation for _, c in parts]).encode(), digest_size=6).digest()
+        self.generation = int.from_bytes(digest, "big")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self):
+        for _, corpus in self.parts:
+            yield from corpus
+
+    def export_records(self, fields: tuple, start: int = 0, stop: Optional[int] = None):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        for (_, corpus), offset in zip(self.parts, self._starts):
+            low, high = max(start - offset, 0), min(stop - offset, len(corpus))
+            if low < high:
+                yield from corpus.export_records(fields, low, high)
+
+    def resident_bytes(self) -> int:
+        return sum(corpus.resident_bytes() for _, corpus in self.parts)
+
+    def memory_report(self) -> dict:
+        return {
+            "pages": len(self),
+            "resident_bytes": self.resident_bytes(),
+            "generation": self.generation,
+            "shards": {name: corpus.memory_report() for name, corpus in self.parts}
+        }
+
+corpus_shards: Dict[str, CorpusShard] = {name: CorpusShard(source) for name, source in crawl_sources.items()}
+primary_shard = corpus_shards[PRIMARY_SOURCE.name]
+_sharded_view: Optional[ShardedCorpus] = None
+
+def get_shard(source: Optional[str] = None) -> CorpusShard:
+    """Shard of a source by name (the primary one if not given); raises KeyError for unknown names"""
+    return primary_shard if source is None else corpus_shards[source]
+
+def get_corpus(source: Optional[str] = None):
+    """Serving corpus of one source, or of all sources together"""
+    global _sharded_view
+    if source is not None or len(corpus_shards) == 1:
+        return get_shard(source).get()
+    parts = [(name, shard.get()) for name, shard in corpus_shards.items()]
+    view = _sharded_view
+    if view is None or any(old is not new for (_, old), (_, new) in zip(view.parts, parts)):
+        view = _sharded_view = ShardedCorpus(parts)
+    return view
+
+def swap_corpus(new_corpus, source: Optional[str] = None):
+    """Make new_corpus the serving generation of a shard and keep the previous one for rollback"""
+    return get_shard(source).swap(new_corpus)
+
+def install_corpus(store: CorpusStore, source: Optional[str] = None):
+    """Validate, publish and swap in a freshly built corpus; raises CorpusRejected"""
+    return get_shard(source).install(store)
+
+def rollback_corpus(generation: Optional[int] = None, source: Optional[str] = None):
+    """Serve a kept generation of a shard again; raises KeyError if it is gone"""
+    return get_shard(source).rollback(generation)
+
+# —— Metrics —— #
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape_label_value(value) -> str:
+    # Text exposition format: backslash, double quote and newline must be escaped in label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._function = function
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        if self._function:
+            return float(self._function())
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        if self._function:
+            try:
+                yield self.name, "", float(self._function())
+            except Exception as e:
+                logging.warning(f"Metric {self.name} callback failed: {e}")
+            return
+        yield from super().samples()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [bucket counts..., +Inf count, sum]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            for i, bound in enumerate(self.buckets):
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, f'le="{bound}"'), series[i]
+            yield f"{self.name}_bucket", _format_labels(self.labelnames, key, 'le="+Inf"'), series[len(self.buckets)]
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), series[-1]
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), series[len(self.buckets)]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+metrics = MetricsRegistry()
+
+WEBHOOK_SECONDS = metrics.register(Histogram(
+    "chatbot_webhook_duration_seconds", "End-to-end Chatwoot webhook latency", ("status",)))
+STAGE_SECONDS = metrics.register(Histogram(
+    "chatbot_stage_duration_seconds", "Time spent in each pipeline stage", ("stage",)))
+STAGE_ERRORS = metrics.register(Counter(
+    "chatbot_stage_errors_total", "Failed pipeline stage calls", ("stage",)))
+MESSAGES_COALESCED = metrics.register(Counter(
+    "chatbot_messages_coalesced_total", "Incoming messages folded into another message's turn"))
+WEBHOOK_IN_FLIGHT = metrics.register(Gauge(
+    "chatbot_webhook_in_flight", "Webhook requests currently being processed"))
+LLM_TOKENS = metrics.register(Counter(
+    "chatbot_llm_tokens_total", "Tokens reported by the OpenAI API", ("call", "kind")))
+CACHE_REQUESTS = metrics.register(Counter(
+    "chatbot_cache_requests_total", "Cache lookups by cache and result", ("cache", "result")))
+CRAWL_PAGES = metrics.register(Counter(
+    "chatbot_crawl_pages_total", "Crawled pages by result", ("result",)))
+CRAWL_PAGES_PER_SECOND = metrics.register(Gauge(
+    "chatbot_crawl_pages_per_second", "Throughput of the most recent crawl"))
+CRAWL_BYTES = metrics.register(Counter(
+    "chatbot_crawl_bytes_total", "Bytes of HTML fetched by the crawler (wire = compressed)", ("kind",)))
+CRAWL_SECONDS = metrics.register(Histogram(
+    "chatbot_crawl_duration_seconds", "Full crawl duration",
+    buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)))
+CRAWL_RUNNING = metrics.register(Gauge(
+    "chatbot_crawl_running", "1 while any worker is crawling (read from the crawl lock files)",
+    function=lambda: 1.0 if any(lock.held() for lock in crawl_locks.values()) else 0.0))
+INDEX_PAGES = metrics.register(Gauge(
+    "chatbot_index_pages", "Pages in the searchable corpus (all shards)", function=lambda: len(get_corpus())))
+CORPUS_GENERATION = metrics.register(Gauge(
+    "chatbot_index_generation", "Generation (build time in ms) of the corpus each shard serves", ("source",)))
+INDEX_BYTES = metrics.register(Gauge(
+    "chatbot_index_resident_bytes", "Measured resident memory of the in-memory corpus",
+    function=lambda: get_corpus().resident_bytes()))
+LLM_CALLS = metrics.register(Counter(
+    "chatbot_llm_calls_total", "LLM calls through the circuit breaker", ("call", "result")))
+LLM_FALLBACKS = metrics.register(Counter(
+    "chatbot_llm_fallback_answers_total", "Answers built from retrieved snippets instead of the LLM", ("reason",)))
+LLM_BREAKER_STATE = metrics.register(Gauge(
+    "chatbot_llm_breaker_state", "LLM circuit breaker state (0 closed, 1 half-open, 2 open)",
+    function=lambda: CircuitBreaker.STATES.index(llm_breaker.state)))
+FAQ_PAGES = metrics.register(Counter(
+    "chatbot_faq_pages_total", "Pages processed by FAQ index builds", ("result",)))
+FAQ_ENTRIES = metrics.register(Gauge(
+    "chatbot_faq_entries", "Question/answer entries in the serving FAQ index", function=lambda: len(faq_index)))
+PLANNER_TOKEN_TTL = metrics.register(Gauge(
+    "chatbot_planner_token_ttl_seconds", "Seconds until the cached Planner token expires",
+    function=lambda: planner_tokens.expires_in))
+ACTIVE_CONVERSATIONS = metrics.register(Gauge(
+    "chatbot_active_conversations", "Conversations held in memory",
+    function=lambda: len(conversation_memory)))
+
+# —— Tracing —— #
+class Span:
+    __slots__ = ("name", "start", "end", "attrs", "children", "error")
+
+    def __init__(self, name: str, attrs: Optional[dict] = None):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attrs = dict(attrs or {})
+        self.children: list = []
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def to_dict(self, origin: float) -> dict:
+        data = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+class Trace:
+    def __init__(self, name: str, attrs: Optional[dict] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.timestamp = datetime.now().isoformat()
+        self.root = Span(name, attrs)
+        self._lock = threading.Lock()
+
+    def add_child(self, parent: Span, span: Span):
+        # Spans may be opened from worker threads, so guard the shared child list
+        with self._lock:
+            parent.children.append(span)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "timestamp": self.timestamp,
+            "duration_ms": round(self.root.duration_ms, 3),
+            "root": self.root.to_dict(self.root.start),
+        }
+
+class TraceExporter:
+    """Keeps finished traces in a ring buffer and optionally appends them to a JSONL file"""
+
+    def __init__(self, capacity: int, path: Optional[str] = None):
+        self._buffer: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.path = path
+
+    def export(self, trace: Trace):
+        data = trace.to_dict()
+        with self._lock:
+            self._buffer.append(data)
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(data, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    logging.warning(f"Trace export to {self.path} failed: {e}")
+
+    def recent(self) -> list:
+        with self._lock:
+            return list(self._buffer)
+
+    def slowest(self, limit: int = 10) -> list:
+        return sorted(self.recent(), key=lambda t: t["duration_ms"], reverse=True)[:limit]
+
+    def get(self, trace_id: str) -> Optional[dict]:
+        for data in self.recent():
+            if data["trace_id"] == trace_id:
+                return data
+        return None
+
+trace_exporter = TraceExporter(TRACE_BUFFER_SIZE, TRACE_EXPORT_PATH)
+_trace_local = threading.local()
+
+def current_trace() -> Optional[Trace]:
+    return getattr(_trace_local, "trace", None)
+
+def current_span() -> Optional[Span]:
+    stack = getattr(_trace_local, "stack", None)
+    return stack[-1] if stack else None
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """Open a new trace for this thread; it is exported when the block exits"""
+    trace = Trace(name, attrs)
+    _trace_local.trace = trace
+    _trace_local.stack = [trace.root]
     try:
-        response = requests.post(url, headers=headers, data=data, timeout=10)
-        if response.status_code != 200:
-            logging.error(f"Planner access token авахад алдаа: {response.status_code} - {response.text}")
-            return None
+        yield trace
+    except Exception as e:
+        trace.root.error = str(e)[:200]
+        raise
+    finally:
+        trace.root.end = time.perf_counter()
+        _trace_local.trace = None
+        _trace_local.stack = []
+        trace_exporter.export(trace)
 
-        token_data = response.json()
-        _cached_token = token_data["access_token"]
-        _token_expiry = time.time() + token_data.get("expires_in", 3600)
-        
-        logging.info("Planner access token амжилттай авлаа")
-        return _cached_token
-        
+@contextmanager
+def trace_span(name: str, **attrs):
+    """Record a nested span under the current span; a no-op outside a trace"""
+    trace = current_trace()
+    parent = current_span()
+    if trace is None or parent is None:
+        yield None
+        return
+    span = Span(name, attrs)
+    trace.add_child(parent, span)
+    _trace_local.stack.append(span)
+    try:
+        yield span
     except Exception as e:
-        logging.error(f"Planner access token авахад алдаа гарлаа: {e}")
-        return None
+        span.error = str(e)[:200]
+        raise
+    finally:
+        span.end = time.perf_counter()
+        _trace_local.stack.pop()
+
+def attach_trace(fn: Callable) -> Callable:
+    """Bind fn to the caller's trace so spans it opens on a pool thread nest under the current span"""
+    trace, parent = current_trace(), current_span()
+
+    def run(*args, **kwargs):
+        if trace is None or parent is None:
+            return fn(*args, **kwargs)
+        _trace_local.trace = trace
+        _trace_local.stack = [parent]
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _trace_local.trace = None
+            _trace_local.stack = []
+    return run
+
+@contextmanager
+def timed_stage(stage: str):
+    """Time a pipeline stage into STAGE_SECONDS and the current trace, and count its failures"""
+    start = time.perf_counter()
+    try:
+        with trace_span(stage):
+            yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+def record_llm_usage(call: str, response) -> None:
+    """Count prompt/completion tokens from an OpenAI response"""
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    LLM_TOKENS.inc(prompt_tokens, call=call, kind="prompt")
+    LLM_TOKENS.inc(cached_tokens, call=call, kind="cached")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, call=call, kind="completion")
+    span = current_span()
+    if span:
+        span.attrs.update({f"{call}_prompt_tokens": prompt_tokens, f"{call}_cached_tokens": cached_tokens})
+
+# —— Microsoft Planner Integration —— #
+# One pooled session for the token endpoint and Graph so TLS connections are reused across tasks
+graph_session = requests.Session()
+
+class PlannerTokenManager:
+    """Client-credentials token for Microsoft Graph shared by all threads.
+
+    Only one thread fetches at a time (others wait for its result instead of also calling the
+    login endpoint), and a background thread renews the token refresh_margin seconds before it
+    expires so task creation normally never waits on a token fetch.
+    """
+
+    def __init__(self, refresh_margin: float, retry_sec: float = 30.0):
+        self.refresh_margin = refresh_margin
+        self.retry_sec = retry_sec
+        self._state: tuple = (None, 0.0)  # (token, expires_at), replaced as a whole
+        self._lifetime = 3600.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def margin(self) -> float:
+        # Short-lived tokens are renewed halfway through instead of continuously
+        return min(self.refresh_margin, self._lifetime / 2)
+
+    @property
+    def expires_in(self) -> float:
+        token, expires_at = self._state
+        return max(0.0, expires_at - time.time()) if token else 0.0
+
+    def _fetch(self) -> Optional[str]:
+        url = f"{PLANNER_LOGIN_URL}/{PLANNER_TENANT_ID}/oauth2/v2.0/token"
+        headers = { "Content-Type": "application/x-www-form-urlencoded" }
+        data = {
+            "client_id": PLANNER_CLIENT_ID,
+            "client_secret": PLANNER_CLIENT_SECRET,
+            "scope": "https://graph.microsoft.com/.default",
+            "grant_type": "client_credentials"
+        }
+        try:
+            with timed_stage("planner_token"):
+                response = graph_session.post(url, headers=headers, data=data, timeout=10)
+            if response.status_code != 200:
+                logging.error(f"Planner access token авахад алдаа: {response.status_code} - {response.text}")
+                return None
+            token_data = response.json()
+            self._lifetime = float(token_data.get("expires_in", 3600))
+            self._state = (token_data["access_token"], time.time() + self._lifetime)
+            logging.info("Planner access token амжилттай авлаа")
+            return token_data["access_token"]
+        except Exception as e:
+            logging.error(f"Planner access token авахад алдаа гарлаа: {e}")
+            return None
+
+    def refresh(self, min_remaining: float) -> Optional[str]:
+        """Fetch a new token unless another thread already got one valid for min_remaining seconds"""
+        with self._lock:
+            token, expires_at = self._state
+            if token and time.time() < expires_at - min_remaining:
+                return token
+            return self._fetch()
+
+    def get(self) -> Optional[str]:
+        token, expires_at = self._state
+        if token and time.time() < expires_at - 10:
+            CACHE_REQUESTS.inc(cache="planner_token", result="hit")
+            return token
+        CACHE_REQUESTS.inc(cache="planner_token", result="miss")
+        return self.refresh(10)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            token = self.refresh(self.margin)
+            wait = self.expires_in - self.margin if token else self.retry_sec
+            self._stop.wait(max(wait, 1.0))
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="planner-token", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+planner_tokens = PlannerTokenManager(PLANNER_TOKEN_REFRESH_MARGIN_SEC)
+
+def planner_configured() -> bool:
+    return all([PLANNER_TENANT_ID, PLANNER_CLIENT_ID, PLANNER_CLIENT_SECRET, PLANNER_PLAN_ID, PLANNER_BUCKET_ID])
+
+def get_planner_access_token() -> Optional[str]:
+    """Microsoft Planner-ийн access token авах"""
+    return planner_tokens.get()
 
 class MicrosoftPlannerAPI:
-    def __init__(self, access_token: str):
-        self.base_url = "https://graph.microsoft.com/v1.0"
-        self.headers = {
-            "Authorization": f"Bearer {access_token}",
+    def __init__(self, token_source: Callable[[], Optional[str]], session=graph_session):
+        self.base_url = GRAPH_BASE_URL
+        self.token_source = token_source
+        self.session = session
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.token_source()}",
             "Content-Type": "application/json"
         }
 
@@ -135,34 +1316,33 @@ class MicrosoftPlannerAPI:
         data["assignments"] = assignments
 
         try:
-            response = requests.post(url, headers=self.headers, json=data, timeout=10)
+            with timed_stage("planner_task"):
+                response = self.session.post(url, headers=self.headers, json=data, timeout=10)
             return response.json()
         except Exception as e:
             logging.error(f"Planner task үүсгэхэд алдаа гарлаа: {e}")
             return {"error": str(e)}
 
+planner_api = MicrosoftPlannerAPI(get_planner_access_token)
+
 def create_planner_task(email: str, issue: str, conv_id: Optional[int] = None) -> bool:
     """Microsoft Planner-д task үүсгэх"""
-    if not all([PLANNER_TENANT_ID, PLANNER_CLIENT_ID, PLANNER_CLIENT_SECRET, PLANNER_PLAN_ID, PLANNER_BUCKET_ID]):
+    if not planner_configured():
         logging.error("Microsoft Planner тохиргоо дутуу байна")
         return False
         
     try:
-        # Access token авах
-        token = get_planner_access_token()
-        if not token:
+        # Access token авах (ихэвчлэн background-д шинэчлэгдсэн cache-аас)
+        if not get_planner_access_token():
             logging.error("Planner access token авч чадсангүй")
             return False
-            
-        # Planner API instance үүсгэх
-        planner = MicrosoftPlannerAPI(token)
         
         # Task title үүсгэх (buten.py форматтайгаар)
         issue_preview = issue[:50] + "..." if len(issue) > 50 else issue
         title = f"{email} --> {issue_preview}"
         
         # Task үүсгэх (bulgantamir автоматаар нэмэгдэнэ)
-        result = planner.create_task(
+        result = planner_api.create_task(
             plan_id=PLANNER_PLAN_ID or "",
             bucket_id=PLANNER_BUCKET_ID or "",
             title=title,
@@ -181,88 +1361,846 @@ def create_planner_task(email: str, issue: str, conv_id: Optional[int] = None) -
         logging.error(f"Planner task үүсгэхэд алдаа гарлаа: {e}")
         return False
 
+# —— Crawl Frontier —— #
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+MAX_SITEMAP_FILES = 50
+
+def _parse_lastmod(value: Optional[str]) -> float:
+    if not value:
+        return 0.0
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+class CrawlFrontier:
+    """Priority queue of URLs to crawl.
+
+    Shallower pages come first, then higher sitemap <priority>, then more recent <lastmod>, so a
+    fixed MAX_CRAWL_PAGES budget covers the top of the docs tree before its leaves. Every URL is
+    queued at most once (re-queued only if found again at a smaller depth).
+    """
+
+    def __init__(self, scope: str, max_depth: int = 0):
+        self.scope = scope
+        self.max_depth = max_depth
+        self.robots: Optional[RobotFileParser] = None
+        self.crawl_delay = 0.0
+        self._heap: list = []
+        self._best_depth: Dict[str, int] = {}
+        self._sitemap_meta: Dict[str, tuple] = {}
+        self._done: set = set()
+        self._pending = 0
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def is_done(self, url: str) -> bool:
+        return url_key(url) in self._done
+
+    def mark_done(self, url: str):
+        """Record an alias (redirect target, rel=canonical) so it is never fetched separately"""
+        key = url_key(url)
+        if key in self._done:
+            return
+        if key in self._best_depth:
+            self._pending -= 1
+        self._done.add(key)
+
+    def allowed(self, url: str) -> bool:
+        if not url.startswith(self.scope):
+            return False
+        return self.robots is None or self.robots.can_fetch(CRAWL_USER_AGENT, url)
+
+    def push(self, url: str, depth: int) -> bool:
+        key = url_key(url)
+        if key in self._done or (self.max_depth and depth > self.max_depth) or not self.allowed(url):
+            return False
+        known = self._best_depth.get(key)
+        if known is not None and known <= depth:
+            return False
+        if known is None:
+            self._pending += 1
+        self._best_depth[key] = depth
+        priority, lastmod = self._sitemap_meta.get(key, (0.5, 0.0))
+        self._seq += 1
+        heapq.heappush(self._heap, (depth, -priority, -lastmod, self._seq, url))
+        return True
+
+    def pop(self) -> Optional[tuple]:
+        while self._heap:
+            depth, _, _, _, url = heapq.heappop(self._heap)
+            key = url_key(url)
+            # Skip entries superseded by a shallower re-queue or already crawled
+            if key in self._done or self._best_depth.get(key) != depth:
+                continue
+            self._done.add(key)
+            self._pending -= 1
+            return url, depth
+        return None
+
+    def _path_depth(self, url: str) -> int:
+        rest = url[len(self.scope):] if url.startswith(self.scope) else urlparse(url).path
+        return len([part for part in rest.split("/") if part])
+
+    def load_robots(self, session=requests):
+        parsed = urlparse(self.scope)
+        robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+        try:
+            resp = session.get(robots_url, timeout=10)
+        except Exception as e:
+            logging.info(f"robots.txt unavailable ({e}), crawling without it")
+            return
+        if resp.status_code != 200:
+            return
+        parser = RobotFileParser(robots_url)
+        parser.parse(resp.text.splitlines())
+        self.robots = parser
+        self.crawl_delay = float(parser.crawl_delay(CRAWL_USER_AGENT) or 0)
+
+    def seed_from_sitemaps(self, session=requests) -> int:
+        """Queue every in-scope sitemap URL; returns how many were added"""
+        parsed = urlparse(self.scope)
+        candidates = list(self.robots.site_maps() or []) if self.robots else []
+        candidates += [urljoin(self.scope, "sitemap.xml"), f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"]
+
+        pending, seen_sitemaps, entries = list(dict.fromkeys(candidates)), set(), []
+        while pending and len(seen_sitemaps) < MAX_SITEMAP_FILES:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in seen_sitemaps:
+                continue
+            seen_sitemaps.add(sitemap_url)
+            try:
+                resp = session.get(sitemap_url, timeout=10)
+                if resp.status_code != 200:
+                    continue
+                content = resp.content
+                if sitemap_url.endswith(".gz") and content[:2] == b"\x1f\x8b":
+                    content = gzip.decompress(content)
+                root = ET.fromstring(content)
+            except Exception as e:
+                logging.info(f"Skipping sitemap {sitemap_url}: {e}")
+                continue
+            if root.tag == f"{SITEMAP_NS}sitemapindex":
+                pending.extend(loc.text.strip() for loc in root.iter(f"{SITEMAP_NS}loc") if loc.text)
+                continue
+            for node in root.iter(f"{SITEMAP_NS}url"):
+                loc = node.findtext(f"{SITEMAP_NS}loc")
+                if not loc:
+                    continue
+                try:
+                    priority = float(node.findtext(f"{SITEMAP_NS}priority") or 0.5)
+                except ValueError:
+                    priority = 0.5
+                entries.append((normalize_url(self.scope, loc.strip()), priority,
+                                _parse_lastmod(node.findtext(f"{SITEMAP_NS}lastmod"))))
+
+        added = 0
+        for url, priority, lastmod in entries:
+            self._sitemap_meta[url_key(url)] = (priority, lastmod)
+            if self.push(url, self._path_depth(url)):
+                added += 1
+        if added:
+            logging.info(f"Seeded crawl frontier with {added} sitemap URLs")
+        return added
+
+def build_frontier(start_url: str, session=requests, source: Optional[CrawlSource] = None) -> CrawlFrontier:
+    source = source or PRIMARY_SOURCE
+    frontier = CrawlFrontier(source.root_url, source.max_depth)
+    if CRAWL_RESPECT_ROBOTS:
+        frontier.load_robots(session)
+    if CRAWL_USE_SITEMAP:
+        frontier.seed_from_sitemaps(session)
+    frontier.push(start_url, 0)
+    return frontier
+
+# —— Near-duplicate Detection —— #
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4  # Хамгийн ихдээ 3 бит зөрөхөд дор хаяж нэг 16-битийн band яг таарна
+SHINGLE_WORDS = 3
+MIN_SIMHASH_SHINGLES = 8
+
+def simhash(text: str) -> Optional[int]:
+    """64-bit SimHash over word 3-shingles; None when the text is too short to fingerprint reliably"""
+    words = re.findall(r"\w+", text.lower())
+    shingles = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(0, len(words) - SHINGLE_WORDS + 1))]
+    if len(shingles) < MIN_SIMHASH_SHINGLES:
+        return None
+    counts: Dict[str, int] = {}
+    for shingle in shingles:
+        counts[shingle] = counts.get(shingle, 0) + 1
+    weights = [0] * SIMHASH_BITS
+    for shingle, count in counts.items():
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+class DuplicateDetector:
+    """Finds pages whose body repeats one already kept in this crawl.
+
+    Exact copies are caught by a content hash; near copies (print/language variants that differ in
+    a header or a date) by SimHash Hamming distance, looked up through banded buckets instead of
+    comparing against every kept page.
+    """
+
+    def __init__(self, max_distance: int = NEAR_DUPLICATE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._exact: Dict[bytes, str] = {}
+        self._bands: Dict[tuple, list] = {}
+        self._band_bits = SIMHASH_BITS // SIMHASH_BANDS
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self._band_bits) - 1
+        for band in range(SIMHASH_BANDS):
+            yield band, fingerprint >> (band * self._band_bits) & mask
+
+    def check(self, url: str, text: str) -> Optional[str]:
+        """URL of the kept page this text duplicates, or None after remembering it as kept"""
+        if self.max_distance < 0:
+            return None
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        if digest in self._exact:
+            return self._exact[digest]
+        fingerprint = simhash(text) if self.max_distance > 0 else None
+        if fingerprint is not None:
+            for band_key in self._band_keys(fingerprint):
+                for other, other_url in self._bands.get(band_key, ()):
+                    if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                        return other_url
+        self._exact[digest] = url
+        if fingerprint is not None:
+            for band_key in self._band_keys(fingerprint):
+                self._bands.setdefault(band_key, []).append((fingerprint, url))
+        return None
+
+def canonical_link(soup: "BeautifulSoup", page_url: str) -> Optional[str]:
+    from bs4 import Tag
+
+    link = soup.find("link", rel="canonical", href=True)
+    href = link.get("href") if isinstance(link, Tag) else None
+    if isinstance(href, str) and href.strip() and is_internal_link(href.strip(), urlparse(page_url).netloc):
+        return normalize_url(page_url, href.strip())
+    return None
+
+# —— Page Fetching —— #
+# Responses are streamed: the content type is checked from the headers before any body is read,
+# and the decoded body is capped at CRAWL_MAX_PAGE_BYTES so a large binary or a runaway generated
+# page cannot balloon memory (the cap also bounds decompression).
+HTML_CONTENT_TYPES = {"text/html", "application/xhtml+xml"}
+FETCH_CHUNK_BYTES = 64 * 1024
+FETCH_HEADERS = {
+    # urllib3 advertises only the encodings it can decode (br needs the brotli package)
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.1",
+}
+
+class FetchSkipped(Exception):
+    """The response was not fetched in full because it is not HTML or exceeds the size cap"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+class FetchedPage:
+    __slots__ = ("url", "content", "encoding", "wire_bytes")
+
+    def __init__(self, url: str, content: bytes, encoding: Optional[str], wire_bytes: int):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.wire_bytes = wire_bytes
+
+    def soup(self) -> "BeautifulSoup":
+        from bs4 import BeautifulSoup
+        if self.encoding:
+            try:
+                return BeautifulSoup(self.content.decode(self.encoding, "replace"), "html.parser")
+            except LookupError:
+                pass
+        # Without a declared charset bs4 sniffs <meta charset> instead of assuming ISO-8859-1
+        return BeautifulSoup(self.content, "html.parser")
+
+def _declared_charset(content_type: str) -> Optional[str]:
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset" and value.strip():
+            return value.strip().strip('"\'')
+    return None
+
+def fetch_html(url: str, session=requests, max_bytes: Optional[int] = None) -> FetchedPage:
+    """GET an HTML page with compression and a body cap; raises FetchSkipped or requests errors"""
+    max_bytes = CRAWL_MAX_PAGE_BYTES if max_bytes is None else max_bytes
+    with session.get(url, headers=FETCH_HEADERS, timeout=10, stream=True) as resp:
+        resp.raise_for_status()
+        content_type = resp.headers.get("Content-Type", "")
+        mime = content_type.split(";")[0].strip().lower()
+        if mime and mime not in HTML_CONTENT_TYPES:
+            raise FetchSkipped("not_html", f"{url} is {mime}, not HTML")
+        length = resp.headers.get("Content-Length", "")
+        if max_bytes and length.isdigit() and int(length) > max_bytes:
+            raise FetchSkipped("too_large", f"{url} declares {length} bytes (cap {max_bytes})")
+        chunks, size = [], 0
+        for chunk in resp.iter_content(FETCH_CHUNK_BYTES):
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise FetchSkipped("too_large", f"{url} is larger than {max_bytes} bytes")
+            chunks.append(chunk)
+        content = b"".join(chunks)
+        wire_bytes = resp.raw.tell() if hasattr(resp.raw, "tell") else size
+        CRAWL_BYTES.inc(wire_bytes, kind="wire")
+        CRAWL_BYTES.inc(size, kind="decoded")
+        return FetchedPage(resp.url, content, _declared_charset(content_type), wire_bytes)
+
 # —— Crawl & Scrape —— #
-def crawl_and_scrape(start_url: str):
-    visited = set()
-    to_visit = {start_url}
+def crawl_and_scrape(start_url: str, job: Optional["CrawlJob"] = None, source: Optional[CrawlSource] = None):
+    from bs4 import Tag
+
+    source = source or (job.source if job else PRIMARY_SOURCE)
+    # One session per crawl keeps connections to the docs host alive between pages
+    session = requests.Session()
+    frontier = build_frontier(start_url, session, source)
+    duplicates = DuplicateDetector()
+    delay = max(DELAY_SEC, frontier.crawl_delay)
+    visited = 0
+    wire_bytes = 0
     results = []
+    started = time.perf_counter()
 
-    while to_visit and len(visited) < MAX_CRAWL_PAGES:
-        url = to_visit.pop()
-        if url in visited:
-            continue
-        visited.add(url)
+    while visited < source.max_pages:
+        if job and job.cancelled():
+            logging.info(f"Crawl job {job.job_id} cancelled after {len(results)} pages")
+            break
+        next_item = frontier.pop()
+        if next_item is None:
+            break
+        url, depth = next_item
+        visited += 1
 
         try:
             logging.info(f"[Crawling] {url}")
-            resp = requests.get(url, timeout=10)
-            resp.raise_for_status()
+            with timed_stage("crawl_fetch"):
+                fetched = fetch_html(url, session)
+        except FetchSkipped as e:
+            logging.info(f"Skipping {url}: {e}")
+            CRAWL_PAGES.inc(result=e.reason)
+            if job:
+                job.record_page(ok=True, queued=len(frontier), skipped=True)
+            continue
         except Exception as e:
             logging.warning(f"Failed to fetch {url}: {e}")
+            CRAWL_PAGES.inc(result="failed")
+            if job:
+                job.record_page(ok=False, queued=len(frontier))
             continue
 
-        soup = BeautifulSoup(resp.text, "html.parser")
-        title = soup.title.string.strip() if soup.title and soup.title.string else url
-        body, images = extract_content(soup, url)
-
-        results.append({
-            "url": url,
-            "title": title,
-            "body": body,
-            "images": images
-        })
-
+        wire_bytes += fetched.wire_bytes
+        if job:
+            job.bytes_transferred += fetched.wire_bytes
+            job.bytes_decoded += len(fetched.content)
+        soup = fetched.soup()
         for a in soup.find_all("a", href=True):
             if isinstance(a, Tag):
                 href = a.get("href")
-                if isinstance(href, str) and is_internal_link(href):
-                    full = normalize_url(url, href)
-                    if full.startswith(ROOT_URL) and full not in visited:
-                        to_visit.add(full)
+                if isinstance(href, str) and is_internal_link(href, source.netloc):
+                    frontier.push(normalize_url(url, href), depth + 1)
 
-        time.sleep(DELAY_SEC)
+        # Store the page under the URL the site itself calls canonical (after redirects/rel=canonical)
+        page_url = url
+        for alias in (normalize_url(url, fetched.url), canonical_link(soup, url)):
+            if not alias or url_key(alias) == url_key(page_url) or not frontier.allowed(alias):
+                continue
+            if frontier.is_done(alias):
+                page_url = None
+                break
+            frontier.mark_done(alias)
+            page_url = alias
+        if page_url is None:
+            CRAWL_PAGES.inc(result="duplicate")
+            if job:
+                job.record_page(ok=True, queued=len(frontier), duplicate=True)
+            time.sleep(delay)
+            continue
 
+        title = soup.title.string.strip() if soup.title and soup.title.string else page_url
+        body, images = extract_content(soup, page_url)
+        duplicate_of = duplicates.check(page_url, body)
+        if duplicate_of:
+            logging.info(f"Skipping {page_url}: duplicate of {duplicate_of}")
+            CRAWL_PAGES.inc(result="duplicate")
+        else:
+            results.append({
+                "url": page_url,
+                "title": title,
+                "body": body,
+                "images": images
+            })
+            CRAWL_PAGES.inc(result="ok")
+
+        if job:
+            job.record_page(ok=True, queued=len(frontier), duplicate=bool(duplicate_of))
+        time.sleep(delay)
+
+    elapsed = time.perf_counter() - started
+    logging.info(f"Crawl fetched {visited} URLs, {wire_bytes / 1024:.0f} KiB transferred")
+    CRAWL_SECONDS.observe(elapsed)
+    CRAWL_PAGES_PER_SECOND.set(len(results) / elapsed if elapsed > 0 else 0.0)
     return results
 
+# —— Crawl Jobs —— #
+class CrawlLock:
+    """Single-flight guard shared by all workers through flock on a lock file (crawls, FAQ builds)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.Lock()
+        self._handle = None
+
+    def acquire(self, owner: str, blocking: bool = False) -> bool:
+        if not self._local.acquire(blocking=blocking):
+            return False
+        if fcntl is None:
+            return True
+        handle = open(self.path, "a+", encoding="utf-8")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            handle.close()
+            self._local.release()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(json.dumps({"owner": owner, "pid": os.getpid(), "since": datetime.now().isoformat()}))
+        handle.flush()
+        self._handle = handle
+        return True
+
+    def release(self):
+        if self._handle:
+            self._handle.seek(0)
+            self._handle.truncate()
+            fcntl.flock(self._handle, fcntl.LOCK_UN)  # type: ignore
+            self._handle.close()
+            self._handle = None
+        self._local.release()
+
+    def holder(self) -> Optional[dict]:
+        """Who currently holds the lock, as written by the owning worker"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                content = f.read().strip()
+            return json.loads(content) if content else None
+        except (OSError, ValueError):
+            return None
+
+    def held(self) -> bool:
+        """Whether any worker holds the lock; a holder whose process has exited does not count"""
+        if fcntl is None:
+            return self._local.locked()
+        holder = self.holder()
+        return bool(holder and holder.get("pid")) and _pid_alive(holder["pid"])
+
+# Sources crawl independently: each has its own lock file, so a long docs crawl never delays the status page
+crawl_locks: Dict[str, CrawlLock] = {
+    name: CrawlLock(source_path(CRAWL_LOCK_PATH, source)) for name, source in crawl_sources.items()
+}
+crawl_lock = crawl_locks[PRIMARY_SOURCE.name]
+
+class CrawlJob:
+    """A background crawl with progress counters and cooperative cancellation"""
+
+    def __init__(self, kind: str, start_url: str, trigger: str = "api", source: Optional[CrawlSource] = None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.kind = kind  # "index" replaces the source's shard, "export" only keeps results on the job
+        self.trigger = trigger
+        self.source = source or PRIMARY_SOURCE
+        self.start_url = start_url
+        self.status = "queued"
+        self.created_at = datetime.now().isoformat()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.pages_fetched = 0
+        self.pages_failed = 0
+        self.pages_duplicate = 0
+        self.pages_skipped = 0
+        self.pages_queued = 0
+        self.bytes_transferred = 0
+        self.bytes_decoded = 0
+        self.error: Optional[str] = None
+        self.results: list = []
+        self.results_count = 0
+        self.cancel_requested = threading.Event()
+        self._next_sync = 0.0
+
+    def sync(self):
+        """Publish progress to the job store and pick up a cancel request made through any worker"""
+        self._next_sync = time.monotonic() + CRAWL_JOB_SYNC_SEC
+        if crawl_job_store.save(self):
+            self.cancel_requested.set()
+
+    def cancelled(self) -> bool:
+        if not self.cancel_requested.is_set() and time.monotonic() >= self._next_sync:
+            self.sync()
+        return self.cancel_requested.is_set()
+
+    def record_page(self, ok: bool, queued: int, duplicate: bool = False, skipped: bool = False):
+        if skipped:
+            self.pages_skipped += 1
+        elif ok:
+            self.pages_fetched += 1
+        else:
+            self.pages_failed += 1
+        if duplicate:
+            self.pages_duplicate += 1
+        self.pages_queued = queued
+
+    @property
+    def pages_per_second(self) -> float:
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return round(self.pages_fetched / elapsed, 2) if elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "trigger": self.trigger,
+            "source": self.source.name,
+            "start_url": self.start_url,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat() if self.started_at else None,
+            "finished_at": datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+            "progress": {
+                "pages_fetched": self.pages_fetched,
+                "pages_failed": self.pages_failed,
+                "pages_duplicate": self.pages_duplicate,
+                "pages_skipped": self.pages_skipped,
+                "pages_queued": self.pages_queued,
+                "bytes_transferred": self.bytes_transferred,
+                "bytes_decoded": self.bytes_decoded,
+                "max_pages": self.source.max_pages,
+                "pages_per_second": self.pages_per_second,
+            },
+            "results_count": self.results_count or len(self.results),
+            "error": self.error,
+            "pid": os.getpid(),
+        }
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+class CrawlJobStore:
+    """Crawl job state, results and cancel requests in SQLite, so any worker can answer for any job.
+
+    Without a db_path the database is in memory and only this worker sees its jobs.
+    """
+
+    def __init__(self, db_path: Optional[str], history: int):
+        self.db_path = db_path or ":memory:"
+        self.history = history
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per process (a connection must not cross a fork), used under self._lock
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS crawl_jobs (job_id TEXT PRIMARY KEY, created REAL NOT NULL, "
+                "state TEXT NOT NULL, cancel INTEGER NOT NULL DEFAULT 0, finished INTEGER NOT NULL DEFAULT 0)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS crawl_job_results (job_id TEXT NOT NULL, seq INTEGER NOT NULL, "
+                "page TEXT NOT NULL, PRIMARY KEY (job_id, seq))")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def save(self, job: CrawlJob) -> bool:
+        """Write the job's state; returns True if someone asked to cancel it"""
+        state = job.to_dict()
+        finished = int(job.status not in ("queued", "running"))
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT INTO crawl_jobs (job_id, created, state, finished) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (job_id) DO UPDATE SET state = excluded.state, finished = excluded.finished",
+                    (job.job_id, time.time(), json.dumps(state, ensure_ascii=False), finished))
+                row = conn.execute("SELECT cancel FROM crawl_jobs WHERE job_id = ?", (job.job_id,)).fetchone()
+                if finished:
+                    self._prune(conn)
+            return bool(row and row[0])
+        except sqlite3.Error as e:
+            logging.warning(f"Failed to save crawl job {job.job_id}: {e}")
+            return False
+
+    def _prune(self, conn: sqlite3.Connection):
+        # Keep a bounded history so finished jobs don't pin their pages on disk forever
+        stale = [row[0] for row in conn.execute(
+            "SELECT job_id FROM crawl_jobs WHERE finished = 1 ORDER BY created DESC LIMIT -1 OFFSET ?",
+            (max(0, self.history),))]
+        for job_id in stale:
+            conn.execute("DELETE FROM crawl_job_results WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM crawl_jobs WHERE job_id = ?", (job_id,))
+
+    def save_results(self, job_id: str, pages: list):
+        rows = ((job_id, seq, json.dumps(page, ensure_ascii=False)) for seq, page in enumerate(pages))
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            try:
+                conn.execute("DELETE FROM crawl_job_results WHERE job_id = ?", (job_id,))
+                conn.executemany("INSERT INTO crawl_job_results (job_id, seq, page) VALUES (?, ?, ?)", rows)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _load_state(raw: str) -> dict:
+        state = json.loads(raw)
+        # A job left "running" by a worker that has exited will never finish
+        if state.get("status") in ("queued", "running") and state.get("pid") and not _pid_alive(state["pid"]):
+            state["status"] = "failed"
+            state["error"] = state.get("error") or "Worker exited while the job was running"
+        return state
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connect().execute("SELECT state FROM crawl_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._load_state(row[0]) if row else None
+
+    def list(self) -> list:
+        with self._lock:
+            rows = self._connect().execute("SELECT state FROM crawl_jobs ORDER BY created").fetchall()
+        return [self._load_state(row[0]) for row in rows]
+
+    def request_cancel(self, job_id: str) -> bool:
+        """Flag a job for cancellation; the worker running it stops within CRAWL_JOB_SYNC_SEC"""
+        with self._lock:
+            return self._connect().execute(
+                "UPDATE crawl_jobs SET cancel = 1 WHERE job_id = ?", (job_id,)).rowcount == 1
+
+    def results(self, job_id: str, start: int = 0, stop: Optional[int] = None):
+        """Stored result pages from start (to stop), read in batches"""
+        position = start
+        while stop is None or position < stop:
+            batch = 200 if stop is None else min(200, stop - position)
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT page FROM crawl_job_results WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                    (job_id, position, batch)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield json.loads(row[0])
+            position += len(rows)
+
+crawl_job_store = CrawlJobStore(CRAWL_JOB_DB, CRAWL_JOB_HISTORY)
+# Jobs running in this worker, for cancellation on shutdown; everything else reads crawl_job_store
+crawl_jobs: Dict[str, CrawlJob] = {}
+_crawl_jobs_lock = threading.Lock()
+
+class CrawlAlreadyRunning(Exception):
+    def __init__(self, holder: Optional[dict]):
+        super().__init__("Crawl is already running")
+        self.holder = holder
+
+def start_crawl_job(kind: str, trigger: str = "api", wait_for_lock: bool = False,
+                    source: Optional[str] = None) -> CrawlJob:
+    """Start a crawl of one source (the primary one if not given) in a background thread.
+
+    Raises KeyError for an unknown source and CrawlAlreadyRunning if another crawl of it holds the lock.
+    """
+    shard = get_shard(source)
+    lock = crawl_locks[shard.name]
+    job = CrawlJob(kind, shard.source.root_url, trigger, shard.source)
+    if not wait_for_lock and not lock.acquire(job.job_id):
+        raise CrawlAlreadyRunning(lock.holder())
+    if kind == "index":
+        shard.last_attempt = time.time()
+
+    with _crawl_jobs_lock:
+        crawl_jobs[job.job_id] = job
+    job.sync()
+
+    threading.Thread(target=_run_crawl_job, args=(job, wait_for_lock), daemon=True).start()
+    return job
+
+def _run_crawl_job(job: CrawlJob, acquire_lock: bool):
+    shard = get_shard(job.source.name)
+    lock = crawl_locks[shard.name]
+
+    if acquire_lock:
+        lock.acquire(job.job_id, blocking=True)
+    try:
+        job.status = "running"
+        job.started_at = time.time()
+        job.sync()
+        if job.trigger == "startup":
+            # Another worker may have crawled while this one waited for the lock
+            snapshot = shard.load_recent_snapshot(CORPUS_SNAPSHOT_MAX_AGE_SEC)
+            if snapshot is not None and len(snapshot):
+                shard.swap(snapshot)
+                if not len(get_faq_index()):
+                    schedule_faq_build(get_corpus())
+                job.status = "completed"
+                shard.set_status({
+                    "status": "completed",
+                    "message": f"Loaded shared corpus snapshot with {len(snapshot)} pages",
+                    "pages_count": len(snapshot),
+                    "timestamp": datetime.now().isoformat(),
+                    "job_id": job.job_id
+                })
+                logging.info(f"✅ Startup reused {shard.name} snapshot generation {snapshot.generation}: {len(snapshot)} pages")
+                return
+        logging.info(f"🚀 Crawl job {job.job_id} ({job.kind}, {job.trigger}) started for {job.start_url}")
+        if job.kind == "index":
+            shard.set_status({"status": "running", "message": f"Crawling {job.start_url}...", "job_id": job.job_id})
+
+        job.results = crawl_and_scrape(job.start_url, job, job.source)
+
+        if job.cancel_requested.is_set():
+            job.status = "cancelled"
+            if job.kind == "index":
+                shard.set_status({"status": "cancelled", "message": "Crawl was cancelled", "job_id": job.job_id})
+        elif job.kind == "index":
+            store = CorpusStore(job.results)
+            logging.info(f"Corpus memory: {store.memory_report()}")
+            try:
+                corpus = shard.install(store)
+            except CorpusRejected as e:
+                # Keep answering from the last good generation
+                job.status = "failed"
+                job.error = str(e)
+                serving = shard.get()
+                shard.set_status({
+                    "status": "failed",
+                    "message": f"{e}; still serving {len(serving)} pages from generation {serving.generation}",
+                    "job_id": job.job_id
+                })
+                logging.warning(f"❌ Crawl job {job.job_id} rejected: {e}")
+            else:
+                job.status = "completed"
+                shard.set_status({
+                    "status": "completed",
+                    "message": f"Successfully crawled {len(corpus)} pages",
+                    "pages_count": len(corpus),
+                    "generation": corpus.generation,
+                    "timestamp": datetime.now().isoformat(),
+                    "job_id": job.job_id
+                })
+                logging.info(f"✅ Crawl job {job.job_id} completed: {len(corpus)} {shard.name} pages")
+                schedule_faq_build(get_corpus())
+        else:
+            job.status = "completed"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        if job.kind == "index":
+            shard.set_status({"status": "error", "message": f"Crawl error: {str(e)}", "job_id": job.job_id})
+        logging.error(f"❌ Crawl job {job.job_id} error: {e}")
+    finally:
+        job.finished_at = time.time()
+        lock.release()
+        if job.results:
+            # Results are stored before the final state, so a "completed" job always has them
+            try:
+                crawl_job_store.save_results(job.job_id, job.results)
+                job.results_count = len(job.results)
+                job.results = []
+            except sqlite3.Error as e:
+                job.error = job.error or f"Failed to store results: {e}"
+                logging.error(f"❌ Crawl job {job.job_id} results were not stored: {e}")
+        job.sync()
+        with _crawl_jobs_lock:
+            crawl_jobs.pop(job.job_id, None)
+
 # —— Startup Functions —— #
 def auto_crawl_on_startup():
-    """Automatically crawl the site on startup"""
-    global crawled_data, crawl_status
-    
+    """Automatically crawl every source on startup"""
     if not AUTO_CRAWL_ON_START:
-        crawl_status = {"status": "disabled", "message": "Auto-crawl is disabled"}
+        for shard in corpus_shards.values():
+            shard.set_status({"status": "disabled", "message": "Auto-crawl is disabled"})
         logging.info("Auto-crawl is disabled")
         return
     
-    try:
-        logging.info(f"🚀 Starting automatic crawl of {ROOT_URL}")
-        crawl_status = {"status": "running", "message": f"Crawling {ROOT_URL}..."}
-        
-        crawled_data = crawl_and_scrape(ROOT_URL)
-        
-        if crawled_data:
-            crawl_status = {
-                "status": "completed", 
-                "message": f"Successfully crawled {len(crawled_data)} pages",
-                "pages_count": len(crawled_data),
-                "timestamp": datetime.now().isoformat()
-            }
-            logging.info(f"✅ Auto-crawl completed: {len(crawled_data)} pages")
-        else:
-            crawl_status = {"status": "failed", "message": "No pages were crawled"}
-            logging.warning("❌ Auto-crawl failed: No pages found")
-            
-    except Exception as e:
-        crawl_status = {"status": "error", "message": f"Crawl error: {str(e)}"}
-        logging.error(f"❌ Auto-crawl error: {e}")
+    # Workers queue behind each other instead of crawling a site in parallel; sources crawl side by side
+    for name in corpus_shards:
+        start_crawl_job("index", trigger="startup", wait_for_lock=True, source=name)
 
-# Start auto-crawl in background when app starts
-import threading
-if AUTO_CRAWL_ON_START:
-    threading.Thread(target=auto_crawl_on_startup, daemon=True).start()
+class CrawlScheduler:
+    """Re-crawls each source once its serving generation is older than the source's interval_sec"""
+
+    def __init__(self, check_sec: float):
+        self.check_sec = check_sec
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def due(self) -> list:
+        now = time.time()
+        shards = []
+        for shard in corpus_shards.values():
+            interval = shard.source.interval_sec
+            if interval <= 0 or shard.status.get("status") == "running":
+                continue
+            # The generation is the build time, so a crawl published by another worker counts as well
+            last_crawl = max(shard.get().generation / 1000, shard.last_attempt)
+            if now - last_crawl >= interval:
+                shards.append(shard)
+        return shards
+
+    def run_once(self) -> list:
+        started = []
+        for shard in self.due():
+            try:
+                started.append(start_crawl_job("index", trigger="schedule", source=shard.name))
+            except CrawlAlreadyRunning:
+                # Another worker is crawling this source; its snapshot will be remapped here
+                pass
+        return started
+
+    def _loop(self):
+        while not self._stop.wait(self.check_sec):
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Crawl scheduler error: {e}")
+
+    def start(self):
+        scheduled = any(source.interval_sec > 0 for source in crawl_sources.values())
+        if not scheduled or self.check_sec <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="crawl-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+crawl_scheduler = CrawlScheduler(CRAWL_SCHEDULE_CHECK_SEC)
 
 # —— Content Extraction —— #
-def extract_content(soup: BeautifulSoup, base_url: str):
+def extract_content(soup: "BeautifulSoup", base_url: str):
+    from bs4 import Tag
+
     main_element = soup.find("main")
     main = main_element if main_element else soup
     texts = []
@@ -289,28 +2227,255 @@ def extract_content(soup: BeautifulSoup, base_url: str):
 
     return "\n\n".join(texts), images
 
-def is_internal_link(href: str) -> bool:
+def is_internal_link(href: str, netloc: str = ALLOWED_NETLOC) -> bool:
     if not href:
         return False
     parsed = urlparse(href)
-    return not parsed.netloc or parsed.netloc == ALLOWED_NETLOC
+    return not parsed.netloc or parsed.netloc == netloc
 
 def normalize_url(base: str, link: str) -> str:
-    return urljoin(base, link.split("#")[0])
+    return canonicalize_url(urljoin(base, link.split("#")[0]))
+
+def canonicalize_url(url: str) -> str:
+    """Lowercase scheme/host, drop default ports, index files, tracking params and sort the query"""
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme, netloc.rsplit(":", 1)[-1]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    path = re.sub(r"/{2,}", "/", parsed.path) or "/"
+    path = re.sub(r"/index\.html?$", "/", path)
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+        if k.lower() not in CRAWL_IGNORED_QUERY_PARAMS and not k.lower().startswith("utm_")
+    ))
+    return urlunparse((scheme, netloc, path, "", query, ""))
+
+def url_key(url: str) -> str:
+    """Dedupe key: the canonical URL with any trailing slash dropped, so /a and /a/ are one page"""
+    url = canonicalize_url(url)
+    parsed = urlparse(url)
+    if len(parsed.path) > 1 and parsed.path.endswith("/"):
+        url = urlunparse(parsed._replace(path=parsed.path.rstrip("/")))
+    return url
 
 def scrape_single(url: str):
-    resp = requests.get(url, timeout=10)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = fetch_html(url).soup()
     title = soup.title.string.strip() if soup.title and soup.title.string else url
     body, images = extract_content(soup, url)
     return {"url": url, "title": title, "body": body, "images": images}
 
 
+# —— LLM Circuit Breaker —— #
+# Errors and provider timeouts count as failures; calls slower than LLM_LATENCY_SLO_SEC are only
+# counted as "slow". When too many recent calls fail the breaker opens and answers are built from
+# the retrieved snippets instead; after LLM_BREAKER_OPEN_SEC one request probes OpenAI again and
+# closes it on success.
+class LLMUnavailable(Exception):
+    """The LLM call was refused by the open breaker, failed or ran past the deadline"""
+
+    def __init__(self, message: str, reason: str = "error"):
+        super().__init__(message)
+        self.reason = reason  # "not_configured", "breaker_open", "deadline" or "error"
+
+class CircuitBreaker:
+    """Failure-ratio breaker over the last window calls with closed/open/half_open states"""
+
+    STATES = ("closed", "half_open", "open")
+
+    def __init__(self, window: int, min_calls: int, failure_ratio: float, open_sec: float, name: str = "LLM"):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.open_sec = open_sec
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trips = 0
+        self._outcomes: deque = deque(maxlen=max(1, window))
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_sec:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                if ok:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                    logging.info(f"{self.name} circuit breaker closed")
+                else:
+                    self._open()
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (self.state == "closed" and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_ratio):
+                self._open()
+
+    def abandon(self):
+        """A call ended without a verdict on the provider (our own deadline); free the probe slot"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self._outcomes.clear()
+        logging.warning(f"{self.name} circuit breaker opened for {self.open_sec:.0f}s")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = self._outcomes.count(False)
+            retry_in = self.opened_at + self.open_sec - time.monotonic() if self.state == "open" else 0.0
+            return {
+                "state": self.state,
+                "recent_calls": calls,
+                "recent_failure_ratio": round(failures / calls, 3) if calls else 0.0,
+                "retry_in_sec": round(max(0.0, retry_in), 1),
+                "trips": self.trips
+            }
+
+llm_breaker = CircuitBreaker(LLM_BREAKER_WINDOW, LLM_BREAKER_MIN_CALLS, LLM_BREAKER_FAILURE_RATIO, LLM_BREAKER_OPEN_SEC)
+# Background FAQ builds trip and probe their own breaker, so a bulk build never opens the one live chats use
+faq_llm_breaker = CircuitBreaker(
+    LLM_BREAKER_WINDOW, LLM_BREAKER_MIN_CALLS, LLM_BREAKER_FAILURE_RATIO, LLM_BREAKER_OPEN_SEC, name="FAQ LLM")
+
+_llm_local = threading.local()
+
+@contextmanager
+def llm_deadline(seconds: float):
+    """Share one time budget between all call_llm calls made by this thread inside the block"""
+    _llm_local.deadline = time.monotonic() + seconds
+    try:
+        yield
+    finally:
+        _llm_local.deadline = None
+
+def llm_time_left() -> Optional[float]:
+    """Seconds left of the current llm_deadline, None outside one"""
+    deadline = getattr(_llm_local, "deadline", None)
+    return None if deadline is None else deadline - time.monotonic()
+
+def call_llm(call: str, timeout: float = LLM_TIMEOUT_SEC, latency_slo: float = LLM_LATENCY_SLO_SEC,
+             breaker: Optional[CircuitBreaker] = None, **kwargs):
+    """chat.completions.create through the breaker with a hard timeout; raises LLMUnavailable
+
+    Calls slower than latency_slo are counted as "slow" but are successes for the breaker. Inside
+    llm_deadline the timeout shrinks to the time left, and no call is made once less than
+    LLM_MIN_CALL_SEC remains; a call cut short by that budget is counted as "deadline", not as a
+    breaker failure. breaker defaults to llm_breaker, the one user-facing answers share.
+    """
+    breaker = breaker or llm_breaker
+    client = get_openai_client()
+    if not client:
+        raise LLMUnavailable("OpenAI API key not configured", "not_configured")
+    left = llm_time_left()
+    truncated = False
+    if left is not None:
+        if left < LLM_MIN_CALL_SEC:
+            LLM_CALLS.inc(call=call, result="deadline")
+            raise LLMUnavailable(f"webhook LLM budget spent ({max(0.0, left):.1f}s left)", "deadline")
+        truncated = left < timeout
+        timeout = min(timeout, left)
+    if not breaker.allow():
+        LLM_CALLS.inc(call=call, result="rejected")
+        raise LLMUnavailable("circuit breaker is open", "breaker_open")
+    started = time.perf_counter()
+    try:
+        with timed_stage(f"llm_{call}"):
+            response = client.with_options(timeout=timeout, max_retries=0).chat.completions.create(**kwargs)
+    except Exception as e:
+        if truncated and time.perf_counter() - started >= timeout:
+            # Ran into the webhook's budget, not the provider timeout: says nothing about OpenAI
+            breaker.abandon()
+            LLM_CALLS.inc(call=call, result="deadline")
+            raise LLMUnavailable(f"webhook LLM budget spent after {timeout:.1f}s", "deadline") from e
+        breaker.record(False)
+        LLM_CALLS.inc(call=call, result="error")
+        raise LLMUnavailable(str(e)) from e
+    breaker.record(True)
+    slow = time.perf_counter() - started > latency_slo
+    LLM_CALLS.inc(call=call, result="slow" if slow else "ok")
+    record_llm_usage(call, response)
+    return response
+
+class FallbackAnswer(str):
+    """An answer assembled from retrieved snippets because the LLM was unavailable"""
+
+def _trim_snippet(snippet: str) -> str:
+    # Snippets are character windows, so drop the words cut at either edge
+    words = snippet.split()
+    if len(words) > 4:
+        return "…" + " ".join(words[1:-1]) + "…"
+    return " ".join(words)
+
+def build_extractive_answer(search_results: Optional[list]) -> FallbackAnswer:
+    """Reply built locally from the top retrieved snippets and their links"""
+    if not search_results:
+        return FallbackAnswer(
+            "⚡ AI туслах түр ачаалалтай байгаа бөгөөд таны асуултад тохирох мэдээлэл баримт бичгээс олдсонгүй.\n\n"
+            f"📚 Баримт бичиг: {ROOT_URL}\n"
+            "Дэмжлэгийн багтай холбогдох бол имэйл хаягаа оруулна уу."
+        )
+    parts = ["⚡ AI туслах түр ачаалалтай байгаа тул баримт бичгээс олдсон холбогдох хэсгүүдийг хүргэж байна:"]
+    for result in search_results[:LLM_FALLBACK_RESULTS]:
+        parts.append(f"📄 {result['title']}\n{_trim_snippet(result['snippet'])}\n🔗 {result['url']}")
+    return FallbackAnswer("\n\n".join(parts))
+
 # —— AI Assistant Functions —— #
-def get_ai_response(user_message: str, conversation_id: int, context_data: Optional[list] = None):
-    """Enhanced AI response with better context awareness"""
+# Prompts are module constants so every request sends a byte-identical prefix (see get_ai_response)
+ANSWER_SYSTEM_PROMPT = """Та Cloud.mn-ийн баримт бичгийн талаар асуултад хариулдаг Монгол AI туслах юм.
+Хэрэглэгчтэй монгол хэлээр ярилцаарай. Хариултаа товч бөгөөд ойлгомжтой байлгаарай.
+
+ЭНГИЙН МЭНДЧИЛГЭЭНИЙ ТУХАЙ:
+Хэрэв хэрэглэгч энгийн мэндчилгээ хийж байвал (жишээ: "сайн байна уу", "сайн уу", "мэнд", "hello", "hi", "сайн уу байна", "hey", "sn bnu", "snu" гэх мэт), дараах байдлаар хариулаарай:
+
+"Сайн байна уу! 👋 Би Cloud.mn-ийн AI туслах юм. Танд хэрхэн туслах вэ?
+
+Би дараах зүйлсээр танд туслаж чадна:
+• 📚 Cloud.mn баримт бичгээс мэдээлэл хайх
+• ❓ Техникийн асуултад хариулах
+• 💬 Ерөнхий зөвлөгөө өгөх
+
+Асуултаа чөлөөтэй асуугаарай!"
+
+ЯРИЛЦЛАГА ДУУСГАХ ҮГИЙН ТУХАЙ:
+Хэрэв хэрэглэгч ярилцлагыг дуусгах үг хэлвэл (жишээ: "баярлалаа", "zaa bayrlalaa", "баярлаа", "баяртай", "баяртай бна", "thanks", "thank you", "bye", "баяртай" гэх мэт), дараах байдлаар хариулаарай:
+
+"Баярлалаа! 😊.
+
+Хэрэв дахин асуулт гарвал чөлөөтэй холбогдоорой. Амжилт хүсье! 👋"
+
+Хариулахдаа дараах зүйлсийг анхаарна уу:
+1. Хариултаа холбогдох баримт бичгийн линкээр дэмжүүлээрэй
+2. Хэрэв ойлгомжгүй бол тодорхой асууна уу
+3. Хариултаа бүтэцтэй, цэгцтэй байлгаарай
+4. Техникийн нэр томъёог монгол хэлээр тайлбарлаарай
+
+Хэрэглэгчийн хүсэлтийг автоматаар таньж, дараах үйлдлүүдийг хийх боломжтой:
+- Хэрэглэгч мэдээлэл хайхыг хүсвэл, холбогдох мэдээллийг хайж олж хариулна
+- Хэрэглэгч тодорхой хуудсыг шүүрдэхийг хүсвэл, тухайн хуудсыг шүүрдэж хариулна
+- Хэрэглэгч тусламж хүсвэл, боломжтой үйлдлүүдийн талаар тайлбарлана
+- Хэрэглэгч бүх сайтыг шүүрдэхийг хүсвэл, шүүрдэлтийг эхлүүлнэ"""
+
+def get_ai_response(user_message: str, conversation_id: int, context_data: Optional[list] = None,
+                    search_results: Optional[list] = None):
+    """Enhanced AI response with better context awareness; pass search_results to reuse a retrieval"""
     
+    client = get_openai_client()
     if not client:
         return "🔑 OpenAI API түлхүүр тохируулагдаагүй байна. Админтай холбогдоно уу."
     
@@ -318,63 +2483,18 @@ def get_ai_response(user_message: str, conversation_id: int, context_data: Optio
     history = conversation_memory.get(conversation_id, [])
     
     # Build context from crawled data if available
-    context = ""
-    if crawled_data:
+    if search_results is None:
         # Search for relevant content
         search_results = search_in_crawled_data(user_message, max_results=3)
-        if search_results:
-            relevant_pages = []
-            for result in search_results:
-                relevant_pages.append(
-                    f"Хуудас: {result['title']}\n"
-                    f"URL: {result['url']}\n"
-                    f"Холбогдох агуулга: {result['snippet']}\n"
-                )
-            context = "\n\n".join(relevant_pages)
-    
-    # Build system message with context
-    system_content = """Та Cloud.mn-ийн баримт бичгийн талаар асуултад хариулдаг Монгол AI туслах юм. 
-    Хэрэглэгчтэй монгол хэлээр ярилцаарай. Хариултаа товч бөгөөд ойлгомжтой байлгаарай.
-    
-    ЭНГИЙН МЭНДЧИЛГЭЭНИЙ ТУХАЙ:
-    Хэрэв хэрэглэгч энгийн мэндчилгээ хийж байвал (жишээ: "сайн байна уу", "сайн уу", "мэнд", "hello", "hi", "сайн уу байна", "hey", "sn bnu", "snu" гэх мэт), дараах байдлаар хариулаарай:
-    
-    "Сайн байна уу! 👋 Би Cloud.mn-ийн AI туслах юм. Танд хэрхэн туслах вэ?
-    
-    Би дараах зүйлсээр танд туслаж чадна:
-    • 📚 Cloud.mn баримт бичгээс мэдээлэл хайх
-    • ❓ Техникийн асуултад хариулах  
-    • 💬 Ерөнхий зөвлөгөө өгөх
-    
-    Асуултаа чөлөөтэй асуугаарай!"
-    
-    ЯРИЛЦЛАГА ДУУСГАХ ҮГИЙН ТУХАЙ:
-    Хэрэв хэрэглэгч ярилцлагыг дуусгах үг хэлвэл (жишээ: "баярлалаа", "zaa bayrlalaa", "баярлаа", "баяртай", "баяртай бна", "thanks", "thank you", "bye", "баяртай" гэх мэт), дараах байдлаар хариулаарай:
-    
-    "Баярлалаа! 😊. 
+    context = build_context(search_results)
     
-    Хэрэв дахин асуулт гарвал чөлөөтэй холбогдоорой. Амжилт хүсье! 👋"
     
-    Хариулахдаа дараах зүйлсийг анхаарна уу:
-    1. Хариултаа холбогдох баримт бичгийн линкээр дэмжүүлээрэй
-    2. Хэрэв ойлгомжгүй бол тодорхой асууна уу
-    3. Хариултаа бүтэцтэй, цэгцтэй байлгаарай
-    4. Техникийн нэр томъёог монгол хэлээр тайлбарлаарай
-    
-    Хэрэглэгчийн хүсэлтийг автоматаар таньж, дараах үйлдлүүдийг хийх боломжтой:
-    - Хэрэглэгч мэдээлэл хайхыг хүсвэл, холбогдох мэдээллийг хайж олж хариулна
-    - Хэрэглэгч тодорхой хуудсыг шүүрдэхийг хүсвэл, тухайн хуудсыг шүүрдэж хариулна
-    - Хэрэглэгч тусламж хүсвэл, боломжтой үйлдлүүдийн талаар тайлбарлана
-    - Хэрэглэгч бүх сайтыг шүүрдэхийг хүсвэл, шүүрдэлтийг эхлүүлнэ"""
-    
-    if context:
-        system_content += f"\n\nКонтекст мэдээлэл:\n{context}"
-    
-    # Build conversation context
+    # The static instructions come first and never change, so the provider can serve them from its
+    # prompt prefix cache; everything that varies per turn follows them
     messages = [
         {
             "role": "system", 
-            "content": system_content
+            "content": ANSWER_SYSTEM_PROMPT
         }
     ]
     
@@ -382,73 +2502,132 @@ def get_ai_response(user_message: str, conversation_id: int, context_data: Optio
     for msg in history[-4:]:  # Last 4 messages
         messages.append(msg)
     
+    if context:
+        messages.append({"role": "system", "content": f"Контекст мэдээлэл:\n{context}"})
+    
     # Add current message
     messages.append({"role": "user", "content": user_message})
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,  # type: ignore
+        response = call_llm(
+            "answer",
+            model=OPENAI_MODEL,
+            messages=messages,
             max_tokens=500,  # Increased token limit for better responses
             temperature=0.7
         )
-        
         ai_response = response.choices[0].message.content
-        
-        # Store in memory
-        if conversation_id not in conversation_memory:
-            conversation_memory[conversation_id] = []
-        
-        conversation_memory[conversation_id].append({"role": "user", "content": user_message})
-        conversation_memory[conversation_id].append({"role": "assistant", "content": ai_response or ""})
-        
-        # Keep only last 8 messages
-        if len(conversation_memory[conversation_id]) > 8:
-            conversation_memory[conversation_id] = conversation_memory[conversation_id][-8:]
-            
+        remember_exchange(conversation_id, user_message, ai_response or "")
         return ai_response or "Хариулт авахад алдаа гарлаа."
         
-    except Exception as e:
-        logging.error(f"OpenAI API алдаа: {e}")
-        return f"🔧 AI-тай холбогдоход саад гарлаа. Дараах зүйлсийг туршиж үзнэ үү:\n• Асуултаа дахин илгээнэ үү\n• Асуултаа тодорхой болгоно уу\n• Холбогдох мэдээллийг хайж үзнэ үү\n\nАлдааны дэлгэрэнгүй: {str(e)[:100]}"
+    except LLMUnavailable as e:
+        # Slow or failing OpenAI: answer from the retrieved documentation instead of an error text
+        logging.error(f"OpenAI API алдаа, баримт бичгээс хариулж байна: {e}")
+        LLM_FALLBACKS.inc(reason=e.reason)
+        fallback = build_extractive_answer(search_results)
+        remember_exchange(conversation_id, user_message, fallback)
+        return fallback
 
-def search_in_crawled_data(query: str, max_results: int = 3):
-    """Simple search through crawled data"""
-    if not crawled_data:
+def build_context(search_results: Optional[list]) -> str:
+    """Retrieved pages formatted for the system prompt"""
+    relevant_pages = []
+    for result in search_results or []:
+        relevant_pages.append(
+            f"Хуудас: {result['title']}\n"
+            f"URL: {result['url']}\n"
+            f"Холбогдох агуулга: {result['snippet']}\n"
+        )
+    return "\n\n".join(relevant_pages)
+
+def remember_exchange(conversation_id: int, user_message: str, reply: str):
+    """Store a question/answer pair in the conversation memory"""
+    if conversation_id not in conversation_memory:
+        conversation_memory[conversation_id] = []
+    
+    conversation_memory[conversation_id].append({"role": "user", "content": user_message})
+    conversation_memory[conversation_id].append({"role": "assistant", "content": reply})
+    
+    # Keep only last 8 messages
+    if len(conversation_memory[conversation_id]) > 8:
+        conversation_memory[conversation_id] = conversation_memory[conversation_id][-8:]
+
+# Shard-уудыг зэрэг хайна; ганц shard бол thread-гүйгээр шууд
+search_pool = ThreadPoolExecutor(max_workers=max(1, SEARCH_FANOUT_WORKERS), thread_name_prefix="search")
+
+def search_in_crawled_data(query: str, max_results: int = 3, sources: Optional[list] = None):
+    """Search every shard (or only the named sources) and merge the best matches"""
+    shards = [shard for name, shard in corpus_shards.items() if sources is None or name in sources]
+    parts = [(shard, shard.get()) for shard in shards]
+    parts = [(shard, corpus) for shard, corpus in parts if len(corpus)]
+    if not parts:
         return []
     
+    with timed_stage("retrieval"):
+        if len(parts) == 1:
+            return _search_shard(*parts[0], query, max_results)
+        futures = [search_pool.submit(attach_trace(_search_shard), shard, corpus, query, max_results)
+                   for shard, corpus in parts]
+        return merge_search_results([future.result() for future in futures], max_results)
+
+def _search_shard(shard: CorpusShard, corpus, query: str, max_results: int) -> list:
+    limit = min(max_results, shard.source.max_results) if shard.source.max_results else max_results
+    with trace_span("retrieval_shard", source=shard.name):
+        results = _search_pages(corpus, query, limit)
+    for result in results:
+        result["source"] = shard.name
+    return results
+
+# /api/search-ийн хариунд гарах талбарууд (score, source нь зөвхөн дотоод нэгтгэлд)
+SEARCH_RESULT_FIELDS = ("title", "url", "snippet")
+
+def merge_search_results(per_shard: list, max_results: int) -> list:
+    """Best-scoring results across shards; ties keep source order and each shard's own order"""
+    ranked = [
+        (-result["score"], shard_index, rank, result)
+        for shard_index, results in enumerate(per_shard)
+        for rank, result in enumerate(results)
+    ]
+    ranked.sort(key=lambda item: item[:3])
+    return [result for *_, result in ranked[:max_results]]
+
+def _page_snippet(page: CorpusPage, words: list) -> str:
+    """Longest window of -100/+200 characters around a query word, as the plain-text search did"""
+    best, best_len = None, 0
+    for word in words:
+        pos = page.find(word)
+        if pos < 0:
+            continue
+        # Decode a byte window wide enough for the character window even with 4-byte characters
+        window_start, window_end = pos - SNIPPET_BEFORE * 4, pos + SNIPPET_AFTER * 4
+        window = page.text_window(window_start, window_end)
+        offset = window.find(word.decode("utf-8"))
+        lo, hi = max(0, offset - SNIPPET_BEFORE), offset + SNIPPET_AFTER
+        if len(window[lo:hi]) > best_len:
+            best, best_len = (window_start, window_end, lo, hi), len(window[lo:hi])
+    # Matching runs on the lowercased text; only the chosen window gets its letter case back
+    if best:
+        window_start, window_end, lo, hi = best
+        return page.cased_window(window_start, window_end)[lo:hi]
+    head = page.cased_window(0, SNIPPET_DEFAULT * 4 + 4)
+    return head[:SNIPPET_DEFAULT] + "..." if len(head) > SNIPPET_DEFAULT else head
+
+def _search_pages(corpus, query: str, max_results: int):
     query_lower = query.lower()
+    needle = query_lower.encode("utf-8")
+    words = [word.encode("utf-8") for word in query_lower.split()]
     results = []
     
-    for page in crawled_data:
-        title = page['title'].lower()
-        body = page['body'].lower()
-        
+    for page in corpus:
         # Check if query matches in title or body
-        if (query_lower in title or 
-            query_lower in body or 
-            any(word in title or word in body for word in query_lower.split())):
-            
-            # Find the most relevant snippet
-            query_words = query_lower.split()
-            best_snippet = ""
-            max_context = 300
-            
-            for word in query_words:
-                if word in body.lower():
-                    start = max(0, body.lower().find(word) - 100)
-                    end = min(len(body), body.lower().find(word) + 200)
-                    snippet = body[start:end]
-                    if len(snippet) > len(best_snippet):
-                        best_snippet = snippet
-            
-            if not best_snippet:
-                best_snippet = body[:max_context] + "..." if len(body) > max_context else body
+        if page.matches(needle) or any(page.matches(word) for word in words):
+            best_snippet = _page_snippet(page, words)
                 
             results.append({
-                'title': page['title'],
-                'url': page['url'],
-                'snippet': best_snippet
+                'title': page.title,
+                'url': page.url,
+                'snippet': best_snippet,
+                # Matched query words, plus the whole phrase; only used to merge shards
+                'score': sum(1 for word in words if page.matches(word)) + int(page.matches(needle))
             })
             
             # Stop when we have enough results
@@ -457,14 +2636,256 @@ def search_in_crawled_data(query: str, max_results: int = 3):
             
     return results
 
-# def scrape_single(url: str):
-#     resp = requests.get(url, timeout=10)
-#     resp.raise_for_status()
-#     soup = BeautifulSoup(resp.text, "html.parser")
-#     title = soup.title.string.strip() if soup.title else url
-#     body, images = extract_content(soup, url)
-#     return {"url": url, "title": title, "body": body, "images": images}
+# def scrape_single(url: str):
+#     resp = requests.get(url, timeout=10)
+#     resp.raise_for_status()
+#     soup = BeautifulSoup(resp.text, "html.parser")
+#     title = soup.title.string.strip() if soup.title else url
+#     body, images = extract_content(soup, url)
+#     return {"url": url, "title": title, "body": body, "images": images}
+
+
+# —— FAQ Answer Index —— #
+# After each crawl the LLM writes a few likely questions with grounded answers for every page. The
+# webhook answers close matches from this index without a live LLM call. Pages are keyed by a hash
+# of their content, so a rebuild only calls the LLM for pages that are new or changed.
+FAQ_SYSTEM_PROMPT = """Та Cloud.mn-ийн баримт бичгийн хуудаснаас хэрэглэгчдийн хамгийн их асуух асуултуудыг гаргадаг.
+Зөвхөн өгөгдсөн хуудасны агуулгад үндэслэн асуулт бүрт товч, үнэн зөв хариулт бичээрэй.
+Асуулт бүрийг кирилл монголоор болон латин галигаар (жишээ: "сервер яаж үүсгэх вэ" / "server yaj uusgeh ve") бичнэ.
+Хуудсанд хариулт өгөх хангалттай мэдээлэл байхгүй бол хоосон жагсаалт буцаа.
+Зөвхөн дараах JSON-г буцаа:
+{"faqs": [{"questions": ["...", "..."], "answer": "..."}]}"""
+
+def _faq_grams(text: str) -> frozenset:
+    """Character trigrams of each word; tolerant of Mongolian suffixes and small spelling differences"""
+    grams = set()
+    for word in re.findall(r"\w+", text.lower()):
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+class FaqIndex:
+    """Generated question/answer pairs per page with a trigram posting list for matching"""
+
+    def __init__(self, pages: Optional[dict] = None, generation: int = 0):
+        self.pages = pages or {}  # url -> {"hash", "title", "entries": [{"questions", "answer"}]}
+        self.generation = generation
+        self.signature: Optional[tuple] = None
+        self._questions: list = []  # (grams, question, entry, url)
+        self._postings: Dict[str, list] = {}
+        for url, page in self.pages.items():
+            for entry in page["entries"]:
+                for question in entry["questions"]:
+                    grams = _faq_grams(question)
+                    if not grams:
+                        continue
+                    for gram in grams:
+                        self._postings.setdefault(gram, []).append(len(self._questions))
+                    self._questions.append((grams, question, entry, url))
+
+    def __len__(self) -> int:
+        return sum(len(page["entries"]) for page in self.pages.values())
+
+    def match(self, text: str, threshold: float) -> Optional[dict]:
+        """Best entry whose question has a Dice trigram similarity of at least threshold"""
+        grams = _faq_grams(text)
+        if len(grams) < FAQ_MIN_QUERY_GRAMS:
+            return None
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for i in self._postings.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        best, best_score = None, 0.0
+        for i, count in shared.items():
+            score = 2 * count / (len(grams) + len(self._questions[i][0]))
+            if score > best_score:
+                best, best_score = i, score
+        if best is None or best_score < threshold:
+            return None
+        _, question, entry, url = self._questions[best]
+        return {
+            "question": question,
+            "answer": entry["answer"],
+            "url": url,
+            "title": self.pages[url]["title"],
+            "score": round(best_score, 3)
+        }
+
+    def info(self) -> dict:
+        return {
+            "generation": self.generation,
+            "pages": len(self.pages),
+            "entries": len(self),
+            "questions": len(self._questions)
+        }
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"generation": self.generation, "pages": self.pages}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FaqIndex":
+        signature = _snapshot_signature(path)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data.get("pages") or {}, data.get("generation", 0))
+        index.signature = signature
+        return index
+
+def page_content_hash(title: str, body: str) -> str:
+    return hashlib.blake2b(f"{title}\n{body}".encode("utf-8"), digest_size=16).hexdigest()
+
+def parse_faq_entries(content: str) -> Optional[list]:
+    """Entries from the model's JSON reply; None if the reply is not usable"""
+    start, end = content.find("{"), content.rfind("}")
+    try:
+        data = json.loads(content[start:end + 1]) if start != -1 else None
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or not isinstance(data.get("faqs"), list):
+        return None
+    entries = []
+    for item in data["faqs"][:FAQ_QUESTIONS_PER_PAGE]:
+        if not isinstance(item, dict):
+            continue
+        questions = [q.strip() for q in item.get("questions") or [] if isinstance(q, str) and q.strip()]
+        answer = str(item.get("answer") or "").strip()
+        if questions and answer:
+            entries.append({"questions": questions[:4], "answer": answer})
+    return entries
+
+def generate_faq_entries(title: str, url: str, body: str) -> Optional[list]:
+    try:
+        # Background work: its own breaker and a longer timeout than user-facing answers
+        response = call_llm(
+            "faq",
+            timeout=FAQ_LLM_TIMEOUT_SEC,
+            latency_slo=FAQ_LLM_TIMEOUT_SEC,
+            breaker=faq_llm_breaker,
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": FAQ_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Хуудас: {title}\nURL: {url}\n\n{body[:FAQ_PAGE_CHARS]}"}
+            ],  # type: ignore
+            max_tokens=800,
+            temperature=0.2
+        )
+    except LLMUnavailable as e:
+        logging.warning(f"FAQ generation failed for {url}: {e}")
+        return None
+    return parse_faq_entries(response.choices[0].message.content or "")
+
+def build_faq_index(corpus, previous: FaqIndex) -> FaqIndex:
+    """FAQ index for corpus, reusing previous entries of pages whose content hash is unchanged"""
+    pages, changed = {}, []
+    for page in corpus:
+        url, title, body = page.url, page.title, page.decompress_body()
+        digest = page_content_hash(title, body)
+        old = previous.pages.get(url)
+        if old and old["hash"] == digest:
+            pages[url] = old
+            FAQ_PAGES.inc(result="reused")
+        else:
+            changed.append((url, title, body, digest))
+
+    def generate(item):
+        url, title, body, _ = item
+        return generate_faq_entries(title, url, body)
 
+    with ThreadPoolExecutor(max_workers=max(1, FAQ_BUILD_WORKERS), thread_name_prefix="faq-generate") as pool:
+        for (url, title, _, digest), entries in zip(changed, pool.map(generate, changed)):
+            if entries is None:
+                # Left out without a hash so the next build tries again
+                FAQ_PAGES.inc(result="failed")
+                continue
+            pages[url] = {"hash": digest, "title": title, "entries": entries}
+            FAQ_PAGES.inc(result="generated")
+    return FaqIndex(pages, corpus.generation)
+
+faq_index = FaqIndex()
+faq_status = {"status": "not_started"}
+# One build at a time; a crawl finishing during a build queues the next one behind it
+faq_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="faq-build")
+_next_faq_check = 0.0
+_faq_reload_lock = threading.Lock()
+# Workers take turns building; the ones that waited load the index the first one wrote
+faq_build_lock = CrawlLock(f"{FAQ_INDEX_PATH}.lock") if FAQ_INDEX_PATH else None
+
+def get_faq_index(force: bool = False) -> FaqIndex:
+    """Current FAQ index; reloads when another worker has written a newer file (force: check now)"""
+    global faq_index, _next_faq_check
+    if not FAQ_INDEX_PATH or (not force and time.monotonic() < _next_faq_check):
+        return faq_index
+    if not _faq_reload_lock.acquire(blocking=force):
+        return faq_index
+    try:
+        _next_faq_check = time.monotonic() + CORPUS_REMAP_CHECK_SEC
+        signature = _snapshot_signature(FAQ_INDEX_PATH)
+        if signature and signature != faq_index.signature:
+            try:
+                faq_index = FaqIndex.load(FAQ_INDEX_PATH)
+                logging.info(f"Loaded FAQ index generation {faq_index.generation} ({len(faq_index)} entries)")
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Failed to load FAQ index: {e}")
+    finally:
+        _faq_reload_lock.release()
+    return faq_index
+
+def schedule_faq_build(corpus):
+    """Queue a FAQ rebuild for a newly served corpus"""
+    if not FAQ_ENABLED or not OPENAI_API_KEY or not len(corpus):
+        return None
+    return faq_pool.submit(_run_faq_build, corpus)
+
+def _run_faq_build(corpus):
+    global faq_index, faq_status
+    owner = uuid.uuid4().hex[:12]
+    if faq_build_lock:
+        faq_status = {"status": "waiting", "generation": corpus.generation, "holder": faq_build_lock.holder()}
+        faq_build_lock.acquire(owner, blocking=True)
+    started = time.time()
+    try:
+        previous = get_faq_index(force=True)
+        if len(previous) and previous.generation == corpus.generation:
+            # Another worker built this generation while we waited for the lock
+            faq_status = {"status": "completed", "generation": previous.generation, "loaded": True,
+                          "timestamp": datetime.now().isoformat()}
+            logging.info(f"FAQ index for generation {previous.generation} was built by another worker")
+            return
+        faq_status = {"status": "running", "generation": corpus.generation, "started_at": datetime.now().isoformat()}
+        index = build_faq_index(corpus, previous)
+        if FAQ_INDEX_PATH:
+            index.save(FAQ_INDEX_PATH)
+            index.signature = _snapshot_signature(FAQ_INDEX_PATH)
+        faq_index = index
+        faq_status = {
+            "status": "completed",
+            "generation": index.generation,
+            "duration_sec": round(time.time() - started, 2),
+            "timestamp": datetime.now().isoformat()
+        }
+        logging.info(f"FAQ index built for generation {index.generation}: {index.info()}")
+    except Exception as e:
+        faq_status = {"status": "error", "message": str(e), "generation": corpus.generation}
+        logging.error(f"FAQ index build failed: {e}")
+    finally:
+        if faq_build_lock:
+            faq_build_lock.release()
+
+def match_faq(text: str) -> Optional[dict]:
+    """High-confidence precomputed answer for a question, if any"""
+    if not FAQ_ENABLED:
+        return None
+    index = get_faq_index()
+    if not len(index):
+        return None
+    hit = index.match(text, FAQ_MATCH_THRESHOLD)
+    CACHE_REQUESTS.inc(cache="faq", result="hit" if hit else "miss")
+    return hit
 
 # —— Enhanced Chatwoot Integration —— #
 def send_to_chatwoot(conv_id: int, content: str, message_type: str = "outgoing"):
@@ -484,8 +2905,9 @@ def send_to_chatwoot(conv_id: int, content: str, message_type: str = "outgoing")
     }
     
     try:
-        resp = requests.post(api_url, json=payload, headers=headers, timeout=10)
-        resp.raise_for_status()
+        with timed_stage("chatwoot_send"):
+            resp = requests.post(api_url, json=payload, headers=headers, timeout=10)
+            resp.raise_for_status()
         logging.info(f"Message sent to conversation {conv_id}")
         return True
     except Exception as e:
@@ -498,8 +2920,9 @@ def get_conversation_info(conv_id: int):
     headers = {"api_access_token": CHATWOOT_API_KEY}
     
     try:
-        resp = requests.get(api_url, headers=headers, timeout=10)
-        resp.raise_for_status()
+        with timed_stage("assignment_lookup"):
+            resp = requests.get(api_url, headers=headers, timeout=10)
+            resp.raise_for_status()
         return resp.json()
     except Exception as e:
         logging.error(f"Failed to get conversation info: {e}")
@@ -512,8 +2935,9 @@ def mark_conversation_resolved(conv_id: int):
     payload = {"status": "resolved"}
     
     try:
-        resp = requests.post(api_url, json=payload, headers=headers, timeout=10)
-        resp.raise_for_status()
+        with timed_stage("chatwoot_resolve"):
+            resp = requests.post(api_url, json=payload, headers=headers, timeout=10)
+            resp.raise_for_status()
         return True
     except Exception as e:
         logging.error(f"Failed to mark conversation as resolved: {e}")
@@ -565,13 +2989,14 @@ def send_to_teams(email: str, issue: str, conv_id: Optional[int] = None) -> bool
     }
     
     try:
-        response = requests.post(
-            TEAMS_WEBHOOK_URL,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        response.raise_for_status()
+        with timed_stage("teams_send"):
+            response = requests.post(
+                TEAMS_WEBHOOK_URL,
+                json=payload,
+                headers={"Content-Type": "application/json"},
+                timeout=10
+            )
+            response.raise_for_status()
         logging.info(f"Issue sent to Teams for {email} with conv link: {chatwoot_link}")
         return True
     except Exception as e:
@@ -579,6 +3004,85 @@ def send_to_teams(email: str, issue: str, conv_id: Optional[int] = None) -> bool
         return False
 
 
+# —— Corpus Export —— #
+# Consumers that sync the corpus page through it with a cursor or stream it as NDJSON. Records are
+# produced one page at a time and only the requested fields are decoded, so an export holds one
+# page in memory however large the corpus is.
+EXPORT_FIELDS = ("url", "title", "body", "images")
+EXPORT_MAX_LIMIT = 200
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+class ExportError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+def parse_export_fields(raw: Optional[str]) -> tuple:
+    """?fields=url,title -> ("url", "title"); all fields when not given"""
+    if not raw:
+        return EXPORT_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in EXPORT_FIELDS]
+    if unknown or not fields:
+        raise ExportError(f"Unknown fields {unknown}; choose from {', '.join(EXPORT_FIELDS)}")
+    return fields
+
+def project_record(record: dict, fields: tuple) -> dict:
+    return {field: record.get(field) for field in fields}
+
+def parse_corpus_cursor(raw: Optional[str], corpus) -> int:
+    """Offset from a "<generation>:<offset>" cursor; plain offsets refer to the serving generation"""
+    if not raw:
+        return 0
+    generation, _, offset = raw.rpartition(":")
+    try:
+        position = int(offset)
+        if generation and int(generation) != corpus.generation:
+            raise ExportError("Corpus changed since this cursor was issued; restart from the beginning", 409)
+    except ValueError:
+        raise ExportError("Invalid cursor")
+    return max(0, position)
+
+def corpus_cursor(corpus, position: int) -> Optional[str]:
+    return f"{corpus.generation}:{position}" if position < len(corpus) else None
+
+def export_limit(default: int) -> int:
+    return min(max(1, request.args.get("limit", default, type=int)), EXPORT_MAX_LIMIT)
+
+def wants_ndjson() -> bool:
+    return (request.args.get("format") == "ndjson"
+            or request.accept_mimetypes.best == "application/x-ndjson")
+
+def _ndjson_chunks(records):
+    buffer, size = [], 0
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def ndjson_response(records, headers: Optional[dict] = None) -> Response:
+    """Stream records as NDJSON, gzip-compressed when the client accepts it"""
+    chunks = _ndjson_chunks(records)
+    response_headers = dict(headers or {})
+    response_headers["Vary"] = "Accept-Encoding"
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        chunks = _gzip_chunks(chunks)
+        response_headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(chunks), mimetype="application/x-ndjson", headers=response_headers)
+
 # —— API Endpoints —— #
 @app.route("/api/scrape", methods=["POST"])
 def api_scrape():
@@ -589,22 +3093,356 @@ def api_scrape():
     try:
         page = scrape_single(url)
         return jsonify(page)
+    except FetchSkipped as e:
+        return jsonify({"error": str(e), "reason": e.reason}), 422
     except Exception as e:
         return jsonify({"error": f"Fetch/Scrape failed: {e}"}), 502
 
+def requested_source() -> Optional[str]:
+    """Source named by ?source= or a JSON "source" field; raises KeyError for an unknown one"""
+    data = request.get_json(silent=True) if request.is_json else None
+    name = request.args.get("source") or (data or {}).get("source")
+    if name is not None and name not in corpus_shards:
+        raise KeyError(name)
+    return name
+
+def unknown_source_response(e: KeyError):
+    return jsonify({"error": f"Unknown source {e.args[0]!r}", "sources": list(corpus_shards)}), 404
+
+def _start_crawl_response(kind: str):
+    try:
+        job = start_crawl_job(kind, source=requested_source())
+    except KeyError as e:
+        return unknown_source_response(e)
+    except CrawlAlreadyRunning as e:
+        return jsonify({"error": "Crawl is already running", "holder": e.holder}), 409
+    return jsonify({
+        "status": "accepted",
+        "job_id": job.job_id,
+        "job_url": f"/api/crawl/jobs/{job.job_id}",
+        "results_url": f"/api/crawl/jobs/{job.job_id}/results"
+    }), 202
+
 @app.route("/api/crawl", methods=["POST"])
 def api_crawl():
-    pages = crawl_and_scrape(ROOT_URL)
-    return jsonify(pages)
+    """Start a background crawl whose pages are fetched from the job results endpoint"""
+    return _start_crawl_response("export")
+
+@app.route("/api/crawl/jobs", methods=["GET"])
+def list_crawl_jobs():
+    """Crawl jobs started by any worker plus the current lock holders"""
+    return jsonify({
+        "jobs": crawl_job_store.list(),
+        "lock_holder": crawl_lock.holder(),
+        "lock_holders": {name: lock.holder() for name, lock in crawl_locks.items()}
+    })
+
+def _crawl_job_state(job_id: str) -> Optional[dict]:
+    # A job running in this worker reports live counters; others come from the shared store
+    job = crawl_jobs.get(job_id)
+    return job.to_dict() if job else crawl_job_store.get(job_id)
+
+@app.route("/api/crawl/jobs/<job_id>", methods=["GET"])
+def get_crawl_job(job_id):
+    """Progress of a crawl job"""
+    state = _crawl_job_state(job_id)
+    if not state:
+        return jsonify({"error": "Crawl job not found", "lock_holder": crawl_lock.holder()}), 404
+    return jsonify(state)
+
+@app.route("/api/crawl/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_crawl_job(job_id):
+    """Ask a running crawl job to stop after the current page, whichever worker runs it"""
+    state = _crawl_job_state(job_id)
+    if not state:
+        return jsonify({"error": "Crawl job not found"}), 404
+    if state["status"] in ("queued", "running"):
+        crawl_job_store.request_cancel(job_id)
+        job = crawl_jobs.get(job_id)
+        if job:
+            job.cancel_requested.set()
+        state["cancel_requested"] = True
+    return jsonify(state)
+
+@app.route("/api/crawl/jobs/<job_id>/results", methods=["GET"])
+def get_crawl_job_results(job_id):
+    """Page through a crawl job's results with ?cursor=&limit="""
+    state = _crawl_job_state(job_id)
+    if not state:
+        return jsonify({"error": "Crawl job not found"}), 404
+    try:
+        fields = parse_export_fields(request.args.get("fields"))
+    except ExportError as e:
+        return jsonify({"error": str(e)}), e.status
+    cursor = max(0, request.args.get("cursor", 0, type=int))
+    total = state["results_count"]
+    if wants_ndjson():
+        records = (project_record(page, fields) for page in crawl_job_store.results(job_id, cursor))
+        return ndjson_response(records, {"X-Total-Count": str(total)})
+    limit = export_limit(20)
+    pages = [project_record(page, fields) for page in crawl_job_store.results(job_id, cursor, cursor + limit)]
+    next_cursor = cursor + len(pages)
+    return jsonify({
+        "job_id": job_id,
+        "status": state["status"],
+        "total": total,
+        "cursor": cursor,
+        "next_cursor": next_cursor if next_cursor < total else None,
+        "data": pages
+    })
+
+
+# —— Webhook Idempotency —— #
+class MessageDeduper:
+    """Time-windowed, bounded set of webhook message keys already taken by a worker.
 
+    claim() is atomic: exactly one caller gets True for a key inside the window. With a db_path
+    the set lives in SQLite so every gunicorn worker on the host shares it; otherwise it is an
+    in-process LRU.
+    """
+
+    def __init__(self, window_sec: float, max_ids: int, db_path: Optional[str] = None):
+        self.window_sec = window_sec
+        self.max_ids = max_ids
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._seen: OrderedDict = OrderedDict()
+        self._local = threading.local()
+        self._claims = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread and process; a connection must not cross a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)  # type: ignore
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS webhook_seen (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS webhook_seen_at ON webhook_seen (seen_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def claim(self, key: str) -> bool:
+        now = time.time()
+        cutoff = now - self.window_sec
+        if self.db_path:
+            try:
+                conn = self._connect()
+                conn.execute("DELETE FROM webhook_seen WHERE key = ? AND seen_at < ?", (key, cutoff))
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO webhook_seen (key, seen_at) VALUES (?, ?)", (key, now)).rowcount == 1
+                with self._lock:
+                    self._claims += 1
+                    prune = self._claims % 500 == 0
+                if prune:
+                    conn.execute("DELETE FROM webhook_seen WHERE seen_at < ?", (cutoff,))
+                    conn.execute(
+                        "DELETE FROM webhook_seen WHERE key IN "
+                        "(SELECT key FROM webhook_seen ORDER BY seen_at DESC LIMIT -1 OFFSET ?)", (self.max_ids,))
+                return inserted
+            except sqlite3.Error as e:
+                # Fail open: a duplicate reply is better than dropping a customer's message
+                logging.warning(f"Webhook dedup store unavailable, processing anyway: {e}")
+                return True
+        with self._lock:
+            while self._seen and (next(iter(self._seen.values())) < cutoff or len(self._seen) >= self.max_ids):
+                self._seen.popitem(last=False)
+            if key in self._seen:
+                return False
+            self._seen[key] = now
+            return True
+
+    def release(self, key: str):
+        """Forget a key whose processing failed so Chatwoot's retry is handled"""
+        if self.db_path:
+            try:
+                self._connect().execute("DELETE FROM webhook_seen WHERE key = ?", (key,))
+            except sqlite3.Error as e:
+                logging.warning(f"Failed to release webhook dedup key {key}: {e}")
+            return
+        with self._lock:
+            self._seen.pop(key, None)
+
+webhook_deduper = MessageDeduper(WEBHOOK_DEDUP_WINDOW_SEC, WEBHOOK_DEDUP_MAX_IDS, WEBHOOK_DEDUP_DB)
+
+def webhook_dedup_key(data: dict) -> Optional[str]:
+    """Account-scoped Chatwoot message ID of an incoming message, if it has one"""
+    message_id = data.get("id")
+    if data.get("message_type") != "incoming" or message_id is None:
+        return None
+    account = (data.get("account") or {}).get("id") or ACCOUNT_ID
+    return f"{account}:{message_id}"
+
+# —— Message Coalescing —— #
+CONFIRM_WORDS = ('tiim', 'тийм', 'yes', 'y')
+REJECT_WORDS = ('ugui', 'үгүй', 'no', 'n')
+
+# A message ending in one of these continues in the next message
+CONTINUATION_ENDINGS = (",", ":", ";", "-", "–", "—", "(", "...", "…", "+", "&")
+CONTINUATION_WORDS = (
+    'ба', 'болон', 'мөн', 'гэхдээ', 'гэвч', 'харин', 'эсвэл', 'буюу', 'тэгээд', 'бас',
+    'ba', 'bolon', 'mun', 'gehdee', 'esvel', 'tegeed', 'bas', 'and', 'or', 'but', 'also', 'with',
+)
+
+def looks_incomplete(text: str) -> bool:
+    """A fragment that clearly continues in the next message (trailing comma, "...", "ба", ...)"""
+    stripped = text.rstrip()
+    if stripped.endswith(CONTINUATION_ENDINGS):
+        return True
+    words = stripped.lower().split()
+    return bool(words) and words[-1] in CONTINUATION_WORDS
+
+class _PendingTurn:
+    __slots__ = ("texts", "first_at", "last_at")
+
+    def __init__(self, now: float):
+        self.texts: list = []
+        self.first_at = now
+        self.last_at = now
+
+class MessageCoalescer:
+    """Folds a question split over several quick messages on one conversation into a single turn.
+
+    Only fragments that clearly continue (see looks_incomplete) are parked; their requests return
+    at once. Any other message is answered by its own request together with whatever is parked for
+    the conversation. A background thread answers a parked turn once no message has arrived for
+    window_sec (at most max_wait_sec overall), so no request thread waits for the window.
+    """
+
+    def __init__(self, window_sec: float, max_wait_sec: float, flush_workers: int):
+        self.window_sec = window_sec
+        self.max_wait_sec = max_wait_sec
+        self._cond = threading.Condition()
+        self._pending: Dict[int, _PendingTurn] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._pool = ThreadPoolExecutor(max_workers=max(1, flush_workers), thread_name_prefix="coalesce-flush")
+
+    def submit(self, conv_id: int, text: str, incomplete: bool) -> Optional[list]:
+        """Texts of the turn to answer now, None if the text was parked for a later turn"""
+        if self.window_sec <= 0:
+            return [text]
+        now = time.monotonic()
+        with self._cond:
+            turn = self._pending.get(conv_id) or _PendingTurn(now)
+            turn.texts.append(text)
+            turn.last_at = now
+            if not incomplete or self._stopped:
+                self._pending.pop(conv_id, None)
+                return turn.texts
+            self._park(conv_id, turn)
+        return None
+
+    def requeue(self, conv_id: int, texts: list):
+        """Park the texts of a failed turn again so the retry or the next flush answers them"""
+        if not texts or self.window_sec <= 0:
+            return
+        with self._cond:
+            if not self._stopped:
+                turn = self._pending.get(conv_id) or _PendingTurn(time.monotonic())
+                turn.texts[:0] = texts
+                turn.last_at = time.monotonic()
+                self._park(conv_id, turn)
+                return
+        # Shutting down: nothing would flush a parked turn any more, so answer here
+        answer_parked_turn(conv_id, texts)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def stop(self):
+        """Answer every parked turn and wait for the answers; later messages are answered at once"""
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            for conv_id, turn in self._pending.items():
+                self._pool.submit(answer_parked_turn, conv_id, turn.texts)
+            drained = len(self._pending)
+            self._pending.clear()
+            self._cond.notify()
+        self._pool.shutdown(wait=True)
+        if drained:
+            logging.info(f"Answered {drained} parked turns before stopping")
+
+    def _park(self, conv_id: int, turn: _PendingTurn):
+        # Called with self._cond held
+        self._pending[conv_id] = turn
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="coalesce-timer", daemon=True)
+            self._thread.start()
+        self._cond.notify()
+
+    def _due_at(self, turn: _PendingTurn) -> float:
+        return min(turn.last_at + self.window_sec, turn.first_at + self.max_wait_sec)
+
+    def _loop(self):
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                due = [conv_id for conv_id, turn in self._pending.items() if self._due_at(turn) <= now]
+                # Submitted under the lock so stop() never shuts the pool down between pop and submit
+                for conv_id in due:
+                    self._pool.submit(answer_parked_turn, conv_id, self._pending.pop(conv_id).texts)
+                next_at = min((self._due_at(turn) for turn in self._pending.values()), default=None)
+                self._cond.wait(None if next_at is None else next_at - now)
+
+message_coalescer = MessageCoalescer(
+    MESSAGE_COALESCE_WINDOW_SEC, MESSAGE_COALESCE_MAX_WAIT_SEC, MESSAGE_COALESCE_FLUSH_WORKERS)
+
+def is_control_message(text: str, is_email: bool) -> bool:
+    """Email, yes/no and verification-code replies drive the escalation flow and are never merged"""
+    lowered = text.lower()
+    return lowered in CONFIRM_WORDS or lowered in REJECT_WORDS or (len(text) == 6 and text.isdigit()) or is_email
+
+# Runs the independent parts of a webhook (retrieval next to the Chatwoot assignment lookup)
+webhook_pool = ThreadPoolExecutor(max_workers=WEBHOOK_FANOUT_WORKERS, thread_name_prefix="webhook-fanout")
 
 # —— Enhanced Chatwoot Webhook —— #
 @app.route("/webhook/chatwoot", methods=["POST"])
 def chatwoot_webhook():
     """Enhanced webhook with AI integration and assignment checking"""
-    global crawled_data, crawl_status
-    
+    WEBHOOK_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = "error"
+    dedup_key = webhook_dedup_key(request.get_json(silent=True) or {})
+    try:
+        # Chatwoot re-delivers on timeouts; acknowledge repeats without doing any work
+        if dedup_key and not webhook_deduper.claim(dedup_key):
+            status = "duplicate"
+            logging.info(f"Duplicate webhook delivery {dedup_key} acknowledged")
+            return jsonify({"status": "duplicate"}), 200
+        try:
+            with start_trace("chatwoot_webhook") as trace, llm_deadline(LLM_WEBHOOK_BUDGET_SEC):
+                body, code = _handle_chatwoot_webhook()
+                status = (body.get_json(silent=True) or {}).get("status", "ignored")
+                trace.root.attrs["status"] = status
+        except Exception:
+            if dedup_key:
+                webhook_deduper.release(dedup_key)
+            raise
+        if dedup_key and code >= 500:
+            webhook_deduper.release(dedup_key)
+        body.headers["X-Trace-Id"] = trace.trace_id
+        return body, code
+    finally:
+        WEBHOOK_IN_FLIGHT.dec()
+        WEBHOOK_SECONDS.observe(time.perf_counter() - start, status=status)
+
+def record_webhook_payload(data: dict):
+    """Append a raw webhook payload to WEBHOOK_RECORD_PATH for offline replay"""
+    try:
+        with open(WEBHOOK_RECORD_PATH, "a", encoding="utf-8") as f:  # type: ignore
+            f.write(json.dumps({"received_at": time.time(), "payload": data}, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logging.warning(f"Failed to record webhook payload: {e}")
+
+def _handle_chatwoot_webhook():
     data = request.json or {}
+    if WEBHOOK_RECORD_PATH:
+        record_webhook_payload(data)
     
     # Only process incoming messages
     if data.get("message_type") != "incoming":
@@ -615,8 +3453,84 @@ def chatwoot_webhook():
     contact = data.get("conversation", {}).get("contact", {})
     contact_name = contact.get("name", "Хэрэглэгч")
     
+    trace = current_trace()
+    if trace:
+        trace.root.attrs.update({"conversation_id": conv_id, "message_id": data.get("id"), "text_length": len(text)})
     logging.info(f"Received message from {contact_name} in conversation {conv_id}: {text}")
-    
+
+    is_email = "@" in text and is_valid_email(text)
+    if not text or is_control_message(text, is_email):
+        return answer_turn(conv_id, text, is_email)
+
+    # A question split over several quick messages is answered once, by the message that completes it
+    with trace_span("coalesce"):
+        texts = message_coalescer.submit(conv_id, text, looks_incomplete(text))
+    if texts is None:
+        logging.info(f"Message in conversation {conv_id} parked until the turn completes")
+        return jsonify({"status": "coalesced"}), 200
+    try:
+        body, code = answer_turn(conv_id, "\n".join(texts), is_email, len(texts))
+    except Exception:
+        # Chatwoot retries this message; the ones merged into it already got their 200
+        message_coalescer.requeue(conv_id, texts[:-1])
+        raise
+    if code >= 500:
+        message_coalescer.requeue(conv_id, texts[:-1])
+    return body, code
+
+# Parked turns were already acknowledged to Chatwoot, so a failed answer is retried here instead
+PARKED_TURN_ATTEMPTS = 2
+
+def answer_parked_turn(conv_id: int, texts: list):
+    """Answer a parked turn whose window passed without a message completing it"""
+    for attempt in range(1, PARKED_TURN_ATTEMPTS + 1):
+        try:
+            with app.app_context(), start_trace("coalesced_turn") as trace, llm_deadline(LLM_WEBHOOK_BUDGET_SEC):
+                trace.root.attrs.update({"conversation_id": conv_id, "attempt": attempt})
+                body, code = answer_turn(conv_id, "\n".join(texts), False, len(texts))
+                trace.root.attrs["status"] = (body.get_json(silent=True) or {}).get("status", "ignored")
+            if code < 500:
+                return
+            error = f"HTTP {code}"
+        except Exception as e:
+            error = str(e)
+        STAGE_ERRORS.inc(stage="coalesced_turn")
+        logging.error(f"Failed to answer parked turn for conversation {conv_id} (attempt {attempt}): {error}")
+
+def answer_turn(conv_id: int, text: str, is_email: bool, messages: int = 1):
+    """Reply to one turn of a conversation: FAQ, escalation flow or an AI answer"""
+    trace = current_trace()
+    control = not text or is_control_message(text, is_email)
+    if messages > 1:
+        MESSAGES_COALESCED.inc(messages - 1)
+        if trace:
+            trace.root.attrs.update({"coalesced_messages": messages, "text_length": len(text)})
+        logging.info(f"Coalesced turn for conversation {conv_id}: {text}")
+
+    # Popular questions are answered from the precomputed FAQ index without retrieval or the LLM
+    faq_hit = None
+    if not control:
+        with trace_span("faq_lookup"):
+            faq_hit = match_faq(text)
+        if faq_hit and trace:
+            trace.root.attrs.update({"faq_score": faq_hit["score"], "faq_url": faq_hit["url"]})
+
+    # A detailed message from a verified user is forwarded to the support team, not answered
+    history = conversation_memory.get(conv_id, [])
+    verified_email = None
+    for msg in history:
+        if msg.get("role") == "system" and "verified_email:" in msg.get("content", ""):
+            verified_email = msg.get("content").split(":")[1]
+            break
+    forwarding = bool(verified_email) and len(text) > 15
+
+    # Retrieval (CPU) doesn't depend on the assignment lookup (Chatwoot I/O), so run them side by
+    # side; its result is shared by the answer and the escalation check. Only turns that reach the
+    # LLM prompt need it; if forwarding fails the answer path below searches synchronously.
+    retrieval = None
+    if not control and not faq_hit and not forwarding:
+        retrieval = webhook_pool.submit(attach_trace(search_in_crawled_data), text, 3)
+
     # Check if conversation is assigned to an agent via API call
     logging.info(f"Checking conversation assignment for {conv_id}")
     conv_info = get_conversation_info(conv_id)
@@ -663,17 +3577,16 @@ def chatwoot_webhook():
     
     if not should_respond:
         logging.info(f"🚫 Bot will NOT respond to conversation {conv_id} due to assignment")
+        if retrieval:
+            retrieval.cancel()
         return jsonify({"status": "assigned_to_agent"}), 200
     
     logging.info(f"✅ Bot WILL respond to conversation {conv_id}")
     
-    # Get conversation history
-    history = conversation_memory.get(conv_id, [])
-    
     # Check if this is an email address
     logging.info(f"Checking if message contains email: '{text}' (contains @: {'@' in text})")
     
-    if "@" in text and is_valid_email(text.strip()):
+    if is_email:
         logging.info(f"✅ Email detected and validated in conversation {conv_id}: {text.strip()}")
         
         # Store email for confirmation
@@ -705,7 +3618,7 @@ def chatwoot_webhook():
     logging.info(f"Email detection completed for conversation {conv_id}, proceeding with other checks")
     
     # Check if user is confirming email with 'tiim' or 'ugui'
-    if text.lower() in ['tiim', 'тийм', 'yes', 'y']:
+    if text.lower() in CONFIRM_WORDS:
         # Look for pending email
         pending_email = None
         for msg in history:
@@ -737,7 +3650,7 @@ def chatwoot_webhook():
             return jsonify({"status": "success"}), 200
     
     # Check if user is rejecting email with 'ugui'
-    if text.lower() in ['ugui', 'үгүй', 'no', 'n']:
+    if text.lower() in REJECT_WORDS:
         # Remove pending email
         if conv_id in conversation_memory:
             conversation_memory[conv_id] = [msg for msg in conversation_memory[conv_id] 
@@ -802,13 +3715,7 @@ def chatwoot_webhook():
             return jsonify({"status": "success"}), 200
     
     # Check if user has verified email and is describing an issue
-    verified_email = None
-    for msg in history:
-        if msg.get("role") == "system" and "verified_email:" in msg.get("content", ""):
-            verified_email = msg.get("content").split(":")[1]
-            break
-    
-    if verified_email and len(text) > 15:  # User has verified email and writing detailed message
+    if forwarding:  # User has verified email and writing detailed message
         teams_success = send_to_teams(verified_email, text, conv_id)
         planner_success = create_planner_task(verified_email, text, conv_id)
         
@@ -832,11 +3739,18 @@ def chatwoot_webhook():
             send_to_chatwoot(conv_id, response)
             return jsonify({"status": "success"}), 200
     
+    if faq_hit:
+        response = f"{faq_hit['answer']}\n\n📄 {faq_hit['title']}: {faq_hit['url']}"
+        remember_exchange(conv_id, text, response)
+        send_to_chatwoot(conv_id, response)
+        return jsonify({"status": "success", "answered_from": "faq"}), 200
+
+    # One retrieval feeds both the answer and the escalation check
+    search_results = retrieval.result() if retrieval else search_in_crawled_data(text, max_results=3)
+
     # Try to answer with AI first
-    ai_response = get_ai_response(text, conv_id, crawled_data)
-    
-    # Check if AI couldn't find good answer by searching crawled data
-    search_results = search_in_crawled_data(text, max_results=3)
+    with trace_span("get_ai_response"):
+        ai_response = get_ai_response(text, conv_id, search_results=search_results)
     
     # Check if this user was previously escalated but asking a new question
     was_previously_escalated = any(
@@ -845,7 +3759,14 @@ def chatwoot_webhook():
     )
     
     # Let AI evaluate its own response quality and decide if human help is needed
-    needs_human_help = should_escalate_to_human(text, search_results, ai_response, history)
+    if isinstance(ai_response, FallbackAnswer):
+        # The LLM is unavailable; hand over only when the docs had nothing either
+        needs_human_help = not search_results
+        if trace:
+            trace.root.attrs["answered_from"] = "fallback"
+    else:
+        with trace_span("should_escalate_to_human"):
+            needs_human_help = should_escalate_to_human(text, search_results, ai_response, history)
     
     # If user was previously escalated but AI can answer this new question, respond with AI
     if was_previously_escalated and not needs_human_help:
@@ -876,12 +3797,36 @@ def chatwoot_webhook():
     return jsonify({"status": "success"}), 200
 
 
+ESCALATION_SYSTEM_PROMPT = """Та өөрийн өгсөн хариултыг үнэлж, хэрэглэгчид хангалттай эсэхийг шийднэ.
+
+Дараах тохиолдлуудад л хүний ажилтны тусламж шаардлагатай:
+- Хэрэглэгч техникийн алдаа, тохиргооны асуудлаар тусламж хүсэж байгаа
+- Акаунт, төлбөр, хостинг, домэйн зэрэг Cloud.mn-ийн үйлчилгээтэй холбоотой асуудал
+- Тусгай хүсэлт, гомдол, шуурхай тусламж хэрэгтэй асуудал
+- Хэрэглэгч өөрөө "ажилтныг хүсэж байна" гэж тодорхой хэлсэн тохиолдол
+- Миний хариулт нь хэрэглэгчийн асуултын үндсэн сэдвээс огт холдсон бол
+
+Дараах тохиолдлуудад хүний тусламж ШААРДЛАГАГҮЙ:
+- Энгийн мэдээлэл асуух (Cloud.mn docs-ийн тухай)
+- Ерөнхий зөвлөгөө авах
+- Техникийн мэдлэг судлах
+- Би хангалттай хариулт өгч чадсан тохиолдол
+- Хэрэглэгч зүгээр л мэдээлэл хайж байгаа
+
+Өөрийнхөө хариултанд итгэлтэй байж, хэрэглэгч дахин асууж болно гэдгийг санаарай.
+
+Хариултаа зөвхөн 'YES' (хүний тусламж хэрэгтэй) эсвэл 'NO' (миний хариулт хангалттай) гэж өгнө үү."""
+
 def should_escalate_to_human(user_message: str, search_results: list, ai_response: str, history: list) -> bool:
     """AI evaluates its own response and decides if human help is needed"""
     
     # Use AI to evaluate its own response quality
-    if not client:
-        # Fallback without AI evaluation - be more lenient
+    client = get_openai_client()
+    left = llm_time_left()
+    if not client or (left is not None and left < LLM_MIN_CALL_SEC):
+        # No AI evaluation (no key, or the answer used up the webhook's LLM budget) - be more lenient
+        if client:
+            LLM_CALLS.inc(call="escalation", result="deadline")
         return len(user_message) > 50 and (not search_results or len(search_results) == 0)
     
     # Build context for AI self-evaluation
@@ -900,30 +3845,13 @@ def should_escalate_to_human(user_message: str, search_results: list, ai_respons
             context += "\n" + "\n".join(recent_messages)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
+        response = call_llm(
+            "escalation",
+            model=OPENAI_MODEL,
             messages=[
                 {
                     "role": "system",
-                    "content": """Та өөрийн өгсөн хариултыг үнэлж, хэрэглэгчид хангалттай эсэхийг шийднэ.
-
-Дараах тохиолдлуудад л хүний ажилтны тусламж шаардлагатай:
-- Хэрэглэгч техникийн алдаа, тохиргооны асуудлаар тусламж хүсэж байгаа
-- Акаунт, төлбөр, хостинг, домэйн зэрэг Cloud.mn-ийн үйлчилгээтэй холбоотой асуудал
-- Тусгай хүсэлт, гомдол, шуурхай тусламж хэрэгтэй асуудал
-- Хэрэглэгч өөрөө "ажилтныг хүсэж байна" гэж тодорхой хэлсэн тохиолдол
-- Миний хариулт нь хэрэглэгчийн асуултын үндсэн сэдвээс огт холдсон бол
-
-Дараах тохиолдлуудад хүний тусламж ШААРДЛАГАГҮЙ:
-- Энгийн мэдээлэл асуух (Cloud.mn docs-ийн тухай)
-- Ерөнхий зөвлөгөө авах
-- Техникийн мэдлэг судлах
-- Би хангалттай хариулт өгч чадсан тохиолдол
-- Хэрэглэгч зүгээр л мэдээлэл хайж байгаа
-
-Өөрийнхөө хариултанд итгэлтэй байж, хэрэглэгч дахин асууж болно гэдгийг санаарай.
-
-Хариултаа зөвхөн 'YES' (хүний тусламж хэрэгтэй) эсвэл 'NO' (миний хариулт хангалттай) гэж өгнө үү."""
+                    "content": ESCALATION_SYSTEM_PROMPT
                 },
                 {
                     "role": "user", 
@@ -938,7 +3866,7 @@ def should_escalate_to_human(user_message: str, search_results: list, ai_respons
         logging.info(f"AI self-evaluation for '{user_message[:30]}...': {ai_decision}")
         return ai_decision == "YES"
         
-    except Exception as e:
+    except LLMUnavailable as e:
         logging.error(f"AI self-evaluation error: {e}")
         # More lenient fallback - don't escalate by default
         return False
@@ -950,46 +3878,20 @@ def get_crawl_status():
     """Get current crawl status"""
     return jsonify({
         "crawl_status": crawl_status,
-        "crawled_pages": len(crawled_data),
+        "crawled_pages": len(get_corpus()),
+        "corpus_memory": get_corpus().memory_report(),
+        "sources": {name: shard.info() for name, shard in corpus_shards.items()},
         "config": {
-            "root_url": ROOT_URL,
+            "root_url": PRIMARY_SOURCE.root_url,
             "auto_crawl_enabled": AUTO_CRAWL_ON_START,
-            "max_pages": MAX_CRAWL_PAGES
+            "max_pages": PRIMARY_SOURCE.max_pages
         }
     })
 
 @app.route("/api/force-crawl", methods=["POST"])
 def force_crawl():
-    """Force start a new crawl"""
-    global crawled_data, crawl_status
-    
-    # Check if already running
-    if crawl_status["status"] == "running":
-        return jsonify({"error": "Crawl is already running"}), 409
-    
-    try:
-        crawl_status = {"status": "running", "message": "Force crawl started via API"}
-        crawled_data = crawl_and_scrape(ROOT_URL)
-        
-        if crawled_data:
-            crawl_status = {
-                "status": "completed",
-                "message": f"Force crawl completed via API",
-                "pages_count": len(crawled_data),
-                "timestamp": datetime.now().isoformat()
-            }
-            return jsonify({
-                "status": "success",
-                "pages_crawled": len(crawled_data),
-                "crawl_status": crawl_status
-            })
-        else:
-            crawl_status = {"status": "failed", "message": "Force crawl failed - no pages found"}
-            return jsonify({"error": "No pages were crawled"}), 500
-            
-    except Exception as e:
-        crawl_status = {"status": "error", "message": f"Force crawl error: {str(e)}"}
-        return jsonify({"error": f"Crawl failed: {e}"}), 500
+    """Force start a new crawl in the background"""
+    return _start_crawl_response("index")
 
 @app.route("/api/search", methods=["POST"])
 def api_search():
@@ -997,17 +3899,25 @@ def api_search():
     data = request.get_json(force=True)
     query = data.get("query", "").strip()
     max_results = data.get("max_results", 5)
+    sources = data.get("sources")
     
     if not query:
         return jsonify({"error": "Missing 'query' in request body"}), 400
+    if sources is not None and not isinstance(sources, list):
+        return jsonify({"error": "'sources' must be a list of source names"}), 400
+    if sources is not None:
+        unknown = [name for name in sources if name not in corpus_shards]
+        if unknown:
+            return unknown_source_response(KeyError(unknown[0]))
     
     if crawl_status["status"] == "running":
         return jsonify({"error": "Crawl is currently running, please wait"}), 409
     
-    if not crawled_data:
+    if not get_corpus():
         return jsonify({"error": "No crawled data available. Run crawl first."}), 404
     
-    results = search_in_crawled_data(query, max_results)
+    results = search_in_crawled_data(query, max_results, sources)
+    results = [{key: result[key] for key in SEARCH_RESULT_FIELDS} for result in results]
     return jsonify({
         "query": query,
         "results_count": len(results),
@@ -1030,14 +3940,82 @@ def clear_conversation_memory(conv_id):
 
 @app.route("/api/crawled-data", methods=["GET"])
 def get_crawled_data():
-    """Get current crawled data"""
-    page_limit = request.args.get('limit', 10, type=int)
+    """Page through the serving corpus (or one ?source=) with ?cursor=&limit=&fields=, or stream it with ?format=ndjson"""
+    try:
+        corpus = get_corpus(requested_source())
+    except KeyError as e:
+        return unknown_source_response(e)
+    try:
+        fields = parse_export_fields(request.args.get("fields"))
+        cursor = parse_corpus_cursor(request.args.get("cursor"), corpus)
+    except ExportError as e:
+        return jsonify({"error": str(e), "generation": corpus.generation}), e.status
+    if wants_ndjson():
+        return ndjson_response(corpus.export_records(fields, cursor), {
+            "X-Total-Count": str(len(corpus)),
+            "X-Corpus-Generation": str(corpus.generation)
+        })
+    page_limit = export_limit(10)
+    data = list(corpus.export_records(fields, cursor, cursor + page_limit))
     return jsonify({
-        "total_pages": len(crawled_data), 
+        "total_pages": len(corpus), 
         "crawl_status": crawl_status,
-        "data": crawled_data[:page_limit]
+        "generation": corpus.generation,
+        "cursor": request.args.get("cursor"),
+        "next_cursor": corpus_cursor(corpus, cursor + len(data)),
+        "data": data
+    })
+
+@app.route("/api/corpus/generations", methods=["GET"])
+def list_corpus_generations():
+    """Serving corpus generation of a source (?source=, the primary one by default) and the ones kept for rollback"""
+    try:
+        shard = get_shard(requested_source())
+    except KeyError as e:
+        return unknown_source_response(e)
+    return jsonify({
+        "source": shard.name,
+        "current": corpus_info(shard.get()),
+        "previous": [corpus_info(c) for c in reversed(shard.history)],
+        "keep": CORPUS_KEEP_GENERATIONS
     })
 
+@app.route("/api/corpus/rollback", methods=["POST"])
+def api_rollback_corpus():
+    """Serve a previous corpus generation again"""
+    data = request.get_json(silent=True) or {}
+    try:
+        shard = get_shard(requested_source())
+    except KeyError as e:
+        return unknown_source_response(e)
+    try:
+        corpus = shard.rollback(data.get("generation"))
+    except KeyError:
+        return jsonify({"error": "Generation is not available for rollback"}), 404
+    schedule_faq_build(get_corpus())
+    return jsonify({"status": "rolled_back", "source": shard.name, "current": corpus_info(corpus)})
+
+@app.route("/api/faq", methods=["GET"])
+def get_faq():
+    """FAQ index stats; ?q= shows what a question would match"""
+    index = get_faq_index()
+    result = {"enabled": FAQ_ENABLED, "status": faq_status, "index": index.info(), "threshold": FAQ_MATCH_THRESHOLD}
+    query = request.args.get("q", "").strip()
+    if query:
+        result["match"] = index.match(query, 0.0)
+    return jsonify(result)
+
+@app.route("/api/faq/rebuild", methods=["POST"])
+def rebuild_faq():
+    """Regenerate FAQ entries for pages that changed since the last build"""
+    corpus = get_corpus()
+    if not FAQ_ENABLED or not OPENAI_API_KEY:
+        return jsonify({"error": "FAQ index is disabled or OpenAI is not configured"}), 400
+    if not len(corpus):
+        return jsonify({"error": "No crawled data available"}), 400
+    schedule_faq_build(corpus)
+    return jsonify({"status": "scheduled", "generation": corpus.generation}), 202
+
 @app.route("/api/planner/create-task", methods=["POST"])
 def api_create_planner_task():
     """Manual-аар Microsoft Planner-д task үүсгэх API"""
@@ -1067,22 +4045,381 @@ def api_create_planner_task():
             "message": "Microsoft Planner-д task үүсгэх амжилтгүй боллоо"
         }), 500
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text exposition of the bot's metrics"""
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/traces/slowest", methods=["GET"])
+def get_slowest_traces():
+    """Slowest recent webhook traces from the in-memory ring buffer"""
+    limit = request.args.get("limit", 10, type=int)
+    traces = trace_exporter.slowest(limit)
+    return jsonify({"count": len(traces), "traces": traces})
+
+@app.route("/api/traces/<trace_id>", methods=["GET"])
+def get_trace(trace_id):
+    """Fetch a single recent trace by ID"""
+    trace = trace_exporter.get(trace_id)
+    if not trace:
+        return jsonify({"error": "Trace not found"}), 404
+    return jsonify(trace)
+
+# —— Admin Diagnostics —— #
+# Only the worker that serves the request is profiled; repeat the call to sample other workers.
+def require_admin(view):
+    """Allow the request only with ADMIN_API_TOKEN as a Bearer or X-Admin-Token header"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_API_TOKEN:
+            return jsonify({"error": "Admin API is disabled; set ADMIN_API_TOKEN"}), 404
+        auth = request.headers.get("Authorization", "")
+        supplied = auth[7:].strip() if auth.startswith("Bearer ") else request.headers.get("X-Admin-Token", "")
+        if not hmac.compare_digest(supplied.encode("utf-8"), ADMIN_API_TOKEN.encode("utf-8")):
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+# A thread is idle when it used less than this share of the interval since its previous sample
+IDLE_CPU_RATIO = 0.1
+# Fallback without per-thread CPU times: (file, function) of known blocking call sites. Waits in C
+# (time.sleep, flock, socket reads) show their Python caller as the leaf, so only sites whose
+# Python frame is the wait itself are listed.
+IDLE_FRAMES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+    ("selectors.py", "select"), ("socket.py", "accept"), ("socket.py", "readinto"),
+    ("ssl.py", "read"), ("ssl.py", "recv_into"), ("thread.py", "_worker"),
+}
+_profile_lock = threading.Lock()
+
+def _thread_cpu_ns(native_id: Optional[int]) -> Optional[int]:
+    """CPU time a thread of this process has run for, from /proc (Linux only)"""
+    if native_id is None:
+        return None
+    try:
+        with open(f"/proc/self/task/{native_id}/schedstat", encoding="ascii") as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _is_idle_frame(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def sample_stacks(seconds: float, hz: float, include_idle: bool = False) -> Dict[str, int]:
+    """Sample every thread's Python stack at hz for seconds; returns collapsed stack -> samples"""
+    me = threading.get_ident()
+    interval = 1.0 / hz
+    counts: Dict[str, int] = {}
+    deadline = time.perf_counter() + seconds
+    # Baseline CPU times so idleness is known from the first sample on
+    last_cpu: Dict[int, int] = {}
+    for t in threading.enumerate():
+        cpu = _thread_cpu_ns(t.native_id)
+        if t.ident is not None and cpu is not None:
+            last_cpu[t.ident] = cpu
+    last_at = time.perf_counter_ns()
+    time.sleep(interval)
+    while time.perf_counter() < deadline:
+        threads = {t.ident: t for t in threading.enumerate()}
+        now = time.perf_counter_ns()
+        elapsed, last_at = now - last_at, now
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            thread_obj = threads.get(ident)
+            cpu = _thread_cpu_ns(getattr(thread_obj, "native_id", None))
+            previous = last_cpu.get(ident)
+            if cpu is not None:
+                last_cpu[ident] = cpu
+            if not include_idle:
+                if cpu is not None and previous is not None:
+                    idle = cpu - previous < elapsed * IDLE_CPU_RATIO
+                else:
+                    idle = _is_idle_frame(frame)
+                if idle:
+                    continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            # Pool threads carry counters in their names; fold them so one pool is one root
+            thread = re.sub(r"\d+", "N", thread_obj.name if thread_obj else "thread")
+            key = ";".join([thread] + stack[::-1])
+            counts[key] = counts.get(key, 0) + 1
+        time.sleep(interval)
+    return counts
+
+@app.route("/api/admin/profile", methods=["GET"])
+@require_admin
+def admin_profile():
+    """Time-boxed sampling profile of this worker in collapsed-stack (flamegraph) or JSON form"""
+    seconds = min(max(request.args.get("seconds", 5.0, type=float), 0.1), PROFILE_MAX_SECONDS)
+    hz = min(max(request.args.get("hz", 100.0, type=float), 1.0), 1000.0)
+    include_idle = request.args.get("idle", "false").lower() == "true"
+    if not _profile_lock.acquire(blocking=False):
+        return jsonify({"error": "A profile is already running in this worker"}), 409
+    try:
+        counts = sample_stacks(seconds, hz, include_idle)
+    finally:
+        _profile_lock.release()
+
+    if request.args.get("format", "collapsed") == "json":
+        own: Dict[str, int] = {}
+        for stack, n in counts.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            own[leaf] = own.get(leaf, 0) + n
+        total = sum(counts.values())
+        return jsonify({
+            "pid": os.getpid(),
+            "seconds": seconds,
+            "hz": hz,
+            "samples": total,
+            "top_self": [{"frame": f, "samples": n, "ratio": round(n / total, 4)}
+                         for f, n in sorted(own.items(), key=lambda kv: -kv[1])[:30]],
+            "stacks": counts
+        })
+    # Brendan Gregg's folded format: feed to flamegraph.pl or speedscope
+    body = "".join(f"{stack} {n}\n" for stack, n in sorted(counts.items(), key=lambda kv: -kv[1]))
+    return app.response_class(body, mimetype="text/plain", headers={"X-Profile-Pid": str(os.getpid())})
+
+# tracemalloc snapshots are kept per worker so later diffs can reference them
+_memory_snapshots: OrderedDict = OrderedDict()
+_MEMORY_SNAPSHOT_LIMIT = 5
+
+def _process_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _conversation_memory_bytes() -> int:
+    size = sys.getsizeof(conversation_memory)
+    for messages in list(conversation_memory.values()):
+        size += sys.getsizeof(messages) + sum(
+            sys.getsizeof(m) + sum(sys.getsizeof(v) for v in m.values()) for m in list(messages))
+    return size
+
+def _filtered_snapshot():
+    import tracemalloc
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+
+def _stat_dict(stat) -> dict:
+    frame = stat.traceback[0]
+    data = {"location": f"{frame.filename}:{frame.lineno}", "size_bytes": stat.size, "count": stat.count}
+    if hasattr(stat, "size_diff"):
+        data.update(size_diff_bytes=stat.size_diff, count_diff=stat.count_diff)
+    return data
+
+@app.route("/api/admin/memory", methods=["GET"])
+@require_admin
+def admin_memory():
+    """RSS, the bot's own in-memory structures and tracemalloc status for this worker"""
+    import gc
+    import tracemalloc
+    traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+    return jsonify({
+        "pid": os.getpid(),
+        "rss_bytes": _process_rss_bytes(),
+        "gc_counts": gc.get_count(),
+        "conversation_memory": {"conversations": len(conversation_memory), "bytes": _conversation_memory_bytes()},
+        "corpus": get_corpus().memory_report(),
+        "corpus_generations_kept": sum(len(shard.history) for shard in corpus_shards.values()),
+        "tracemalloc": {
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else None,
+            "traced_bytes": traced[0] if traced else None,
+            "peak_bytes": traced[1] if traced else None,
+            "snapshots": list(_memory_snapshots)
+        }
+    })
+
+@app.route("/api/admin/memory/tracing", methods=["POST", "DELETE"])
+@require_admin
+def admin_memory_tracing():
+    """Start (POST) or stop (DELETE) tracemalloc in this worker"""
+    import tracemalloc
+    if request.method == "DELETE":
+        tracemalloc.stop()
+        _memory_snapshots.clear()
+        return jsonify({"tracing": False, "pid": os.getpid()})
+    frames = request.args.get("frames", TRACEMALLOC_FRAMES, type=int)
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, min(frames, 25)))
+    return jsonify({"tracing": True, "frames": tracemalloc.get_traceback_limit(), "pid": os.getpid()})
+
+@app.route("/api/admin/memory/snapshot", methods=["POST"])
+@require_admin
+def admin_memory_snapshot():
+    """Take a tracemalloc snapshot; with ?base=<id> also diff it against an earlier one"""
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        return jsonify({"error": "tracemalloc is not running; POST /api/admin/memory/tracing first"}), 409
+    group_by = request.args.get("group_by", "lineno")
+    if group_by not in ("lineno", "filename", "traceback"):
+        return jsonify({"error": "group_by must be lineno, filename or traceback"}), 400
+    limit = request.args.get("limit", 25, type=int)
+    base_id = request.args.get("base")
+    if base_id and base_id not in _memory_snapshots:
+        return jsonify({"error": f"Snapshot {base_id} not found", "snapshots": list(_memory_snapshots)}), 404
+
+    snapshot = _filtered_snapshot()
+    snapshot_id = uuid.uuid4().hex[:8]
+    _memory_snapshots[snapshot_id] = snapshot
+    while len(_memory_snapshots) > _MEMORY_SNAPSHOT_LIMIT:
+        _memory_snapshots.popitem(last=False)
+
+    stats = snapshot.compare_to(_memory_snapshots[base_id], group_by) if base_id else snapshot.statistics(group_by)
+    return jsonify({
+        "snapshot_id": snapshot_id,
+        "base": base_id,
+        "pid": os.getpid(),
+        "traced_bytes": sum(stat.size for stat in snapshot.statistics("filename")),
+        "top": [_stat_dict(stat) for stat in stats[:limit]]
+    })
+
+# —— Liveness / Readiness —— #
+class DependencyMonitor:
+    """Runs dependency checks on a background schedule and serves the cached results"""
+
+    def __init__(self, interval: float, checks: Dict[str, Callable[[], dict]]):
+        self.interval = interval
+        self.checks = checks
+        self._results: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_checks(self):
+        for name, check in self.checks.items():
+            started = time.perf_counter()
+            try:
+                result = check()
+            except Exception as e:
+                result = {"status": "error", "message": str(e)[:200]}
+            entry = {
+                "result": result,
+                "checked_at": time.time(),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+            with self._lock:
+                self._results[name] = entry
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_checks()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="dependency-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self) -> Dict[str, dict]:
+        now = time.time()
+        with self._lock:
+            results = dict(self._results)
+        snapshot = {}
+        for name in self.checks:
+            entry = results.get(name)
+            if entry is None:
+                snapshot[name] = {"status": "pending", "message": "Not checked yet"}
+                continue
+            snapshot[name] = dict(entry["result"],
+                                  checked_at=datetime.fromtimestamp(entry["checked_at"]).isoformat(),
+                                  age_seconds=round(now - entry["checked_at"], 1),
+                                  duration_ms=entry["duration_ms"])
+        return snapshot
+
+def test_openai_api():
+    """Test OpenAI API connectivity"""
+    client = get_openai_client()
+    if not client:
+        return {"status": "error", "message": "OpenAI API key not configured"}
+    client.with_options(timeout=10, max_retries=0).models.list()
+    return {"status": "success"}
+
+dependency_monitor = DependencyMonitor(DEPENDENCY_CHECK_INTERVAL_SEC, {
+    "chatwoot": lambda: test_chatwoot_api(),
+    "openai": lambda: test_openai_api()
+})
+
+def llm_gateway_state() -> dict:
+    openai_check = dependency_monitor.snapshot()["openai"]
+    return {
+        "configured": bool(OPENAI_API_KEY),
+        "last_check": openai_check,
+        "breaker": llm_breaker.snapshot(),
+        "faq_breaker": faq_llm_breaker.snapshot(),
+        "latency_slo_sec": LLM_LATENCY_SLO_SEC,
+        "timeout_sec": LLM_TIMEOUT_SEC,
+        "webhook_budget_sec": LLM_WEBHOOK_BUDGET_SEC
+    }
+
+@app.route("/livez", methods=["GET"])
+def liveness():
+    """Liveness probe: the process is up and serving requests, nothing else is checked"""
+    return jsonify({"status": "alive"})
+
+@app.route("/readyz", methods=["GET"])
+def readiness():
+    """Readiness probe from in-memory state only"""
+    in_flight = int(WEBHOOK_IN_FLIGHT.get())
+    corpus = get_corpus()
+    # Crawl state comes from the lock files so every worker reports the same crawl
+    primary_status = "running" if crawl_lock.held() else crawl_status.get("status")
+    index_loaded = len(corpus) > 0
+    reasons = []
+    if READY_REQUIRES_INDEX and AUTO_CRAWL_ON_START and not index_loaded:
+        reasons.append("index_not_loaded")
+    if READY_MAX_IN_FLIGHT and in_flight >= READY_MAX_IN_FLIGHT:
+        reasons.append("too_many_in_flight")
+
+    ready = not reasons
+    return jsonify({
+        "status": "ready" if ready else "not_ready",
+        "reasons": reasons,
+        "index": {"loaded": index_loaded, "pages": len(corpus), "crawl_status": primary_status},
+        "queue": {"webhooks_in_flight": in_flight, "crawl_running": CRAWL_RUNNING.get() > 0},
+        "llm_gateway": llm_gateway_state()
+    }), 200 if ready else 503
+
 @app.route("/health", methods=["GET"])
 def health_check():
-    """Health check endpoint"""
-    chatwoot_test = test_chatwoot_api()
+    """Health check endpoint (dependency results come from the background monitor)"""
+    dependencies = dependency_monitor.snapshot()
+    chatwoot_test = dependencies["chatwoot"]
     
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "crawl_status": crawl_status,
-        "crawled_pages": len(crawled_data),
+        "crawled_pages": len(get_corpus()),
+        "sources": {name: len(shard.get()) for name, shard in corpus_shards.items()},
         "active_conversations": len(conversation_memory),
         "chatwoot_api_test": chatwoot_test,
+        "dependencies": dependencies,
         "config": {
             "root_url": ROOT_URL,
             "auto_crawl_enabled": AUTO_CRAWL_ON_START,
-            "openai_configured": client is not None,
+            "openai_configured": bool(OPENAI_API_KEY),
             "chatwoot_configured": bool(CHATWOOT_API_KEY and ACCOUNT_ID),
             "chatwoot_account_id": ACCOUNT_ID,
             "teams_configured": bool(TEAMS_WEBHOOK_URL),
@@ -1098,8 +4435,6 @@ def health_check():
     })
 
 
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000, debug=True)
 # —— Email Verification Functions —— #
 def is_valid_email(email: str) -> bool:
     """Check if email format is valid"""
@@ -1138,6 +4473,10 @@ def send_verification_email(email: str) -> Optional[str]:
         logging.error("SMTP credentials not configured")
         return None
         
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    import smtplib
+
     # Generate verification code
     verification_code = ''.join([str(random.randint(0, 9)) for _ in range(6)])
     
@@ -1161,11 +4500,13 @@ Cloud.mn тусламжийн үйлчилгээ"""
     msg.attach(MIMEText(body, 'plain'))
     
     try:
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(SMTP_USERNAME or "", SMTP_PASSWORD or "")
-        server.send_message(msg)
-        server.quit()
+        with timed_stage("smtp"):
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+            if SMTP_STARTTLS:
+                server.starttls()
+            server.login(SMTP_USERNAME or "", SMTP_PASSWORD or "")
+            server.send_message(msg)
+            server.quit()
         logging.info(f"Verification email sent to {email}")
         return verification_code
     except Exception as e:
@@ -1177,6 +4518,10 @@ def send_confirmation_email(email: str, problem: str) -> bool:
     if not SMTP_FROM_EMAIL or not SMTP_PASSWORD or not SMTP_SERVER:
         logging.error("SMTP credentials not configured")
         return False
+
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    import smtplib
         
     # Create email
     msg = MIMEMultipart()
@@ -1196,11 +4541,13 @@ Cloud.mn тусламжийн үйлчилгээ"""
     msg.attach(MIMEText(body, 'plain'))
     
     try:
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(SMTP_USERNAME or "", SMTP_PASSWORD or "")
-        server.send_message(msg)
-        server.quit()
+        with timed_stage("smtp"):
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+            if SMTP_STARTTLS:
+                server.starttls()
+            server.login(SMTP_USERNAME or "", SMTP_PASSWORD or "")
+            server.send_message(msg)
+            server.quit()
         logging.info(f"Confirmation email sent to {email}")
         return True
     except Exception as e:
@@ -1233,3 +4580,56 @@ def test_chatwoot_api():
             }
     except Exception as e:
         return {"status": "error", "message": f"Connection failed: {str(e)}"}
+
+# —— Application Lifecycle —— #
+# Importing main only defines things. Threads (dependency checks, the startup crawl) are started by
+# startup(), which gunicorn.conf.py calls in each worker after fork; threads started in a preloading
+# master would not survive the fork.
+_lifecycle_lock = threading.Lock()
+_started = False
+
+def startup():
+    """Start this process's background subsystems; safe to call more than once"""
+    global _started
+    with _lifecycle_lock:
+        if _started:
+            return
+        _started = True
+    # Dependency checks run off the request path so probes never wait on Chatwoot/OpenAI
+    dependency_monitor.start()
+    if planner_configured():
+        planner_tokens.start()
+    auto_crawl_on_startup()
+    crawl_scheduler.start()
+    atexit.register(shutdown)
+    logging.info(f"Application started in process {os.getpid()}")
+
+def shutdown():
+    """Stop background work so a worker exits promptly"""
+    global _started
+    with _lifecycle_lock:
+        if not _started:
+            return
+        _started = False
+    # Parked messages were already acknowledged; answer them while the pools they use still run
+    message_coalescer.stop()
+    dependency_monitor.stop()
+    planner_tokens.stop()
+    crawl_scheduler.stop()
+    for job in list(crawl_jobs.values()):
+        if job.status in ("queued", "running"):
+            job.cancel_requested.set()
+    webhook_pool.shutdown(wait=False, cancel_futures=True)
+    faq_pool.shutdown(wait=False, cancel_futures=True)
+    search_pool.shutdown(wait=False, cancel_futures=True)
+    logging.info(f"Application stopped in process {os.getpid()}")
+
+@app.before_request
+def _ensure_started():
+    # Servers without the gunicorn hooks (flask run, other WSGI hosts) start on the first request
+    if not _started:
+        startup()
+
+if __name__ == "__main__":
+    startup()
+    app.run(host="0.0.0.0", port=8000, debug=True)